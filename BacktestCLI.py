@@ -0,0 +1,215 @@
+import time
+
+_started = time.perf_counter()
+
+import sys
+import argparse
+
+# Command-line entry point for backtests, parameter sweeps and data downloads:
+#
+#   python BacktestCLI.py fetch --symbols HK.00700 HK.00388 --start 2019-10-16 --end 2024-10-16 --ktype K_60M
+#   python BacktestCLI.py backtest --symbols-file hk.txt --offline --param slow_length=26 --store-dir results
+#   python BacktestCLI.py sweep --symbols-file hk.txt --offline --grid slow_length=26,34 --grid sd_multiplier=1.5,2
+#
+# Only argparse is imported up front. Each command imports the modules it needs when it runs;
+# futu is only loaded when bars are missing from the K-line cache and matplotlib only with
+# --plot. --timing prints where a run's time went, startup (interpreter to parsed arguments
+# and module imports) included, to keep scripted batch jobs that launch many short runs fast.
+
+
+def parse_value(text):
+    # '26' -> 26, '1.5' -> 1.5, anything else stays a string
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_assignments(items, multiple=False):
+    # ['slow_length=26', ...] -> {'slow_length': 26}; with multiple=True 'a=1,2' -> {'a': [1, 2]}
+    from TradingStrategy import STRATEGY_PARAMS
+    values = {}
+    for item in items or []:
+        name, separator, text = item.partition('=')
+        if not separator or name not in STRATEGY_PARAMS:
+            raise SystemExit(f"Invalid strategy parameter '{item}'; expected NAME=VALUE with NAME one of {', '.join(STRATEGY_PARAMS)}")
+        values[name] = [parse_value(part) for part in text.split(',')] if multiple else parse_value(text)
+    return values
+
+
+def check_sort_column(name, param_sets, store_dir):
+    # The sweep's result columns are the parameters given plus the PerformanceStats fields, and run_id when stored
+    from dataclasses import fields
+    from FutuBackTest import PerformanceStats
+    columns = list(dict.fromkeys(key for params in param_sets for key in params))
+    columns += [field.name for field in fields(PerformanceStats)] + (['run_id'] if store_dir else [])
+    if name not in columns:
+        raise SystemExit(f"Invalid --sort column '{name}'; expected one of {', '.join(columns)}")
+
+
+def read_symbols(args):
+    symbols = list(args.symbols or [])
+    if args.symbols_file:
+        with open(args.symbols_file) as f:
+            symbols.extend(line.split('#')[0].strip() for line in f)
+    symbols = list(dict.fromkeys(symbol for symbol in symbols if symbol))
+    if not symbols:
+        raise SystemExit("No symbols given (use --symbols or --symbols-file)")
+    return symbols
+
+
+class Timer:
+    # Wall time per phase, printed with --timing
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = [('startup', time.perf_counter() - _started)]
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        if self.enabled:
+            total = time.perf_counter() - _started
+            print(' '.join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.phases) + f" total={total * 1000:.0f}ms",
+                  file=sys.stderr)
+
+
+def load_frames(args, symbols):
+    # {symbol: DataFrame} from the K-line cache, downloading missing ranges unless --offline
+    from KlineCache import KlineCache
+    cache = KlineCache(args.cache_dir)
+    if args.base_ktype:
+        from Resampling import fetch_futu_data_resampled_bulk
+        frames = fetch_futu_data_resampled_bulk(symbols, args.start, args.end, [args.ktype], args.base_ktype,
+                                                cache=cache, offline=args.offline)[args.ktype]
+    else:
+        from FutuFetchingData import fetch_futu_data_bulk
+        frames = fetch_futu_data_bulk(symbols, args.start, args.end, args.ktype, cache=cache, offline=args.offline)
+    missing = [symbol for symbol, frame in frames.items() if frame is None]
+    if missing:
+        print(f"No {args.ktype} bars for: {', '.join(missing)}", file=sys.stderr)
+    return {symbol: frame for symbol, frame in frames.items() if frame is not None}
+
+
+def load_panel(args, timer):
+    symbols = read_symbols(args)
+    from PricePanel import PricePanel
+    timer.lap('imports')
+    frames = load_frames(args, symbols)
+    if not frames:
+        raise SystemExit("No data for any symbol")
+    panel = PricePanel.from_frames(frames)
+    timer.lap('data')
+    return panel
+
+
+def run_fetch(args):
+    timer = Timer(args.timing)
+    symbols = read_symbols(args)
+    timer.lap('imports')
+    frames = load_frames(args, symbols)
+    timer.lap('fetch')
+    for symbol in symbols:
+        frame = frames.get(symbol)
+        print(f"{symbol}: {0 if frame is None else len(frame)} bars")
+    timer.report()
+    return 0 if len(frames) == len(symbols) else 1
+
+
+def run_backtest_command(args):
+    timer = Timer(args.timing)
+    params = parse_assignments(args.param)
+    from FutuBackTest import run_backtest, plot_balance
+    panel = load_panel(args, timer)
+
+    portfolio = run_backtest(panel, args.mode, params)
+    timer.lap('backtest')
+    if args.quiet:
+        performance = portfolio.get_performance()
+        print(f"final_return={performance.final_return:.2f}% trades={performance.total_trades} "
+              f"sharpe={performance.sharpe:.2f} max_drawdown={performance.max_drawdown:.2f}%")
+    else:
+        portfolio.get_statistics()
+    if args.store_dir:
+        from ResultStore import ResultStore
+        run_id = ResultStore(args.store_dir).save(portfolio, params, panel, mode=args.mode, label=args.label)
+        print(f"Saved as run {run_id} in {args.store_dir}")
+    timer.lap('report')
+    timer.report()
+    if args.plot:
+        plot_balance(portfolio.balance_history)
+    return 0
+
+
+def run_sweep_command(args):
+    timer = Timer(args.timing)
+    grid = parse_assignments(args.grid, multiple=True)
+    fixed = parse_assignments(args.param)
+    from ParameterSweep import run_sweep, grid_search_params
+    param_sets = [{**fixed, **params} for params in grid_search_params(grid)] if grid else [fixed]
+    check_sort_column(args.sort, param_sets, args.store_dir)
+    panel = load_panel(args, timer)
+
+    results = run_sweep(panel, param_sets, args.mode, args.workers, cache_dir=args.indicator_cache, store_dir=args.store_dir)
+    timer.lap('sweep')
+    results = results.sort_values(args.sort, ascending=False)
+    print(results.head(args.top).to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    timer.report()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Backtest the MACD/ATR strategy on Futu K-lines.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    data = argparse.ArgumentParser(add_help=False)
+    data.add_argument('--symbols', nargs='+', help="Futu codes, e.g. HK.00700 HK.00388")
+    data.add_argument('--symbols-file', help="File with one Futu code per line ('#' starts a comment)")
+    data.add_argument('--start', default='2019-10-16', help="First day, YYYY-MM-DD")
+    data.add_argument('--end', default='2024-10-16', help="Last day, YYYY-MM-DD")
+    data.add_argument('--ktype', default='K_60M', help="K-line type, e.g. K_30M, K_60M, K_DAY")
+    data.add_argument('--base-ktype', help="Derive --ktype locally from this finer ktype (e.g. K_1M)")
+    data.add_argument('--cache-dir', default='kline_cache', help="K-line cache directory")
+    data.add_argument('--offline', action='store_true', help="Never connect to OpenD; use only cached bars")
+    data.add_argument('--timing', action='store_true', help="Print startup, import and run times to stderr")
+
+    strategy = argparse.ArgumentParser(add_help=False)
+    strategy.add_argument('--param', action='append', metavar='NAME=VALUE', help="Strategy parameter (repeatable)")
+    strategy.add_argument('--mode', default='precomputed', choices=['precomputed', 'cross_sectional', 'update'],
+                          help="Backtest mode")
+    strategy.add_argument('--store-dir', help="Record the runs in a ResultStore in this directory")
+
+    fetch = commands.add_parser('fetch', parents=[data], help="Download K-lines into the local cache")
+    fetch.set_defaults(run=run_fetch)
+
+    backtest = commands.add_parser('backtest', parents=[data, strategy], help="Run one backtest")
+    backtest.add_argument('--label', help="Label for the stored run")
+    backtest.add_argument('--quiet', action='store_true', help="Print one summary line instead of the full statistics")
+    backtest.add_argument('--plot', action='store_true', help="Plot the balance history (needs matplotlib)")
+    backtest.set_defaults(run=run_backtest_command)
+
+    sweep = commands.add_parser('sweep', parents=[data, strategy], help="Backtest a grid of parameter sets")
+    sweep.add_argument('--grid', action='append', metavar='NAME=V1,V2', help="Values to sweep for a parameter (repeatable)")
+    sweep.add_argument('--workers', type=int, help="Worker processes (default: all CPUs)")
+    sweep.add_argument('--indicator-cache', help="IndicatorCache directory shared by the workers and later sweeps")
+    sweep.add_argument('--sort', default='final_return', help="Result column to sort by")
+    sweep.add_argument('--top', type=int, default=20, help="Rows to print")
+    sweep.add_argument('--output', help="Optional CSV file for all results")
+    sweep.set_defaults(run=run_sweep_command)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+from TradingStrategy import MACDATRStrategy
+from FutuBackTest import PortfolioManager, run_backtest
+from PricePanel import PricePanel
+
+# Benchmarks for the strategy, portfolio and backtest on seeded synthetic data, so they run
+# without Futu OpenD. Results are written as JSON; with --baseline the run fails when a
+# throughput figure drops more than --threshold below the baseline.
+
+
+def synthetic_ohlc(n_bars, seed=0, start_price=100.0, drift=0.0, volatility=0.01):
+    # Geometric Brownian motion closes; open is the previous close and high/low extend
+    # past the open/close range by a random intrabar excursion
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(drift - volatility ** 2 / 2, volatility, n_bars)
+    close = start_price * np.exp(np.cumsum(log_returns))
+    open_price = np.concatenate(([start_price], close[:-1]))
+    high = np.maximum(open_price, close) * (1 + np.abs(rng.normal(0, volatility / 2, n_bars)))
+    low = np.minimum(open_price, close) * (1 - np.abs(rng.normal(0, volatility / 2, n_bars)))
+    return open_price, high, low, close
+
+
+def synthetic_frames(n_symbols, n_bars, seed=0, volatility=0.02, freq='60min'):
+    # {symbol: DataFrame} in fetch_futu_data's layout, one independent GBM path per symbol
+    time_key = pd.date_range('2015-01-01', periods=n_bars, freq=freq).strftime('%Y-%m-%d %H:%M:%S')
+    frames = {}
+    for k in range(n_symbols):
+        open_price, high, low, close = synthetic_ohlc(n_bars, seed + k, volatility=volatility)
+        frames[f'SIM.{k:05d}'] = pd.DataFrame({'code': f'SIM.{k:05d}', 'time_key': time_key,
+                                               'open': open_price, 'high': high, 'low': low, 'close': close})
+    return frames
+
+
+# Set to False (--no-memory) to skip the peak memory runs
+TRACK_MEMORY = True
+
+
+def measure(function, *args):
+    # (result, wall seconds, peak traced memory in MB). Tracing slows Python code down a lot,
+    # so the peak memory comes from a second, traced run that is not timed.
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if TRACK_MEMORY:
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_update(n_bars, incremental):
+    _, high, low, close = synthetic_ohlc(n_bars, volatility=0.02)
+    high, low, close = high.tolist(), low.tolist(), close.tolist()
+
+    def run():
+        strategy = MACDATRStrategy(incremental=incremental)
+        for i in range(n_bars):
+            strategy.update(close[i], high[i], low[i])
+    _, elapsed, peak = measure(run)
+    return {"bars_per_sec": n_bars / elapsed, "seconds": elapsed, "peak_mb": peak}
+
+
+def bench_generate_signals(n_bars):
+    _, high, low, close = synthetic_ohlc(n_bars, volatility=0.02)
+    _, elapsed, peak = measure(MACDATRStrategy().generate_signals, close, high, low)
+    return {"bars_per_sec": n_bars / elapsed, "seconds": elapsed, "peak_mb": peak}
+
+
+def bench_portfolio(n_trades):
+    prices = synthetic_ohlc(n_trades, volatility=0.02)[3].tolist()
+
+    def run():
+        portfolio = PortfolioManager()
+        for i in range(n_trades - 1):
+            portfolio.buy_stock('SIM', prices[i], 0, 0)
+            portfolio.sell_stock('SIM', prices[i + 1])
+    _, elapsed, peak = measure(run)
+    return {"trades_per_sec": n_trades / elapsed, "seconds": elapsed, "peak_mb": peak}
+
+
+def bench_backtest(n_symbols, n_bars, mode):
+    panel = PricePanel.from_frames(synthetic_frames(n_symbols, n_bars))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, elapsed, peak = measure(run_backtest, panel, mode)
+    return {"seconds": elapsed, "bars_per_sec": n_symbols * n_bars / elapsed, "peak_mb": peak}
+
+
+def run_benchmarks(symbol_counts=(10, 100, 1000), n_bars=2000, update_bars=2000, modes=('precomputed',)):
+    results = {
+        "update_talib": bench_update(update_bars, incremental=False),
+        "update_incremental": bench_update(update_bars, incremental=True),
+        "generate_signals": bench_generate_signals(n_bars),
+        "portfolio": bench_portfolio(n_bars),
+    }
+    for mode in modes:
+        for n_symbols in symbol_counts:
+            results[f"backtest_{mode}_{n_symbols}"] = bench_backtest(n_symbols, n_bars, mode)
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    # Throughput figures (*_per_sec) that fell more than `threshold` (a fraction) below the baseline
+    regressions = []
+    for name, figures in results.items():
+        for key, value in figures.items():
+            if not key.endswith('_per_sec') or key not in baseline.get(name, {}):
+                continue
+            reference = baseline[name][key]
+            if value < reference * (1 - threshold):
+                regressions.append(f"{name}.{key}: {value:.0f} < baseline {reference:.0f} (-{(1 - value / reference) * 100:.1f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MACD ATR strategy and backtest on synthetic data.")
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100, 1000], help="Universe sizes for the end-to-end backtest")
+    parser.add_argument('--bars', type=int, default=2000, help="Bars per symbol")
+    parser.add_argument('--update-bars', type=int, default=2000, help="Bars for the per-bar update benchmarks")
+    parser.add_argument('--modes', nargs='+', default=['precomputed'], help="Backtest modes to benchmark")
+    parser.add_argument('--output', default='benchmark.json', help="Where to write the results")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed throughput drop vs the baseline (fraction)")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the peak memory measurements")
+    args = parser.parse_args(argv)
+
+    global TRACK_MEMORY
+    TRACK_MEMORY = not args.no_memory
+
+    results = run_benchmarks(args.symbols, args.bars, args.update_bars, args.modes)
+    report = {"python": platform.python_version(), "numpy": np.__version__, "bars": args.bars, "results": results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, figures in results.items():
+        print(name, ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in figures.items()))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("Throughput regressions:")
+            for regression in regressions:
+                print(regression)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import numpy as np
+
+
+def _ema_step(value, seed_sum, x, k, period, n, active):
+    # One EMA step for every symbol; n is each symbol's 1-based EMA bar count.
+    # Seeding is the SMA of the first `period` values, same as talib.
+    seeding = active & (n <= period)
+    seed_sum[seeding] += x[seeding]
+    seeded = active & (n == period)
+    value[seeded] = seed_sum[seeded] / period
+    rolling = active & (n > period)
+    value[rolling] = ((x[rolling] - value[rolling]) * k) + value[rolling]
+
+
+class CrossSectionalMACDATRStrategy:
+    # Struct-of-arrays version of MACDATRStrategy: the indicator, peak and position
+    # state of N symbols lives in contiguous NumPy arrays, and `update` advances all
+    # of them for one timestamp with vectorized operations. Each symbol follows the
+    # same rules as MACDATRStrategy(incremental=True). Symbols with a NaN close for
+    # a timestamp (suspended, not listed yet) are skipped for that bar.
+    def __init__(self, symbols, fast_length=13, slow_length=34, signal_length=9,
+                 decrease_percentage=0.2, atr_length=13, atr_multiplier=1.5,
+                 sd_length=13, sd_multiplier=2, atr_min_multiplier=0.8, atr_max_multiplier=3, rsi_length=14, rsi_buy_threshold=30, rsi_sell_threshold=70):
+        if slow_length < fast_length:
+            fast_length, slow_length = slow_length, fast_length
+        # Initialize parameters
+        self.symbols = list(symbols)
+        self.fast_length = fast_length
+        self.slow_length = slow_length
+        self.signal_length = signal_length
+        self.decrease_percentage = decrease_percentage
+        self.atr_length = atr_length
+        self.atr_multiplier = atr_multiplier
+        self.sd_length = sd_length
+        self.sd_multiplier = sd_multiplier
+        self.atr_min_multiplier = atr_min_multiplier
+        self.atr_max_multiplier = atr_max_multiplier
+        self.rsi_length = rsi_length
+        self.rsi_buy_threshold = rsi_buy_threshold
+        self.rsi_sell_threshold = rsi_sell_threshold
+
+        n = len(self.symbols)
+        nan = lambda: np.full(n, np.nan)
+        zero = lambda: np.zeros(n)
+
+        # Internal state, one slot per symbol
+        self.count = np.zeros(n, dtype=np.int64)
+        self.prev_close = nan()
+
+        self.fast_ema, self.fast_sum = nan(), zero()
+        self.slow_ema, self.slow_sum = nan(), zero()
+        self.signal_ema, self.signal_sum = nan(), zero()
+        # Last three MACD histogram values: [current, previous, two bars ago]
+        self.macd_hist = np.full((3, n), np.nan)
+
+        self.avg_gain, self.avg_loss, self.rsi = zero(), zero(), nan()
+        self.atr, self.atr_sum = nan(), zero()
+
+        self.sd_window = np.zeros((sd_length, n))
+        self.sd = nan()
+
+        self.peak_current, self.peak_previous = nan(), nan()
+        self.peak_count = np.zeros(n, dtype=np.int64)
+
+        self.is_in_position = np.zeros(n, dtype=bool)
+        self.buy_price = nan()
+        self.stop_loss_price = nan()
+        self.stop_profit_target = nan()
+
+    def update_indicators(self, close, high, low, valid):
+        self.count[valid] += 1
+        c = self.count
+        diff = close - self.prev_close
+        has_prev = valid & (c >= 2)
+
+        # MACD: talib seeds the fast EMA from the closes that end where the slow seed ends
+        fast_n = c - (self.slow_length - self.fast_length)
+        _ema_step(self.fast_ema, self.fast_sum, close, 2.0 / (self.fast_length + 1), self.fast_length,
+                  fast_n, valid & (fast_n >= 1))
+        _ema_step(self.slow_ema, self.slow_sum, close, 2.0 / (self.slow_length + 1), self.slow_length, c, valid)
+        macd = self.fast_ema - self.slow_ema
+        signal_n = c - self.slow_length + 1
+        _ema_step(self.signal_ema, self.signal_sum, macd, 2.0 / (self.signal_length + 1), self.signal_length,
+                  signal_n, valid & (signal_n >= 1))
+        hist = np.where(signal_n >= self.signal_length, macd - self.signal_ema, np.nan)
+        self.macd_hist[1:, valid] = self.macd_hist[:-1, valid]
+        self.macd_hist[0, valid] = hist[valid]
+
+        # RSI with Wilder smoothing
+        p = self.rsi_length
+        gain = np.where(diff > 0, diff, 0.0)
+        loss = np.where(diff < 0, -diff, 0.0)
+        seeding = has_prev & (c <= p + 1)
+        self.avg_gain[seeding] += gain[seeding]
+        self.avg_loss[seeding] += loss[seeding]
+        seeded = has_prev & (c == p + 1)
+        self.avg_gain[seeded] /= p
+        self.avg_loss[seeded] /= p
+        rolling = has_prev & (c > p + 1)
+        self.avg_gain[rolling] = ((self.avg_gain[rolling] * (p - 1)) + gain[rolling]) / p
+        self.avg_loss[rolling] = ((self.avg_loss[rolling] * (p - 1)) + loss[rolling]) / p
+        ready = has_prev & (c >= p + 1)
+        total = self.avg_gain + self.avg_loss
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = np.where(total == 0.0, 0.0, 100.0 * (self.avg_gain / total))
+        self.rsi[ready] = rsi[ready]
+
+        # ATR with Wilder smoothing of the true range
+        p = self.atr_length
+        prev_close = self.prev_close
+        tr = np.maximum(np.maximum(high - low, np.abs(prev_close - high)), np.abs(prev_close - low))
+        seeding = has_prev & (c <= p + 1)
+        self.atr_sum[seeding] += tr[seeding]
+        seeded = has_prev & (c == p + 1)
+        self.atr[seeded] = self.atr_sum[seeded] / p
+        rolling = has_prev & (c > p + 1)
+        self.atr[rolling] = ((self.atr[rolling] * (p - 1)) + tr[rolling]) / p
+
+        # Rolling population standard deviation over a ring buffer, recomputed from the window
+        # (mean, then squared deviations) so it cannot drift like running sums do
+        p = self.sd_length
+        cols = np.flatnonzero(valid)
+        self.sd_window[(c[cols] - 1) % p, cols] = close[cols]
+        cols = np.flatnonzero(valid & (c >= p))
+        if len(cols):
+            window = self.sd_window[:, cols]
+            variance = ((window - window.mean(axis=0)) ** 2).mean(axis=0)
+            self.sd[cols] = np.where(variance >= 1e-14, np.sqrt(variance), 0.0)
+
+        self.prev_close[valid] = close[valid]
+
+    def update(self, close, high, low):
+        # Advance every symbol by one bar. Returns arrays over the symbols with the
+        # buy/sell masks and the event prices (NaN where no event fired).
+        close = np.asarray(close, dtype=float)
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        valid = ~np.isnan(close)
+        previous_close = self.prev_close.copy()
+
+        self.update_indicators(close, high, low, valid)
+        ready = valid & (self.count >= self.slow_length + self.signal_length + 1)
+
+        # Check for peak conditions
+        current_macd_hist, previous_macd_hist, two_bars_ago_macd_hist = self.macd_hist
+        with np.errstate(invalid='ignore'):
+            is_peak = (ready &
+                       (previous_macd_hist <= two_bars_ago_macd_hist) &
+                       (current_macd_hist > previous_macd_hist) &
+                       (two_bars_ago_macd_hist < 0) &
+                       (previous_macd_hist < 0) &
+                       (current_macd_hist < 0))
+        self.peak_previous[is_peak] = self.peak_current[is_peak]
+        self.peak_current[is_peak] = previous_macd_hist[is_peak]
+        self.peak_count[is_peak] = np.minimum(self.peak_count[is_peak] + 1, 2)
+
+        n = len(self.symbols)
+        signals = {
+            "buy": np.zeros(n, dtype=bool),
+            "sell": np.zeros(n, dtype=bool),
+            "buy_price": np.full(n, np.nan),
+            "sell_price": np.full(n, np.nan),
+            "stop_loss_price": np.full(n, np.nan),
+            "stop_profit_target": np.full(n, np.nan),
+            "score": np.full(n, np.nan),
+        }
+
+        # Generate sell signals
+        holding = ready & self.is_in_position
+        stop_loss = holding & (low <= self.stop_loss_price)
+        stop_profit = holding & ~stop_loss & (high >= self.stop_profit_target)
+        signals["sell"] = stop_loss | stop_profit
+        signals["sell_price"][stop_loss] = self.stop_loss_price[stop_loss]
+        signals["sell_price"][stop_profit] = self.stop_profit_target[stop_profit]
+        self.is_in_position[signals["sell"]] = False
+
+        # Screen the universe for buys with the cheap conditions first and narrow the candidates at
+        # each step, so the peak, price-drop and ATR stop computations only run on the few left
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero(ready & ~holding & (self.rsi <= self.rsi_buy_threshold) & (self.peak_count >= 2))
+            candidates = candidates[self.peak_previous[candidates] * (1 - self.decrease_percentage) < self.peak_current[candidates]]
+            sd = self.sd[candidates]
+            candidates = candidates[previous_close[candidates] - sd * self.sd_multiplier > close[candidates]]
+        if len(candidates):
+            sd = self.sd[candidates]
+            dynamic_multiplier = self.atr_multiplier * (1 + sd)
+            dynamic_multiplier = np.maximum(self.atr_min_multiplier, np.minimum(self.atr_max_multiplier, dynamic_multiplier))
+            buy_price = close[candidates]
+            stop_loss_price = low[candidates] - self.atr[candidates] * dynamic_multiplier
+            self.buy_price[candidates] = buy_price
+            self.stop_loss_price[candidates] = stop_loss_price
+            self.stop_profit_target[candidates] = buy_price + 1.5 * (buy_price - stop_loss_price)
+            self.is_in_position[candidates] = True
+            signals["buy"][candidates] = True
+            signals["buy_price"][candidates] = buy_price
+            signals["stop_loss_price"][candidates] = stop_loss_price
+            signals["stop_profit_target"][candidates] = self.stop_profit_target[candidates]
+            # Same as buy_score: the price drop in standard deviations
+            drop = previous_close[candidates] - buy_price
+            signals["score"][candidates] = np.divide(drop, sd, out=np.full_like(drop, np.inf), where=sd > 0)
+
+        return signals
@@ -1,65 +1,208 @@
+import heapq
 import numpy as np
-import pandas as pd
+from dataclasses import dataclass, asdict
 from TradingStrategy import MACDATRStrategy
-import matplotlib.pyplot as plt
-from FutuFetchingData import *
-import os
-import csv
+from CrossSectionalStrategy import CrossSectionalMACDATRStrategy
+from PricePanel import PricePanel
+from Instrumentation import profiler
+from RiskMetrics import RiskMetrics
+from FutuFetchingData import fetch_futu_data_bulk
+
+# One row per executed order; symbol_id indexes PortfolioManager.symbols, side is +1 buy / -1 sell,
+# return_pct is the sell's profit as a percentage of the portfolio value (0 for buys)
+TRADE_DTYPE = np.dtype([('bar', np.int64), ('symbol_id', np.int32), ('side', np.int8), ('price', np.float64),
+                        ('shares', np.float64), ('return_pct', np.float64)])
+
+
+@dataclass(frozen=True)
+class PerformanceStats:
+    final_return: float  # % with open positions at cost, as get_final_return
+    strategy_return: float  # % compounded from the closed trades
+    final_equity: float
+    total_trades: int
+    percent_profitable: float
+    winning_trades: int
+    losing_trades: int
+    avg_winning_return: float
+    avg_losing_return: float
+    largest_winning_trade: float
+    largest_losing_trade: float
+    max_consecutive_wins: int
+    max_consecutive_losses: int
+    max_consecutive_win_return: float  # %
+    max_consecutive_loss_return: float  # %
+    max_drawdown: float  # % below the running equity peak (negative)
+    max_drawdown_bars: int  # longest stretch below a previous peak
+    sharpe: float
+    sortino: float
+    exposure: float  # mean fraction of equity invested
+    turnover: float  # traded notional / mean equity
+
+
+def streaks(returns, winning):
+    # (longest run length, compounded return of the best such run) for runs of winning / losing trades
+    if len(returns) == 0:
+        return 0, 1.0
+    is_win = returns > 0
+    starts = np.flatnonzero(np.concatenate(([True], is_win[1:] != is_win[:-1])))
+    lengths = np.diff(np.append(starts, len(returns)))
+    compounded = np.multiply.reduceat(1 + returns / 100, starts)
+    mask = is_win[starts] if winning else ~is_win[starts]
+    if not mask.any():
+        return 0, 1.0
+    best = compounded[mask].max() if winning else compounded[mask].min()
+    return int(lengths[mask].max()), float(best)
+
+
+def grow(array, size):
+    # Return `array` with room for at least `size` elements (capacity doubles)
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
 
 class PortfolioManager:
-    def __init__(self, initial_balance=100000):
+    def __init__(self, initial_balance=100000, capacity=1024, keep_history=True, risk_window=20):
+        # capacity: bars to preallocate for the equity/cash/exposure arrays (they grow if needed).
+        # keep_history=False keeps only the latest bar, for unbounded live or streaming runs;
+        # self.metrics still covers the whole run. risk_window: bars in the rolling volatility.
         self.initial_balance = initial_balance
         self.account_balance = initial_balance
         self.positions = {}  # Store the active stock positions (max 2 stocks)
         self.max_positions = 2
-        self.balance_history = []
-        self.trade_history = []
-
-        #for tracking
-        self.winning_trades = 0
-        self.losing_trades = 0
-        self.winning_trades_return = 0
-        self.losing_trades_return = 0
-
-        self.consecutive_wins = 0
-        self.consecutive_win_return = 1
-        self.max_consecutive_win_return = 1
-        self.max_consecutive_wins = 0
-
-        self.consecutive_losses = 0
-        self.max_consecutive_losses = 0
-        self.consecutive_loss_return = 1
-        self.max_consecutive_loss_return = 1
+        self.invested = 0.0  # Cost basis of the open positions
+
+        # Per-bar ledger, filled by record_balance
+        self.keep_history = keep_history
+        self.n_bars = 0
+        capacity = max(capacity, 1) if keep_history else 1
+        self.equity = np.zeros(capacity)
+        self.cash = np.zeros(capacity)
+        self.exposure = np.zeros(capacity)
+
+        # Executed orders, see TRADE_DTYPE
+        self.trades = np.zeros(64, dtype=TRADE_DTYPE)
+        self.n_trades = 0
+        self.symbols = []
+        self.symbol_ids = {}
+
+        # Running drawdown, volatility and win/loss streaks, updated per bar and per closed trade
+        self.metrics = RiskMetrics(risk_window)
+        self.stock_trade_stats = {} # To track trades and returns per stock
 
-        self.largest_winning_trade = 0
-        self.largest_losing_trade = 0
+    @property
+    def balance_history(self):
+        # Portfolio value per recorded bar
+        return self.equity[:self.n_bars]
+
+    @property
+    def trade_history(self):
+        # (stock, 'Buy'/'Sell', price) per executed order
+        trades = self.trades[:self.n_trades]
+        return [(self.symbols[symbol_id], 'Buy' if side > 0 else 'Sell', price)
+                for symbol_id, side, price in zip(trades['symbol_id'].tolist(), trades['side'].tolist(), trades['price'].tolist())]
+
+    def record_balance(self, portfolio_value):
+        # Mark the end of a bar with the marked-to-market portfolio value
+        i = self.n_bars if self.keep_history else 0
+        if i >= len(self.equity):
+            size = i + 1
+            self.equity, self.cash, self.exposure = grow(self.equity, size), grow(self.cash, size), grow(self.exposure, size)
+        self.equity[i] = portfolio_value
+        self.cash[i] = self.account_balance
+        self.exposure[i] = 1 - self.account_balance / portfolio_value if portfolio_value else 0.0
+        self.n_bars = i + 1
+        self.metrics.update_equity(portfolio_value)
+
+    def record_trade(self, stock_symbol, side, price, shares, return_pct=0.0):
+        symbol_id = self.symbol_ids.get(stock_symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[stock_symbol] = len(self.symbols)
+            self.symbols.append(stock_symbol)
+        if self.n_trades >= len(self.trades):
+            self.trades = grow(self.trades, self.n_trades + 1)
+        self.trades[self.n_trades] = (self.n_bars, symbol_id, side, price, shares, return_pct)
+        self.n_trades += 1
+
+    def get_state(self):
+        # Balances, open positions, ledgers and running metrics (see StateSnapshot)
+        return {
+            'initial_balance': self.initial_balance,
+            'account_balance': self.account_balance,
+            'max_positions': self.max_positions,
+            'invested': self.invested,
+            'positions': {stock_symbol: dict(details) for stock_symbol, details in self.positions.items()},
+            'keep_history': self.keep_history,
+            'equity': self.equity[:self.n_bars].copy(),
+            'cash': self.cash[:self.n_bars].copy(),
+            'exposure': self.exposure[:self.n_bars].copy(),
+            'trades': self.trades[:self.n_trades].copy(),
+            'symbols': list(self.symbols),
+            'stock_trade_stats': {stock_symbol: dict(stats) for stock_symbol, stats in self.stock_trade_stats.items()},
+            'metrics': self.metrics.get_state(),
+        }
 
-        self.portfolio_return = 1
-        self.stock_trade_stats = {} # To track trades and returns per stock
+    @classmethod
+    def from_state(cls, state, capacity=1024):
+        portfolio = cls(state['initial_balance'], capacity=max(capacity, len(state['equity'])), keep_history=state['keep_history'])
+        portfolio.account_balance = state['account_balance']
+        portfolio.max_positions = state['max_positions']
+        portfolio.invested = state['invested']
+        portfolio.positions = {stock_symbol: dict(details) for stock_symbol, details in state['positions'].items()}
+        portfolio.n_bars = len(state['equity'])
+        portfolio.equity[:portfolio.n_bars] = state['equity']
+        portfolio.cash[:portfolio.n_bars] = state['cash']
+        portfolio.exposure[:portfolio.n_bars] = state['exposure']
+        portfolio.n_trades = len(state['trades'])
+        portfolio.trades = grow(portfolio.trades, portfolio.n_trades)
+        portfolio.trades[:portfolio.n_trades] = state['trades']
+        portfolio.symbols = list(state['symbols'])
+        portfolio.symbol_ids = {stock_symbol: k for k, stock_symbol in enumerate(portfolio.symbols)}
+        portfolio.stock_trade_stats = {stock_symbol: dict(stats) for stock_symbol, stats in state['stock_trade_stats'].items()}
+        portfolio.metrics.set_state(state['metrics'])
+        return portfolio
 
     def can_buy(self, stock_symbol):
         return len(self.positions) < self.max_positions and self.account_balance > 1000 #and stock_symbol not in self.positions
 
-    def buy_stock(self, stock_symbol, buy_price, stop_loss_price, stop_profit_target):
-        if self.can_buy(stock_symbol):
-            if len(self.positions) == 0:
-                investment = self.account_balance * 0.5  # 50% of the total balance
-                num_shares = investment // buy_price
-                self.account_balance -= num_shares * buy_price
-
-            # For the second buy signal (second stock), use 100% of the remaining balance
-            elif len(self.positions) == 1:
-                investment = self.account_balance  # Use all remaining balance
-                num_shares = investment // buy_price
-                self.account_balance -= num_shares * buy_price
+    def execute_signals(self, bar_signals):
+        # Act on one bar's [(stock, signal)]: sells first, since they free slots, then the buys
+        # from strongest to weakest (highest score, ties in list order) while slots are left.
+        # A heap picks the few buys that fit, so a bar where many stocks fire costs O(n log k).
+        # Returns the number of buys rejected for lack of slots or cash.
+        buys = []
+        for order, (stock, signal) in enumerate(bar_signals):
+            if signal is None:
+                continue
+            if signal['signal'] == "Sell":
+                self.sell_stock(stock, signal['sell_price'])
+            elif signal['signal'] == "Buy":
+                buys.append((-signal.get('score', 0.0), order, stock, signal))
+        slots = max(self.max_positions - len(self.positions), 0)
+        bought = 0
+        for _, _, stock, signal in heapq.nsmallest(slots, buys):
+            if not self.can_buy(stock):
+                break
+            self.buy_stock(stock, signal['buy_price'], signal['stop_loss_price'], signal['stop_profit_target'])
+            bought += 1
+        return len(buys) - bought
+
+    def position_size(self, buy_price):
+        # Shares the next buy_stock call at buy_price will take
+        if len(self.positions) == 0:
+            investment = self.account_balance * 0.5  # 50% of the total balance
+        # For the second buy signal (second stock), use 100% of the remaining balance
+        else:
+            investment = self.account_balance  # Use all remaining balance
+        return investment // buy_price
 
-            # Store the position with stock-specific details
-            self.positions[stock_symbol] = {
-                'num_shares': num_shares,
-                'buy_price': buy_price,
-                'stop_loss_price': stop_loss_price,
-                'stop_profit_target': stop_profit_target
-            }
+    def buy_stock(self, stock_symbol, buy_price, stop_loss_price, stop_profit_target, num_shares=None):
+        # num_shares: the filled quantity when a broker executed the order (default: position_size)
+        if self.can_buy(stock_symbol):
+            if num_shares is None:
+                num_shares = self.position_size(buy_price)
+            self.account_balance -= num_shares * buy_price
 
             # Store the position with stock-specific details
             self.positions[stock_symbol] = {
@@ -68,21 +211,24 @@ class PortfolioManager:
                 'stop_loss_price': stop_loss_price,
                 'stop_profit_target': stop_profit_target
             }
-            self.trade_history.append((stock_symbol, 'Buy', buy_price))
+            self.invested += num_shares * buy_price
+            self.record_trade(stock_symbol, 1, buy_price, num_shares)
 
     def sell_stock(self, stock_symbol, sell_price):
         if stock_symbol in self.positions:
             position = self.positions[stock_symbol]
             num_shares = position['num_shares']
             profit = num_shares * (sell_price - position['buy_price'])
-            current_portfolio_value = self.account_balance + sum(details['num_shares'] * details['buy_price'] for details in self.positions.values())
+            current_portfolio_value = self.account_balance + self.invested
             percentage_profit = profit/current_portfolio_value * 100
 
             self.account_balance += num_shares * sell_price
 
             # Record the trade and remove the position
-            self.trade_history.append((stock_symbol, 'Sell', sell_price))
+            self.record_trade(stock_symbol, -1, sell_price, num_shares, percentage_profit)
             del self.positions[stock_symbol]
+            # Reset when flat so the running cost basis cannot drift
+            self.invested = self.invested - num_shares * position['buy_price'] if self.positions else 0.0
 
             # Track win/loss and profit for each trade
             self.track_trade_profit(stock_symbol, percentage_profit)
@@ -95,49 +241,7 @@ class PortfolioManager:
 
 
     def track_trade_profit(self, stock_symbol, percentage_profit):
-
-        self.portfolio_return *= (1 + percentage_profit/100)
-        # Track wins/losses
-        if percentage_profit > 0:
-            if self.consecutive_wins == 0: self.consecutive_win_return = 1
-            self.winning_trades += 1
-            self.winning_trades_return += percentage_profit
-
-            self.consecutive_wins += 1
-            self.consecutive_losses = 0
-            self.consecutive_win_return *= (1 + percentage_profit / 100)
-
-
-            # Update largest winning trade
-            if percentage_profit > self.largest_winning_trade:
-                self.largest_winning_trade = percentage_profit
-
-            if self.consecutive_win_return > self.max_consecutive_win_return:
-                self.max_consecutive_win_return = self.consecutive_win_return
-
-            # Update max consecutive wins
-            if self.consecutive_wins > self.max_consecutive_wins:
-                self.max_consecutive_wins = self.consecutive_wins
-
-        else:
-            if self.consecutive_losses == 0: self.consecutive_loss_return = 1
-            self.losing_trades += 1
-            self.losing_trades_return += percentage_profit
-
-            self.consecutive_losses += 1
-            self.consecutive_wins = 0
-            self.consecutive_loss_return *= (1 + percentage_profit/100)
-
-            # Update largest losing trade
-            if percentage_profit < self.largest_losing_trade:
-                self.largest_losing_trade = percentage_profit
-
-            if self.consecutive_loss_return < self.max_consecutive_loss_return:
-                self.max_consecutive_loss_return = self.consecutive_loss_return
-
-            # Update max consecutive losses
-            if self.consecutive_losses > self.max_consecutive_losses:
-                self.max_consecutive_losses = self.consecutive_losses
+        self.metrics.record_trade(percentage_profit)
 
         # Track stock-specific performance
         self.track_stock_trade(stock_symbol, percentage_profit)
@@ -148,86 +252,247 @@ class PortfolioManager:
         self.stock_trade_stats[stock_symbol]['trades'] += 1
         self.stock_trade_stats[stock_symbol]['return'] += percentage_profit
 
+    def get_performance(self, periods_per_year=252):
+        # Vectorized analytics over the equity ledger and trade ledger.
+        # periods_per_year annualizes Sharpe/Sortino from per-bar returns (252 for daily bars).
+        equity = self.equity[:self.n_bars]
+        trades = self.trades[:self.n_trades]
+        returns = trades['return_pct'][trades['side'] < 0]
+        wins, losses = returns[returns > 0], returns[returns <= 0]
+        total_trades = self.n_trades // 2  # Buy/Sell pairs
+
+        if len(equity) > 1:
+            bar_returns = np.diff(equity) / equity[:-1]
+            peak = np.maximum.accumulate(equity)
+            drawdown = equity / peak - 1
+            below = drawdown < 0
+            # Longest run of bars below a previous peak
+            run_edges = np.flatnonzero(np.diff(np.concatenate(([0], below.astype(np.int8), [0]))))
+            max_drawdown_bars = int((run_edges[1::2] - run_edges[::2]).max()) if len(run_edges) else 0
+            std = bar_returns.std()
+            downside = np.sqrt(np.mean(np.minimum(bar_returns, 0) ** 2))
+            sharpe = bar_returns.mean() / std * np.sqrt(periods_per_year) if std > 0 else 0.0
+            sortino = bar_returns.mean() / downside * np.sqrt(periods_per_year) if downside > 0 else 0.0
+            max_drawdown = drawdown.min() * 100
+        else:
+            max_drawdown, max_drawdown_bars, sharpe, sortino = 0.0, 0, 0.0, 0.0
+
+        max_wins, best_win_run = streaks(returns, winning=True)
+        max_losses, worst_loss_run = streaks(returns, winning=False)
+        mean_equity = equity.mean() if len(equity) else self.initial_balance
+        return PerformanceStats(
+            final_return=float(self.get_final_return()),
+            strategy_return=float((np.prod(1 + returns / 100) - 1) * 100),
+            final_equity=float(equity[-1]) if len(equity) else self.initial_balance,
+            total_trades=total_trades,
+            percent_profitable=float(len(wins) / total_trades * 100 if total_trades > 0 else 0.0),
+            winning_trades=len(wins),
+            losing_trades=len(losses),
+            avg_winning_return=float(wins.mean() if len(wins) else 0.0),
+            avg_losing_return=float(losses.mean() if len(losses) else 0.0),
+            largest_winning_trade=float(max(wins.max(), 0) if len(wins) else 0.0),
+            largest_losing_trade=float(min(losses.min(), 0) if len(losses) else 0.0),
+            max_consecutive_wins=max_wins,
+            max_consecutive_losses=max_losses,
+            max_consecutive_win_return=(best_win_run - 1) * 100,
+            max_consecutive_loss_return=(worst_loss_run - 1) * 100,
+            max_drawdown=float(max_drawdown),
+            max_drawdown_bars=max_drawdown_bars,
+            sharpe=float(sharpe),
+            sortino=float(sortino),
+            exposure=float(self.exposure[:self.n_bars].mean() if self.n_bars else 0.0),
+            turnover=float((trades['price'] * trades['shares']).sum() / mean_equity),
+        )
+
+    def get_summary(self):
+        # Numeric performance figures for comparing many runs (no formatting or printing)
+        return asdict(self.get_performance())
+
     def get_statistics(self):
-        total_trades = len(self.trade_history) // 2  # Buy/Sell pairs
-        percent_profitable = (self.winning_trades / total_trades) * 100 if total_trades > 0 else 0
+        metrics = self.metrics
+        total_trades = self.n_trades // 2  # Buy/Sell pairs
+        percent_profitable = (metrics.winning_trades / total_trades) * 100 if total_trades > 0 else 0
         avg_return_per_trade = sum(stock['return'] for stock in self.stock_trade_stats.values()) / total_trades if total_trades > 0 else 0
-        avg_return_winning = self.winning_trades_return / self.winning_trades
-        avg_return_losing = self.losing_trades_return / self.losing_trades
-        risk_reward_ratio = -avg_return_losing / avg_return_winning
+        avg_return_winning = metrics.winning_trades_return / metrics.winning_trades if metrics.winning_trades else 0.0
+        avg_return_losing = metrics.losing_trades_return / metrics.losing_trades if metrics.losing_trades else 0.0
+        # Reward per unit of risk; undefined until there is at least one win and one loss
+        reward_per_risk = avg_return_winning / -avg_return_losing if avg_return_winning and avg_return_losing else None
 
         stats = {
-            "Strategy Return (%)": f"{(self.portfolio_return - 1) * 100:.2f}",
+            "Strategy Return (%)": f"{(metrics.portfolio_return - 1) * 100:.2f}",
             "Total Trades": total_trades,
             "Percent Profitable": f"{percent_profitable:.2f}",
-            "Risk Reward Ratio":f"1:{(1 / risk_reward_ratio):.2f}",
-            "Winning Trades": self.winning_trades,
-            "Losing Trades": self.losing_trades,
+            "Risk Reward Ratio": f"1:{reward_per_risk:.2f}" if reward_per_risk is not None else "n/a",
+            "Winning Trades": metrics.winning_trades,
+            "Losing Trades": metrics.losing_trades,
             "Average Winning Trades Return": f"{avg_return_winning:.2f}",
             "Average Losing Trades Return": f"{avg_return_losing:.2f}",
             "Average Return per Trade (%)": f"{avg_return_per_trade:.2f}",
-            "Largest Winning Trade (%)": f"{self.largest_winning_trade:.2f}",
-            "Largest Losing Trade (%)": f"{self.largest_losing_trade:.2f}",
-            "Max Consecutive Wins": self.max_consecutive_wins,
-            "Max Consecutive Win Return (%)": f"{(self.max_consecutive_win_return - 1) * 100:.2f}",
-            "Max Consecutive Losses": self.max_consecutive_losses,
-            "Max Consecutive Loss Return (%)": f"{(self.max_consecutive_loss_return - 1) * 100:.2f}",
+            "Largest Winning Trade (%)": f"{metrics.largest_winning_trade:.2f}",
+            "Largest Losing Trade (%)": f"{metrics.largest_losing_trade:.2f}",
+            "Max Consecutive Wins": metrics.max_consecutive_wins,
+            "Max Consecutive Win Return (%)": f"{(metrics.max_consecutive_win_return - 1) * 100:.2f}",
+            "Max Consecutive Losses": metrics.max_consecutive_losses,
+            "Max Consecutive Loss Return (%)": f"{(metrics.max_consecutive_loss_return - 1) * 100:.2f}",
         }
+        performance = self.get_performance()
+        stats.update({
+            "Max Drawdown (%)": f"{performance.max_drawdown:.2f}",
+            "Sharpe Ratio": f"{performance.sharpe:.2f}",
+            "Sortino Ratio": f"{performance.sortino:.2f}",
+            "Exposure (%)": f"{performance.exposure * 100:.2f}",
+            "Turnover": f"{performance.turnover:.2f}",
+        })
         for key, value in stats.items():
             print(f"{key}: {value}")
 
         print("Stock Trade Stats:(stock), (trades), (return)")
         for stock_symbol, stock_data in self.stock_trade_stats.items():
             print(f"{stock_symbol},{stock_data['trades']},{stock_data['return']:.2f}")
-        return
-def stock_length_validation(stocks_data):
-    lengths = {stock: len(stocks_data[stock]['Close']) for stock in stocks_data}
-
-    # Find the most common length (the expected length)
-    expected_length = max(set(lengths.values()), key=list(lengths.values()).count)
-
-    # Identify stocks that don't match the expected length
-    mismatched_stocks = {stock: length for stock, length in lengths.items() if length != expected_length}
-
-    # If there are any mismatches, raise an error and print details
-    if mismatched_stocks:
-        print("The following stocks have differing lengths for 'Close' data:")
-        for stock, length in mismatched_stocks.items():
-            print(f"{stock}: Length = {length} (Expected = {expected_length})")
-        raise ValueError("Mismatch in length of 'Close' data detected. Adjust the data before continuing.")
-    return
-
-def backtest_strategy(stocks_data):
+        return performance
+def signal_at_bar(signals, i):
+    # Turn the precomputed event arrays back into the dict `MACDATRStrategy.update` returns
+    if signals['buy'][i]:
+        return {
+            "signal": "Buy",
+            "buy_price": signals['buy_price'][i],
+            "stop_profit_target": signals['stop_profit_target'][i],
+            "stop_loss_price": signals['stop_loss_price'][i],
+            "score": signals['score'][i]
+        }
+    if signals['sell'][i]:
+        return {"signal": "Sell", "sell_price": signals['sell_price'][i]}
+    return None
+
+def run_backtest(stocks_data, mode='precomputed', strategy_params=None, bar_range=None, indicator_cache=None,
+                 strategies=None, portfolio=None, last_close=None):
+    # Run the backtest and return the PortfolioManager, without printing anything.
+    # stocks_data: a PricePanel, or {stock: DataFrame} which is aligned into one first.
+    # Stocks without a bar at some timestamp (suspended, listed later) simply skip it.
+    # mode: 'precomputed' generates each stock's events up front with generate_signals,
+    # 'cross_sectional' steps all stocks together per bar with CrossSectionalMACDATRStrategy,
+    # 'update' calls MACDATRStrategy.update bar by bar.
+    # strategy_params: keyword arguments for MACDATRStrategy (e.g. {'slow_length': 26}).
+    # bar_range: (start, end) bar indices to trade, and balance_history covers only this range. In
+    # 'precomputed' mode indicators still use the earlier bars as warm-up; in 'update' mode the
+    # earlier bars are not processed at all (use strategies to continue from a warmed-up state).
+    # indicator_cache: an IndicatorCache reused across calls, so runs whose parameters give the
+    # same indicators (see MACDATRStrategy.indicator_params) compute them only once.
+    # strategies, portfolio, last_close: continue an earlier 'update' run instead of starting flat
+    # (see IncrementalBacktest). strategies is {stock: MACDATRStrategy}, updated in place, with fresh
+    # strategies added for new stocks; portfolio is the PortfolioManager to extend; last_close is
+    # {stock: close} valuing open positions until the stock's first bar in the panel.
+    strategy_params = strategy_params or {}
+    panel = stocks_data if isinstance(stocks_data, PricePanel) else PricePanel.from_frames(stocks_data)
+    symbols = panel.symbols
+    valid = panel.valid
+    # Open positions are valued at the stock's last available close
+    mark_prices = panel.forward_filled('close')
+
+    start, end = bar_range or (0, len(panel.timestamps))
+
+    if bar_range is not None and mode not in ('precomputed', 'update'):
+        raise ValueError("bar_range is only supported in 'precomputed' and 'update' mode")
+    if (strategies is not None or last_close is not None) and mode != 'update':
+        raise ValueError("Continuing from strategy state is only supported in 'update' mode")
 
-    stock_length_validation(stocks_data)
     # Initialize portfolio manager with $10,000
-    portfolio = PortfolioManager(initial_balance=100000)
-
-    strategies = {stock: MACDATRStrategy() for stock in stocks_data.keys()}  # One strategy per stock
-
-    for i in range(len(stocks_data[next(iter(stocks_data))]['Close'])):  # Loop through data points (assuming all stocks have same length)
-        current_prices = {stock: stocks_data[stock]['Close'][i] for stock in stocks_data.keys()}
-
-        # Update strategy signals for all stocks
-        for stock, data in stocks_data.items():
-            signal = strategies[stock].update(data['Close'][i], data['High'][i], data['Low'][i])
-
-            if signal is None:
-                continue
-
-            if signal['signal'] == "Buy" and portfolio.can_buy(stock):
-                portfolio.buy_stock(stock, signal['buy_price'], signal['stop_loss_price'], signal['stop_profit_target'])
-
-            if signal['signal'] == "Sell":
-                portfolio.sell_stock(stock, signal['sell_price'])
-
-        #portfolio.update_portfolio(current_prices)
-        portfolio_value = portfolio.account_balance
-        for stock_symbol, details in portfolio.positions.items():
-            portfolio_value += details['num_shares'] * current_prices.get(stock_symbol, details['buy_price'])
-        portfolio.balance_history.append(portfolio_value)
+    if portfolio is None:
+        portfolio = PortfolioManager(initial_balance=100000, capacity=end - start)
+
+    # One strategy per stock
+    strategies = strategies if strategies is not None else {}
+    for stock in symbols:
+        if stock not in strategies:
+            strategies[stock] = MACDATRStrategy(incremental=True, **strategy_params)
+    last_close = last_close or {}
+    for stock, close in last_close.items():
+        j = panel.symbol_index.get(stock)
+        if j is not None:
+            column = mark_prices[:, j]
+            column[np.isnan(column)] = close
+
+    # Phase timers and counters, see Instrumentation.profiler
+    profiling = profiler.enabled
+    with profiler.phase('backtest'):
+        if mode == 'precomputed':
+            # Generate every stock's buy/sell events in one pass over its own bars, then only visit the
+            # timestamps that have events. Stocks are listed per bar in panel order, same as the bar-by-bar path.
+            events = {}
+            for j, stock in enumerate(symbols):
+                strategy = strategies[stock]
+                rows = np.flatnonzero(valid[:, j])
+                close, high, low = panel.close[rows, j], panel.high[rows, j], panel.low[rows, j]
+                indicators = None if indicator_cache is None else indicator_cache.indicators(stock, strategy, close, high, low)
+                row_start, row_end = np.searchsorted(rows, [start, end]).tolist()
+                signals = strategy.generate_signals(close, high, low, indicators, row_start, row_end)
+                for k in np.flatnonzero(signals['buy'] | signals['sell']).tolist():
+                    events.setdefault(int(rows[k]), []).append((stock, signals, k))
+        elif mode == 'cross_sectional':
+            engine = CrossSectionalMACDATRStrategy(symbols, **strategy_params)
+        elif mode != 'update':
+            raise ValueError(f"Unknown backtest mode: {mode}")
+
+        for i in range(start, end):
+            if mode == 'precomputed':
+                bar_signals = [(stock, signal_at_bar(signals, k)) for stock, signals, k in events.get(i, ())]
+            elif mode == 'cross_sectional':
+                with profiler.phase('cross_sectional_update'):
+                    signals = engine.update(panel.close[i], panel.high[i], panel.low[i])
+                    bar_signals = [(symbols[j], signal_at_bar(signals, j))
+                                   for j in np.flatnonzero(signals['buy'] | signals['sell']).tolist()]
+                if profiling:
+                    profiler.count('bars_processed', int(valid[i].sum()))
+                    profiler.count('buy_signals', int(signals['buy'].sum()))
+                    profiler.count('sell_signals', int(signals['sell'].sum()))
+            else:
+                bar_signals = [(stock, strategies[stock].update(panel.close[i, j], panel.high[i, j], panel.low[i, j]))
+                               for j, stock in enumerate(symbols) if valid[i, j]]
+
+            # Act on the strategy signals for all stocks
+            with profiler.phase('portfolio'):
+                rejected = portfolio.execute_signals(bar_signals)
+            if profiling:
+                profiler.count('rejected_buys', rejected)
+            with profiler.phase('mark_to_market'):
+                #portfolio.update_portfolio(current_prices)
+                portfolio_value = portfolio.account_balance
+                for stock_symbol, details in portfolio.positions.items():
+                    j = panel.symbol_index.get(stock_symbol)
+                    portfolio_value += details['num_shares'] * (mark_prices[i, j] if j is not None else last_close[stock_symbol])
+                portfolio.record_balance(portfolio_value)
+    return portfolio
+
+
+def plot_balance(balance_history, benchmark_closes=None, benchmark_label="HSI (2800)"):
+    # Portfolio balance against a benchmark, both normalized to 100. matplotlib is imported
+    # here so backtests that do not plot never load it.
+    import matplotlib.pyplot as plt
+
+    # Normalize portfolio balance and the benchmark to the same initial value for comparison
+    portfolio_normalized = np.array(balance_history) / balance_history[0] * 100
+    plt.plot(portfolio_normalized, label="Portfolio Balance")
+    if benchmark_closes is not None:
+        benchmark_normalized = np.array(benchmark_closes) / benchmark_closes[0] * 100
+        plt.plot(benchmark_normalized, label=benchmark_label, linestyle='--')
+
+    # Plot formatting
+    plt.title(f"Portfolio Balance vs {benchmark_label} Over Time" if benchmark_closes is not None else "Portfolio Balance Over Time")
+    plt.xlabel("Time")
+    plt.ylabel("Normalized Value")
+    plt.legend()
+    plt.show()
+
+
+def backtest_strategy(stocks_data, mode='precomputed', strategy_params=None, store=None, label=None):
+    # store: optional ResultStore that records the run (parameters, data fingerprint, trades, equity)
+    panel = stocks_data if isinstance(stocks_data, PricePanel) else PricePanel.from_frames(stocks_data)
+    portfolio = run_backtest(panel, mode, strategy_params)
     # Final return report
     portfolio.get_statistics()
+    if store is not None:
+        run_id = store.save(portfolio, strategy_params, panel, mode=mode, label=label)
+        print(f"Saved as run {run_id} in {store.store_dir}")
     return portfolio.get_final_return(), portfolio.trade_history, portfolio.balance_history
 
 
@@ -247,41 +512,29 @@ if __name__ == "__main__":
     'HK.02628', 'HK.00941', 'HK.01109', 'HK.00688', 'HK.03968',
 
     ]
-    stocks_data = {}
+    from KlineCache import KlineCache
 
-    for stock in stock_list:
-        # Fetch data for each stock from Futu OpenAPI (pseudo-code, replace with actual API call)
-        # data = fetch_futu_data(stock_code=stock, start_date='2014-01-01', end_date='2024-01-10', ktype='K_30M')
-        data = fetch_futu_data(stock_code=stock, start_date='2019-10-16', end_date='2024-10-16', ktype='K_60M')
-        if data is not None:
-            stocks_data[stock] = process_futu_data(data)
+    # Fetch every stock plus the HSI tracker (HK.02800) in one pooled, de-duplicated batch through the local cache
+    # all_data = fetch_futu_data_bulk(stock_list + ['HK.02800'], start_date='2014-01-01', end_date='2024-01-10', ktype='K_30M', cache=KlineCache())
+    all_data = fetch_futu_data_bulk(stock_list + ['HK.02800'], start_date='2019-10-16', end_date='2024-10-16', ktype='K_60M', cache=KlineCache())
+    # Or download K_1M once and derive every timeframe locally (cached), e.g. to compare K_30M with K_60M:
+    # from Resampling import fetch_futu_data_resampled_bulk
+    # all_data = fetch_futu_data_resampled_bulk(stock_list + ['HK.02800'], '2019-10-16', '2024-10-16', ['K_30M', 'K_60M'])['K_60M']
+    stocks_data = {stock: all_data[stock] for stock in dict.fromkeys(stock_list) if all_data[stock] is not None}
 
-    hsi_data = fetch_futu_data(stock_code='HK.02800', start_date='2019-10-16', end_date='2024-10-16', ktype='K_60M')
-
-    if hsi_data is not None:
-        hsi_data = process_futu_data(hsi_data)
-        hsi_closes = hsi_data['Close']
+    hsi_data = all_data['HK.02800']
 
     if stocks_data:
-        # Run the backtest
-        final_return, trades, balance_history = backtest_strategy(stocks_data)
-
-        # Normalize portfolio balance and HSI to the same initial value for comparison
-        portfolio_normalized = np.array(balance_history) / balance_history[0] * 100
-        hsi_normalized = np.array(hsi_closes) / hsi_closes[0] * 100
-
-        # Plot portfolio balance history
-        plt.plot(portfolio_normalized, label="Portfolio Balance")
+        # Align all stocks on one timestamp index, and the HSI tracker onto the same timestamps
+        panel = PricePanel.from_frames(stocks_data)
+        if hsi_data is not None:
+            hsi_closes = PricePanel.from_frames({'HK.02800': hsi_data}, timestamps=panel.timestamps).forward_filled('close')[:, 0]
 
-        # Plot HSI for comparison
-        plt.plot(hsi_normalized, label="HSI (2800)", linestyle='--')
+        # Run the backtest and record it in the local result store
+        from ResultStore import ResultStore
+        final_return, trades, balance_history = backtest_strategy(panel, store=ResultStore(), label='K_60M HK universe')
 
-        # Plot formatting
-        plt.title("Portfolio Balance vs HSI (2800) Over Time")
-        plt.xlabel("Time")
-        plt.ylabel("Normalized Value")
-        plt.legend()
-        plt.show()
+        plot_balance(balance_history, hsi_closes if hsi_data is not None else None)
 
     else:
         print("Failed to fetch data for all stocks.")
@@ -1,55 +1,192 @@
-from futu import *
+import time
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
+from KlineCache import KlineCache
 
+# futu is imported only where a connection to OpenD is opened, so offline and cached runs
+# never pay for loading it
 
-def fetch_futu_data(stock_code, start_date, end_date, ktype='K_30M', max_count=500):
-    """
-    Fetch historical K-line (candlestick) data from Futu OpenAPI.
+"Input your own host and port number"
+FUTU_HOST = '127.0.0.1'
+FUTU_PORT = 11111
 
-    :param stock_code: The stock symbol, e.g., 'US.VOO'.
-    :param start_date: Start date for historical data in 'YYYY-MM-DD' format.
-    :param end_date: End date for historical data in 'YYYY-MM-DD' format.
-    :param ktype: The type of K-line, e.g., 'K_30M' for 30-minute data.
-    :param max_count: Maximum number of records to fetch in one request (default: 500).
-    :return: A pandas DataFrame containing historical data.
-    """
 
-    "Input your own host and port number"
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
+class RateLimiter:
+    # Allows at most max_requests calls per `per_seconds` window across all threads.
+    # OpenD limits historical K-line requests (60 per 30 seconds by default).
+    def __init__(self, max_requests=60, per_seconds=30):
+        self.max_requests = max_requests
+        self.per_seconds = per_seconds
+        self.request_times = []
+        self.lock = threading.Lock()
 
-    # Request historical data
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.request_times = [t for t in self.request_times if now - t < self.per_seconds]
+                if len(self.request_times) < self.max_requests:
+                    self.request_times.append(now)
+                    return
+                sleep_time = self.per_seconds - (now - self.request_times[0])
+            time.sleep(sleep_time)
+
+
+class QuoteContextPool:
+    # A fixed set of quote contexts shared by worker threads; each context is used by one thread at a time
+    def __init__(self, size=2, context_factory=None):
+        if context_factory is None:
+            from futu import OpenQuoteContext
+            context_factory = lambda: OpenQuoteContext(host=FUTU_HOST, port=FUTU_PORT)
+        self.contexts = [context_factory() for _ in range(size)]
+        self.available = queue.Queue()
+        for quote_ctx in self.contexts:
+            self.available.put(quote_ctx)
+
+    def acquire(self):
+        return self.available.get()
+
+    def release(self, quote_ctx):
+        self.available.put(quote_ctx)
+
+    def close(self):
+        for quote_ctx in self.contexts:
+            quote_ctx.close()
+
+
+def request_history_pages(quote_ctx, stock_code, start_date, end_date, ktype='K_30M', max_count=500, rate_limiter=None):
+    # Request every page of a K-line history on an open quote context. Returns None if any page
+    # fails: a partial history would be cached as covering the whole range.
+    from futu import RET_OK
+    if rate_limiter is not None:
+        rate_limiter.wait()
     ret, data, page_req_key = quote_ctx.request_history_kline(stock_code, start=start_date, end=end_date, ktype=ktype,
                                                               max_count=max_count)
 
     if ret != RET_OK:
         print('Error:', data)
-        quote_ctx.close()
         return None
 
-    historical_data = data
+    pages = [data]
 
     # Handle pagination
     while page_req_key is not None:
+        if rate_limiter is not None:
+            rate_limiter.wait()
         ret, data, page_req_key = quote_ctx.request_history_kline(stock_code, start=start_date, end=end_date,
                                                                   ktype=ktype, max_count=max_count,
                                                                   page_req_key=page_req_key)
-        if ret == RET_OK:
-            historical_data = pd.concat([historical_data, data], ignore_index=True)
-        else:
+        if ret != RET_OK:
             print('Error:', data)
-            break
+            return None
+        pages.append(data)
+
+    return pd.concat(pages, ignore_index=True) if len(pages) > 1 else pages[0]
+
+
+def fetch_futu_data(stock_code, start_date, end_date, ktype='K_30M', max_count=500):
+    """
+    Fetch historical K-line (candlestick) data from Futu OpenAPI.
+
+    :param stock_code: The stock symbol, e.g., 'US.VOO'.
+    :param start_date: Start date for historical data in 'YYYY-MM-DD' format.
+    :param end_date: End date for historical data in 'YYYY-MM-DD' format.
+    :param ktype: The type of K-line, e.g., 'K_30M' for 30-minute data.
+    :param max_count: Maximum number of records to fetch in one request (default: 500).
+    :return: A pandas DataFrame containing historical data.
+    """
+
+    from futu import OpenQuoteContext
+    quote_ctx = OpenQuoteContext(host=FUTU_HOST, port=FUTU_PORT)
+
+    # Request historical data
+    historical_data = request_history_pages(quote_ctx, stock_code, start_date, end_date, ktype, max_count)
 
     quote_ctx.close()
 
     # Return the DataFrame
     return historical_data
 
+def fetch_futu_data_cached(stock_code, start_date, end_date, ktype='K_30M', max_count=500, cache=None, offline=False,
+                           fetch=fetch_futu_data):
+    """
+    Fetch historical K-line data through the local K-line cache.
+
+    Only the date ranges the cache does not cover yet are requested from OpenD; they are
+    merged into the cache before the requested range is returned.
+
+    :param cache: A KlineCache instance (default: KlineCache() in ./kline_cache).
+    :param offline: If True, never connect to OpenD and return only what is cached.
+    :param fetch: Function used to download missing ranges (default: fetch_futu_data).
+    :return: A pandas DataFrame in the same layout as fetch_futu_data, or None if no data is available.
+    """
+    cache = cache or KlineCache()
+    if not offline:
+        for gap_start, gap_end in cache.missing(stock_code, ktype, start_date, end_date):
+            data = fetch(stock_code, gap_start, gap_end, ktype=ktype, max_count=max_count)
+            if data is None:
+                return None
+            cache.store(stock_code, ktype, data, gap_start, gap_end)
+
+    data = cache.load(stock_code, ktype, start_date, end_date)
+    if data is None or data.empty:
+        return None
+    return data
+
+def fetch_futu_data_bulk(stock_codes, start_date, end_date, ktype='K_30M', max_count=500, num_contexts=2,
+                         max_requests=60, per_seconds=30, context_factory=None, cache=None, offline=False):
+    """
+    Fetch historical K-line data for many symbols at once.
+
+    Duplicate symbols are fetched once. Symbols are downloaded concurrently by one worker thread per
+    pooled quote context, and every page request goes through a shared rate limiter.
+
+    :param stock_codes: Iterable of stock symbols, may contain duplicates.
+    :param num_contexts: Number of pooled OpenQuoteContext connections (and worker threads).
+    :param max_requests: Maximum number of K-line requests per `per_seconds` window.
+    :param context_factory: Callable returning a new quote context (default: OpenQuoteContext to FUTU_HOST:FUTU_PORT).
+    :param cache: Optional KlineCache; if given, only ranges missing from the cache are requested.
+    :param offline: With a cache, never connect to OpenD and return only what is cached.
+    :return: A dict mapping each unique symbol to its DataFrame (None if the fetch failed).
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if cache is not None and not offline:
+        # Nothing missing from the cache: no connection is needed
+        offline = not any(cache.missing(stock_code, ktype, start_date, end_date) for stock_code in stock_codes)
+    if cache is not None and offline:
+        return {stock_code: fetch_futu_data_cached(stock_code, start_date, end_date, ktype, cache=cache, offline=True)
+                for stock_code in stock_codes}
+
+    rate_limiter = RateLimiter(max_requests, per_seconds)
+    pool = QuoteContextPool(num_contexts, context_factory)
+
+    def pooled_fetch(stock_code, start, end, ktype=ktype, max_count=max_count):
+        quote_ctx = pool.acquire()
+        try:
+            return request_history_pages(quote_ctx, stock_code, start, end, ktype, max_count, rate_limiter)
+        finally:
+            pool.release(quote_ctx)
+
+    def fetch_one(stock_code):
+        if cache is not None:
+            return fetch_futu_data_cached(stock_code, start_date, end_date, ktype, max_count, cache=cache,
+                                          fetch=pooled_fetch)
+        return pooled_fetch(stock_code, start_date, end_date)
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_contexts) as executor:
+            frames = list(executor.map(fetch_one, stock_codes))
+    finally:
+        pool.close()
+    return dict(zip(stock_codes, frames))
+
 def process_futu_data(data):
     # Extract necessary columns
-    data['Date'] = pd.to_datetime(data['time_key']).dt.date
-    data['Time'] = pd.to_datetime(data['time_key']).dt.time
+    time_key = pd.to_datetime(data['time_key'], format='%Y-%m-%d %H:%M:%S')
+    data['Date'] = time_key.dt.date
+    data['Time'] = time_key.dt.time
     data = data[['Date', 'Time', 'open', 'high', 'low', 'close']]
     data.columns = ['Date', 'Time', 'Open', 'High', 'Low', 'Close']
     return data
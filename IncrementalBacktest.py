@@ -0,0 +1,127 @@
+import os
+import bisect
+import datetime
+import numpy as np
+from TradingStrategy import MACDATRStrategy, STRATEGY_PARAMS
+from FutuBackTest import run_backtest
+from PricePanel import PricePanel
+from StateSnapshot import save_snapshot, load_snapshot
+from KlineCache import KlineCache
+from FutuFetchingData import fetch_futu_data_bulk
+
+# Nightly continuation of a long backtest. The end-of-run PortfolioManager and every stock's
+# MACDATRStrategy are kept in a StateSnapshot file together with each stock's last bar; the next
+# run loads them and only processes the bars after the last processed timestamp, appending to
+# the stored trades and equity curve. The new bars go through run_backtest's 'update' mode with
+# the loaded state, so the continued history is identical to a full rerun (verify_continuation checks it).
+
+
+def time_keys(timestamps):
+    # int64 ns timestamps as Futu time_key strings, which sort like the timestamps
+    return np.char.replace(np.datetime_as_string(np.asarray(timestamps).view('datetime64[ns]'), unit='s'), 'T', ' ').tolist()
+
+
+def continue_backtest(panel, snapshot_path, strategy_params=None, save=True):
+    """
+    Process the bars after the snapshot's last timestamp and update the snapshot.
+
+    :param panel: PricePanel with at least the new bars; earlier bars in it are skipped.
+    :param snapshot_path: State file; if it does not exist yet, the backtest starts from the panel's first bar.
+    :param strategy_params: Keyword arguments for MACDATRStrategy; must match the snapshot's strategies.
+    :param save: Write the updated state back to snapshot_path.
+    :return: (PortfolioManager with the whole history, number of new timestamps processed)
+    """
+    strategy_params = strategy_params or {}
+    if os.path.exists(snapshot_path):
+        strategies, portfolio, last_bars = load_snapshot(snapshot_path)
+    else:
+        strategies, portfolio, last_bars = {}, None, {}
+    expected = {name: getattr(MACDATRStrategy(**strategy_params), name) for name in STRATEGY_PARAMS}
+    for stock, strategy in strategies.items():
+        if {name: getattr(strategy, name) for name in STRATEGY_PARAMS} != expected:
+            raise ValueError(f"{snapshot_path} was run with other strategy parameters ({stock})")
+
+    last_time = max((time_key for time_key, _ in last_bars.values()), default=None)
+    keys = time_keys(panel.timestamps)
+    start = bisect.bisect_right(keys, last_time) if last_time is not None else 0
+    last_close = {stock: close for stock, (_, close) in last_bars.items()}
+
+    # The same loop as a full 'update' run, so the continued history is identical to a rerun;
+    # stocks new to the universe get a fresh strategy
+    portfolio = run_backtest(panel, 'update', strategy_params, (start, len(keys)),
+                             strategies=strategies, portfolio=portfolio, last_close=last_close)
+
+    # Each stock's last bar among the new ones
+    valid = panel.valid[start:]
+    if len(valid):
+        last_rows = start + len(valid) - 1 - np.argmax(valid[::-1], axis=0)
+        for j in np.flatnonzero(valid.any(axis=0)).tolist():
+            last_bars[panel.symbols[j]] = (keys[last_rows[j]], float(panel.close[last_rows[j], j]))
+
+    if save:
+        save_snapshot(snapshot_path, strategies, portfolio, last_bars)
+    return portfolio, len(keys) - start
+
+
+def verify_continuation(panel, portfolio, strategy_params=None):
+    # Rerun the whole panel from scratch and compare with a continued portfolio.
+    # Returns {"matches": bool, ...}; matching means identical trade ledgers and equity curves.
+    full = run_backtest(panel, 'update', strategy_params)
+    equity, full_equity = np.asarray(portfolio.balance_history), np.asarray(full.balance_history)
+    trades, full_trades = portfolio.trades[:portfolio.n_trades], full.trades[:full.n_trades]
+    same_length = len(equity) == len(full_equity)
+    return {
+        "matches": same_length and np.array_equal(equity, full_equity) and np.array_equal(trades, full_trades)
+                   and portfolio.symbols == full.symbols,
+        "bars": len(equity),
+        "full_rerun_bars": len(full_equity),
+        "trades": len(trades),
+        "full_rerun_trades": len(full_trades),
+        "max_equity_difference": float(np.max(np.abs(equity - full_equity))) if same_length and len(equity) else None,
+    }
+
+
+def nightly_update(stock_codes, start_date, end_date, ktype='K_60M', snapshot_path='nightly_snapshot.bin',
+                   strategy_params=None, cache=None, offline=False, verify=False):
+    """
+    Extend the stored backtest with the bars up to end_date.
+
+    Only bars from the day of the last processed timestamp onward are loaded (and downloaded, when
+    the KlineCache does not have them yet), so the cost depends on the new data, not the history.
+
+    :param start_date: First day of the backtest, used when there is no snapshot yet.
+    :param cache: A KlineCache instance (default: KlineCache() in ./kline_cache).
+    :param offline: Never connect to OpenD; use only cached bars.
+    :param verify: Also rerun the whole history from start_date and check it matches.
+    :return: (PortfolioManager, report dict)
+    """
+    cache = cache or KlineCache()
+    from_date = start_date
+    if os.path.exists(snapshot_path):
+        _, _, last_bars = load_snapshot(snapshot_path)
+        if last_bars:
+            from_date = max(time_key for time_key, _ in last_bars.values())[:10]
+
+    frames = fetch_futu_data_bulk(stock_codes, from_date, end_date, ktype, cache=cache, offline=offline)
+    frames = {stock: frame for stock, frame in frames.items() if frame is not None}
+    if not frames:
+        print('Error:', f"No {ktype} bars for {from_date} to {end_date}")
+        return None, {"new_bars": 0}
+    portfolio, new_bars = continue_backtest(PricePanel.from_frames(frames), snapshot_path, strategy_params)
+    report = {"from_date": from_date, "new_bars": new_bars, "total_bars": len(portfolio.balance_history),
+              "final_equity": float(portfolio.balance_history[-1]) if len(portfolio.balance_history) else None}
+
+    if verify:
+        history = fetch_futu_data_bulk(stock_codes, start_date, end_date, ktype, cache=cache, offline=True)
+        panel = PricePanel.from_frames({stock: frame for stock, frame in history.items() if frame is not None})
+        report.update(verify_continuation(panel, portfolio, strategy_params))
+    return portfolio, report
+
+
+if __name__ == "__main__":
+    stock_list = ['HK.00700', 'HK.00388', 'HK.02318', 'HK.00939', 'HK.01299', 'HK.00883', 'HK.00005', 'HK.00941']
+    # Run every evening: the first run backtests from 2019-10-16, later runs only add the new bars
+    portfolio, report = nightly_update(stock_list, '2019-10-16', datetime.date.today().isoformat(), 'K_60M',
+                                       verify=datetime.date.today().weekday() == 5)  # Full check on Saturdays
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,124 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from Instrumentation import profiler
+
+# Content-addressed cache of indicator arrays. An entry is keyed by symbol, a fingerprint of the
+# bars it was computed from, the indicator and its parameters, so strategy variants that only
+# change decrease_percentage, sd_multiplier or the RSI thresholds reuse every array, and a
+# variant with another rsi_length recomputes only the RSI. Entries live in a size-bounded
+# in-memory LRU and optionally in a directory on disk, which later runs and the worker
+# processes of a sweep share. Changed bars give a new fingerprint, so stale entries are never
+# read; they are just left behind on disk (clear() removes them).
+
+
+def data_fingerprint(close, high, low):
+    # Hash of the bars an indicator is computed from
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (close, high, low):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).data)
+    return digest.hexdigest()
+
+
+class IndicatorCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024, cache_dir=None):
+        # max_bytes: bound on the memory tier; least recently used arrays are dropped beyond it.
+        # cache_dir: directory of the disk tier (default: memory only).
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()  # key -> read-only array, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, name[:2], f'{name}.npy')
+
+    def get(self, key):
+        # The cached array for key, or None
+        values = self.entries.get(key)
+        if values is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return values
+        if self.cache_dir is not None:
+            path = self.path(key)
+            if os.path.exists(path):
+                try:
+                    values = np.load(path)
+                except (OSError, ValueError):
+                    values = None  # Unreadable file: recompute and overwrite it
+                if values is not None:
+                    self.disk_hits += 1
+                    return self.remember(key, values)
+        self.misses += 1
+        return None
+
+    def put(self, key, values, persist=True):
+        values = self.remember(key, np.asarray(values))
+        if persist and self.cache_dir is not None:
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique temporary name, so sweep workers writing the same entry do not collide
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(temp_path, path)
+        return values
+
+    def remember(self, key, values):
+        # Add to the memory tier and evict least recently used arrays beyond max_bytes
+        values.setflags(write=False)
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key).nbytes
+        self.entries[key] = values
+        self.nbytes += values.nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+            self.evictions += 1
+        return values
+
+    def indicators(self, symbol, strategy, close, high, low, fingerprint=None):
+        # strategy.calculate_indicators(close, high, low), computing only the arrays not cached yet
+        fingerprint = fingerprint or data_fingerprint(close, high, low)
+        indicators = {}
+        for name, params in strategy.indicator_params().items():
+            key = (symbol, fingerprint, name, params)
+            values = self.get(key)
+            if values is None:
+                with profiler.phase('indicators'):
+                    values = self.put(key, strategy.calculate_indicator(name, close, high, low))
+                if profiler.enabled:
+                    profiler.count('indicator_cache_misses')
+            indicators[name] = values
+        return indicators
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "megabytes": self.nbytes / 1e6,
+        }
+
+    def clear(self, disk=False):
+        # Empty the memory tier, and with disk=True delete the disk tier's files as well
+        self.entries.clear()
+        self.nbytes = 0
+        if disk and self.cache_dir is not None:
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if name.endswith('.npy'):
+                        os.remove(os.path.join(root, name))
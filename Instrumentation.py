@@ -0,0 +1,102 @@
+import json
+import time
+from contextlib import nullcontext
+
+
+class Profiler:
+    # Low-overhead phase timers and event counters for the backtest hot path.
+    # Phases nest: a phase's time is recorded under its full stack path ("backtest;portfolio"),
+    # which is also the layout of collapsed-stack flamegraph files. Call sites time a block with
+    # `with profiler.phase(name):`, which pops the phase even when the block raises; a disabled
+    # profiler hands back a shared no-op context, so it costs one method call per site.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.timers = {}  # stack path -> [total nanoseconds, calls]
+        self.counters = {}
+        self.stack = []
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def push(self, name):
+        self.stack.append((name, time.perf_counter_ns()))
+
+    def pop(self):
+        end = time.perf_counter_ns()
+        name, start = self.stack.pop()
+        path = ';'.join([frame[0] for frame in self.stack] + [name])
+        timer = self.timers.get(path)
+        if timer is None:
+            self.timers[path] = [end - start, 1]
+        else:
+            timer[0] += end - start
+            timer[1] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def self_times(self):
+        # Nanoseconds spent in each path excluding its child phases
+        own = {path: timer[0] for path, timer in self.timers.items()}
+        for path, timer in self.timers.items():
+            parent = path.rpartition(';')[0]
+            if parent in own:
+                own[parent] -= timer[0]
+        return own
+
+    def report(self):
+        own = self.self_times()
+        return {
+            "phases": {path: {"seconds": timer[0] / 1e9, "self_seconds": own[path] / 1e9, "calls": timer[1]}
+                       for path, timer in sorted(self.timers.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def to_json(self, path=None):
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+    def to_collapsed(self, path=None):
+        # Collapsed stacks ("a;b <microseconds>" per line) for flamegraph.pl, speedscope and similar tools
+        text = '\n'.join(f"{stack} {max(ns, 0) // 1000}" for stack, ns in sorted(self.self_times().items())) + '\n'
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+class _Phase:
+    # Context manager returned by Profiler.phase
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.push(self.name)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.pop()
+        return False
+
+
+_NO_PHASE = nullcontext()
+
+
+# Shared by MACDATRStrategy and the backtest; call profiler.enable() before a run to collect data
+profiler = Profiler()
@@ -0,0 +1,154 @@
+import os
+import glob
+import datetime
+import numpy as np
+import pandas as pd
+
+# Numeric K-line columns kept in the cache (time_key is stored separately as int64 nanoseconds)
+CACHE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'turnover']
+
+
+def to_ordinal(date):
+    return datetime.date.fromisoformat(str(date)[:10]).toordinal()
+
+
+def from_ordinal(ordinal):
+    return datetime.date.fromordinal(int(ordinal)).isoformat()
+
+
+def merge_ranges(ranges):
+    # Union of inclusive [start, end] day-ordinal ranges; touching ranges are joined
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def missing_ranges(covered, start, end):
+    # Parts of the inclusive [start, end] day range not inside any covered range
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in merge_ranges(covered):
+        if covered_end < cursor:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start - 1))
+        cursor = covered_end + 1
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class KlineCache:
+    # Persistent local store of K-lines, one directory per (ktype, symbol).
+    # Each fetch that fills a gap is written as a new segment file: an uncompressed
+    # .npz holding one array per column plus the day range it covers. Loading reads
+    # and merges the segments; compact() rewrites them into a single segment.
+    def __init__(self, cache_dir='kline_cache'):
+        self.cache_dir = cache_dir
+
+    def entry_dir(self, stock_code, ktype):
+        return os.path.join(self.cache_dir, ktype, stock_code)
+
+    def segment_paths(self, stock_code, ktype):
+        # Only complete segments (seg_NNNNNN.npz); files left behind by older interrupted writes are skipped
+        paths = glob.glob(os.path.join(self.entry_dir(stock_code, ktype), 'seg_*.npz'))
+        return sorted(path for path in paths if os.path.basename(path)[4:-4].isdigit())
+
+    def read_entry(self, stock_code, ktype):
+        # Returns (columns, covered ranges) with columns sorted by time and de-duplicated
+        parts = []
+        covered = []
+        for path in self.segment_paths(stock_code, ktype):
+            with np.load(path) as segment:
+                parts.append({name: segment[name] for name in segment.files if name != 'covered'})
+                covered.extend(map(tuple, segment['covered'].tolist()))
+        if not parts:
+            return None, []
+
+        names = [name for name in parts[0] if all(name in part for part in parts)]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in names}
+        # Later segments win for bars fetched more than once (e.g. a bar that was still forming)
+        reversed_time = columns['time'][::-1]
+        _, first = np.unique(reversed_time, return_index=True)
+        keep = len(reversed_time) - 1 - first
+        columns = {name: values[keep] for name, values in columns.items()}
+        return columns, merge_ranges(covered)
+
+    def write_segment(self, stock_code, ktype, columns, covered):
+        entry_dir = self.entry_dir(stock_code, ktype)
+        os.makedirs(entry_dir, exist_ok=True)
+        existing = self.segment_paths(stock_code, ktype)
+        number = int(os.path.basename(existing[-1])[4:-4]) + 1 if existing else 0
+        path = os.path.join(entry_dir, f'seg_{number:06d}.npz')
+        # Written under a name segment_paths does not match, so a crash never leaves a half-written segment
+        tmp_path = os.path.join(entry_dir, f'.tmp_seg_{number:06d}.npz')
+        np.savez(tmp_path, covered=np.array(covered, dtype=np.int64).reshape(-1, 2), **columns)
+        os.replace(tmp_path, path)
+
+    def read_covered(self, stock_code, ktype):
+        # Covered day ranges only: .npz members are read lazily, so the bars are never loaded
+        covered = []
+        for path in self.segment_paths(stock_code, ktype):
+            with np.load(path) as segment:
+                covered.extend(map(tuple, segment['covered'].tolist()))
+        return merge_ranges(covered)
+
+    def missing(self, stock_code, ktype, start_date, end_date):
+        # Date ranges ('YYYY-MM-DD' pairs) that still have to be requested
+        covered = self.read_covered(stock_code, ktype)
+        return [(from_ordinal(a), from_ordinal(b))
+                for a, b in missing_ranges(covered, to_ordinal(start_date), to_ordinal(end_date))]
+
+    def store(self, stock_code, ktype, data, start_date, end_date):
+        # Add freshly fetched Futu K-lines covering [start_date, end_date].
+        # Today's bars may still be forming, so coverage stops at yesterday.
+        last_complete = min(to_ordinal(end_date), datetime.date.today().toordinal() - 1)
+        covered = [(to_ordinal(start_date), last_complete)] if last_complete >= to_ordinal(start_date) else []
+        columns = {'time': pd.to_datetime(data['time_key']).to_numpy().astype('datetime64[ns]').astype(np.int64)}
+        for name in CACHE_COLUMNS:
+            if name in data:
+                columns[name] = data[name].to_numpy(dtype=float)
+        self.write_segment(stock_code, ktype, columns, covered)
+
+    def load(self, stock_code, ktype, start_date, end_date):
+        # Cached bars between start_date and end_date (inclusive) in Futu's DataFrame layout
+        columns, _ = self.read_entry(stock_code, ktype)
+        if columns is None:
+            return None
+        day = columns['time'] // (86400 * 10**9) + datetime.date(1970, 1, 1).toordinal()
+        mask = (day >= to_ordinal(start_date)) & (day <= to_ordinal(end_date))
+
+        time_key = np.datetime_as_string(columns['time'][mask].view('datetime64[ns]'), unit='s')
+        data = pd.DataFrame({'code': stock_code, 'time_key': np.char.replace(time_key, 'T', ' ')})
+        for name in CACHE_COLUMNS:
+            if name in columns:
+                data[name] = columns[name][mask]
+        return data
+
+    def invalidate(self, stock_code=None, ktype=None):
+        # Delete cached segments for one symbol, one ktype, or everything
+        pattern = os.path.join(self.cache_dir, ktype or '*', stock_code or '*', 'seg_*.npz')
+        for path in glob.glob(pattern):
+            os.remove(path)
+
+    def compact(self, stock_code=None, ktype=None):
+        # Merge each entry's segments into one, dropping duplicate bars
+        pattern = os.path.join(self.cache_dir, ktype or '*', stock_code or '*')
+        for entry_dir in glob.glob(pattern):
+            entry_ktype = os.path.basename(os.path.dirname(entry_dir))
+            entry_code = os.path.basename(entry_dir)
+            old_segments = self.segment_paths(entry_code, entry_ktype)
+            if len(old_segments) <= 1:
+                continue
+            columns, covered = self.read_entry(entry_code, entry_ktype)
+            self.write_segment(entry_code, entry_ktype, columns, covered)
+            for path in old_segments:
+                os.remove(path)
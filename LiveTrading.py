@@ -0,0 +1,358 @@
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+import numpy as np
+import pandas as pd
+from TradingStrategy import MACDATRStrategy
+from FutuBackTest import PortfolioManager
+from FutuFetchingData import FUTU_HOST, FUTU_PORT
+from StateSnapshot import save_snapshot, load_snapshot
+from TriggerIndex import TriggerIndex
+
+# Live trading on pushed K-lines. A quote source pushes bar updates (dicts with code, time_key,
+# open, high, low, close) into LiveEngine.push; the engine routes each finished bar to that
+# stock's MACDATRStrategy and sends the resulting orders through a Broker. Sources await push,
+# so when the strategy falls behind the bounded bar queue fills up and slows the source down
+# instead of growing without bound. futu is only imported by the OpenD classes (FutuBroker,
+# FutuQuoteSource), so paper trading and replays run without it.
+
+PUSH_COLUMNS = ['code', 'time_key', 'open', 'high', 'low', 'close']
+
+
+class Broker(ABC):
+    # Order routing interface used by LiveEngine. place_order returns the fill as
+    # {'price': ..., 'shares': ...}, or None if the order was rejected.
+    @abstractmethod
+    async def place_order(self, symbol, side, price, shares):
+        pass
+
+    async def close(self):
+        pass
+
+
+class PaperBroker(Broker):
+    # Fills every order at the requested price after `latency` seconds and keeps a log of the orders
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.orders = []
+
+    async def place_order(self, symbol, side, price, shares):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.orders.append((symbol, side, price, shares))
+        return {'price': price, 'shares': shares}
+
+
+class FutuBroker(Broker):
+    # Limit orders through an OpenD trade context (the simulated account by default). The blocking
+    # futu calls run on the default thread pool; an accepted order is treated as filled at its limit price.
+    # trd_env and trd_market default to TrdEnv.SIMULATE and TrdMarket.HK.
+    def __init__(self, trd_env=None, host=FUTU_HOST, port=FUTU_PORT, trd_market=None):
+        from futu import OpenSecTradeContext, TrdEnv, TrdMarket
+        self.trd_env = trd_env or TrdEnv.SIMULATE
+        self.trade_ctx = OpenSecTradeContext(filter_trdmarket=trd_market or TrdMarket.HK, host=host, port=port)
+
+    async def place_order(self, symbol, side, price, shares):
+        from futu import TrdSide, OrderType, RET_OK
+        trd_side = TrdSide.BUY if side == 'Buy' else TrdSide.SELL
+        ret, data = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.trade_ctx.place_order(price=price, qty=shares, code=symbol, trd_side=trd_side,
+                                                     order_type=OrderType.NORMAL, trd_env=self.trd_env))
+        if ret != RET_OK:
+            print('Error:', data)
+            return None
+        return {'price': price, 'shares': shares, 'order_id': data['order_id'].iloc[0]}
+
+    async def close(self):
+        self.trade_ctx.close()
+
+
+def kline_push_handler(callback):
+    # A futu K-line push handler that hands every pushed row to `callback` (called on OpenD's push thread)
+    from futu import CurKlineHandlerBase, RET_OK
+
+    class KlinePushHandler(CurKlineHandlerBase):
+        def on_recv_rsp(self, rsp_pb):
+            ret, data = super().on_recv_rsp(rsp_pb)
+            if ret != RET_OK:
+                print('Error:', data)
+                return ret, data
+            for row in data[PUSH_COLUMNS].to_dict('records'):
+                callback(row)
+            return ret, data
+
+    return KlinePushHandler()
+
+
+class FutuQuoteSource:
+    # Pushed K-lines from OpenD. The push thread blocks until the engine accepted each row,
+    # which is how the engine's backpressure reaches OpenD.
+    def __init__(self, ktype='K_60M', host=FUTU_HOST, port=FUTU_PORT):
+        self.ktype = ktype
+        self.host = host
+        self.port = port
+        self.stopped = None
+
+    async def run(self, symbols, push):
+        from futu import OpenQuoteContext, RET_OK
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        quote_ctx = OpenQuoteContext(host=self.host, port=self.port)
+        try:
+            quote_ctx.set_handler(kline_push_handler(lambda row: asyncio.run_coroutine_threadsafe(push(row), loop).result()))
+            ret, data = quote_ctx.subscribe(symbols, [self.ktype], subscribe_push=True)
+            if ret != RET_OK:
+                print('Error:', data)
+                return
+            await self.stopped.wait()
+        finally:
+            quote_ctx.close()
+
+    def stop(self):
+        if self.stopped is not None:
+            self.stopped.set()
+
+
+class FakeQuoteServer:
+    # In-process stand-in for OpenD's K-line push, for testing the engine end to end without OpenD.
+    # Replays {stock: DataFrame} (fetch_futu_data layout) in time order. Each bar is pushed as
+    # updates_per_bar updates like a forming live bar (the last one is the finished bar), and the
+    # server sleeps `interval` seconds between timestamps.
+    def __init__(self, frames, interval=0.0, updates_per_bar=1):
+        self.frames = frames
+        self.interval = interval
+        self.updates_per_bar = updates_per_bar
+        self.stopped = False
+
+    async def run(self, symbols, push):
+        bars = pd.concat([self.frames[symbol][PUSH_COLUMNS].assign(code=symbol) for symbol in symbols if symbol in self.frames])
+        bars = bars.sort_values('time_key', kind='stable')
+        current_time = None
+        for row in bars.to_dict('records'):
+            if self.stopped:
+                break
+            if row['time_key'] != current_time:
+                current_time = row['time_key']
+                await asyncio.sleep(self.interval)
+            for update in range(1, self.updates_per_bar):
+                # The bar so far: close moves from open towards the final close
+                close = row['open'] + (row['close'] - row['open']) * update / self.updates_per_bar
+                await push({**row, 'high': max(row['open'], close), 'low': min(row['open'], close), 'close': close})
+            await push(row)
+
+    def stop(self):
+        self.stopped = True
+
+
+class LiveEngine:
+    def __init__(self, symbols, broker, portfolio=None, strategy_params=None, latency_budget=0.05, max_queue=1000,
+                 latency_samples=10000, intrabar_exits=False):
+        # latency_budget: seconds from a bar finishing to its order going out (None: no limit).
+        # Indicators are still updated for late bars, but their Buy signals are not traded (stale_signals);
+        # Sells are always executed.
+        # max_queue: finished bars waiting for the strategy before push starts blocking the source.
+        # latency_samples: number of recent latencies kept for the percentiles.
+        # intrabar_exits: also check every pushed update, including forming bars, against the open
+        # positions' stops and targets (through a TriggerIndex) and exit as soon as one is crossed,
+        # instead of when the strategy sees the finished bar.
+        self.broker = broker
+        self.portfolio = portfolio or PortfolioManager(initial_balance=100000, keep_history=False)
+        strategy_params = strategy_params or {}
+        self.strategies = {symbol: MACDATRStrategy(incremental=True, **strategy_params) for symbol in symbols}
+        self.latency_budget = latency_budget
+        self.max_queue = max_queue
+        self.queue = None
+        self.source = None
+        self.triggers = TriggerIndex() if intrabar_exits else None
+
+        self.pending = {}  # symbol -> latest update of its forming bar
+        self.last_close = {}
+        self.last_time = {}  # symbol -> time_key of the last bar processed; older bars are ignored
+        self.current_time = None
+        self.marked_time = None  # Last timestamp recorded in the portfolio
+
+        self.decision_latencies = deque(maxlen=latency_samples)  # bar finished -> strategy decided, every bar
+        self.order_latencies = deque(maxlen=latency_samples)  # bar finished -> order filled
+        self.counters = {'bars': 0, 'orders': 0, 'rejected_orders': 0, 'stale_signals': 0, 'budget_overruns': 0,
+                         'backpressure_waits': 0, 'intrabar_exits': 0, 'errors': 0}
+
+    async def push(self, row):
+        # Called by the quote source for every update. A bar is finished once the next bar of the
+        # same stock starts, or when the source ends.
+        symbol = row['code']
+        if symbol not in self.strategies or row['time_key'] <= self.last_time.get(symbol, ''):
+            return
+        pending = self.pending.get(symbol)
+        self.pending[symbol] = row
+        if pending is not None and pending['time_key'] != row['time_key']:
+            await self.enqueue(pending)
+        if self.triggers is not None:
+            exits = self.triggers.check(symbol, row['low'], row['high'])
+            if exits:
+                # Exits go through the queue too, so the portfolio only changes in bar order: the
+                # earlier bars of every stock are finished once this one's bar has moved on, so
+                # they are queued (and traded and marked to market) before the exit
+                for other, bar in list(self.pending.items()):
+                    if bar['time_key'] < row['time_key']:
+                        del self.pending[other]
+                        await self.enqueue(bar)
+            for _, _, level in exits:
+                await self.enqueue({'code': symbol, 'time_key': row['time_key'], 'exit_price': level})
+
+    async def enqueue(self, bar):
+        if self.queue.full():
+            self.counters['backpressure_waits'] += 1
+        await self.queue.put((bar, time.perf_counter()))
+
+    async def consume(self):
+        while True:
+            bar, finished = await self.queue.get()
+            try:
+                await self.process(bar, finished)
+            except Exception as e:
+                self.counters['errors'] += 1
+                print('Error:', e)
+            finally:
+                self.queue.task_done()
+
+    async def process(self, bar, finished):
+        symbol = bar['code']
+        # All bars of the previous timestamp are in: mark the portfolio to market
+        if self.current_time is not None and bar['time_key'] != self.current_time and self.marked_time != self.current_time:
+            self.mark_to_market()
+        if 'exit_price' in bar:
+            await self.exit_position(symbol, bar['exit_price'], finished)
+            return
+        self.current_time = bar['time_key']
+        self.last_close[symbol] = bar['close']
+        self.last_time[symbol] = bar['time_key']
+        self.counters['bars'] += 1
+
+        signal = self.strategies[symbol].update(bar['close'], bar['high'], bar['low'])
+        decided = time.perf_counter()
+        self.decision_latencies.append(decided - finished)
+        if self.latency_budget is not None and decided - finished > self.latency_budget:
+            self.counters['budget_overruns'] += 1
+            # A late Buy is dropped, but a late Sell still goes out: the strategy is already flat,
+            # so skipping it would leave the position open with nothing left to close it
+            if signal is not None and signal['signal'] == "Buy":
+                self.counters['stale_signals'] += 1
+                return
+        if signal is None:
+            return
+
+        portfolio = self.portfolio
+        if signal['signal'] == "Buy" and portfolio.can_buy(symbol):
+            fill = await self.broker.place_order(symbol, 'Buy', signal['buy_price'], portfolio.position_size(signal['buy_price']))
+            self.record_order(fill, finished)
+            if fill is not None:
+                portfolio.buy_stock(symbol, fill['price'], signal['stop_loss_price'], signal['stop_profit_target'], fill['shares'])
+                if self.triggers is not None:
+                    self.triggers.add(symbol, symbol, signal['stop_loss_price'], signal['stop_profit_target'])
+
+        if signal['signal'] == "Sell" and symbol in portfolio.positions:
+            fill = await self.broker.place_order(symbol, 'Sell', signal['sell_price'], portfolio.positions[symbol]['num_shares'])
+            self.record_order(fill, finished)
+            if fill is not None:
+                portfolio.sell_stock(symbol, fill['price'])
+                if self.triggers is not None:
+                    self.triggers.remove(symbol)
+
+    async def exit_position(self, symbol, price, finished):
+        # A pushed update crossed the position's stop or target: sell at that level. The strategy
+        # sees the crossing in the finished bar later and emits its own Sell, which finds no position.
+        position = self.portfolio.positions.get(symbol)
+        if position is None:
+            return
+        fill = await self.broker.place_order(symbol, 'Sell', price, position['num_shares'])
+        self.record_order(fill, finished)
+        if fill is None:
+            # Keep watching the levels
+            self.triggers.add(symbol, symbol, position['stop_loss_price'], position['stop_profit_target'])
+            return
+        self.counters['intrabar_exits'] += 1
+        self.portfolio.sell_stock(symbol, fill['price'])
+
+    def record_order(self, fill, finished):
+        if fill is None:
+            self.counters['rejected_orders'] += 1
+            return
+        self.counters['orders'] += 1
+        self.order_latencies.append(time.perf_counter() - finished)
+
+    def mark_to_market(self):
+        # Open positions are valued at the stock's last close
+        portfolio_value = self.portfolio.account_balance
+        for stock_symbol, details in self.portfolio.positions.items():
+            portfolio_value += details['num_shares'] * self.last_close[stock_symbol]
+        self.portfolio.record_balance(portfolio_value)
+        self.marked_time = self.current_time
+
+    def save_snapshot(self, path):
+        # Call between runs (or from the engine's own loop) so no bar is half processed
+        last_bars = {stock: (time_key, self.last_close[stock]) for stock, time_key in self.last_time.items()}
+        save_snapshot(path, self.strategies, self.portfolio, last_bars)
+
+    def restore(self, path):
+        # Continue from a snapshot: warmed-up strategies and portfolio; bars up to each stock's
+        # snapshot time are skipped, so the source only has to deliver the bars after it
+        strategies, portfolio, last_bars = load_snapshot(path)
+        self.strategies.update(strategies)
+        if portfolio is not None:
+            self.portfolio = portfolio
+        for stock, (time_key, close) in last_bars.items():
+            self.last_time[stock] = time_key
+            self.last_close[stock] = close
+        if last_bars:
+            # Snapshots are taken after run() marked the last timestamp to market
+            self.current_time = self.marked_time = max(self.last_time.values())
+        if self.triggers is not None:
+            self.triggers = TriggerIndex()
+            for stock, details in self.portfolio.positions.items():
+                self.triggers.add(stock, stock, details['stop_loss_price'], details['stop_profit_target'])
+
+    async def run(self, source):
+        # Trade until the source ends (or stop() is called), then return report()
+        self.queue = asyncio.Queue(self.max_queue)
+        self.source = source
+        worker = asyncio.create_task(self.consume())
+        try:
+            await source.run(list(self.strategies), self.push)
+            # The source is done, so the forming bars are final
+            for bar in self.pending.values():
+                await self.enqueue(bar)
+            self.pending = {}
+            await self.queue.join()
+            if self.current_time is not None and self.marked_time != self.current_time:
+                self.mark_to_market()
+        finally:
+            worker.cancel()
+            await self.broker.close()
+        return self.report()
+
+    def stop(self):
+        if self.source is not None:
+            self.source.stop()
+
+    def report(self):
+        # Counters plus decision and bar-to-order latency percentiles in milliseconds
+        report = dict(self.counters)
+        for name, latencies in [('decision', self.decision_latencies), ('bar_to_order', self.order_latencies)]:
+            values = np.array(latencies) * 1000
+            for q in (50, 90, 99):
+                report[f'{name}_p{q}_ms'] = float(np.percentile(values, q)) if len(values) else None
+            report[f'{name}_max_ms'] = float(values.max()) if len(values) else None
+        report['equity'] = self.portfolio.metrics.snapshot().equity
+        return report
+
+
+if __name__ == "__main__":
+    # End-to-end run against the in-process fake server on synthetic prices; no OpenD needed.
+    # For live trading: asyncio.run(engine.run(FutuQuoteSource('K_60M'))) with broker=FutuBroker().
+    from Benchmark import synthetic_frames
+    frames = synthetic_frames(20, 2000)
+    engine = LiveEngine(list(frames), PaperBroker(latency=0.001))
+    report = asyncio.run(engine.run(FakeQuoteServer(frames, updates_per_bar=3)))
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,153 @@
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+from PricePanel import PricePanel
+from LiveTrading import LiveEngine, PaperBroker
+
+# Market-data replay for load-testing the live stack. ReplayFeed serves recorded or cached
+# K-lines through the same interface as FutuQuoteSource (run(symbols, push) / stop()), paced
+# at a speed multiplier of the bar cadence. load_test finds the universe size at which
+# LiveEngine (per-bar MACDATRStrategy.update plus the portfolio) stops keeping up.
+
+
+class ReplayFeed:
+    def __init__(self, panel, speed=1.0, bar_seconds=None, lag_samples=100000):
+        # panel: PricePanel of the bars to replay.
+        # speed: multiple of real time (1 = real time, 100 = 100x); None replays as fast as possible.
+        # bar_seconds: wall time between timestamps at 1x (default: the panel's median bar spacing).
+        # Gaps in the data (lunch break, overnight) are replayed as one bar interval.
+        self.panel = panel
+        self.speed = speed
+        if bar_seconds is None:
+            gaps = np.diff(panel.timestamps)
+            bar_seconds = float(np.median(gaps)) / 1e9 if len(gaps) else 60.0
+        self.bar_seconds = bar_seconds
+        self.lags = np.zeros(min(max(len(panel.timestamps), 1), lag_samples))
+        self.stopped = False
+        self.stats = {}
+
+    @classmethod
+    def from_frames(cls, frames, **kwargs):
+        # Replay {stock: DataFrame} in fetch_futu_data's layout
+        return cls(PricePanel.from_frames(frames), **kwargs)
+
+    @classmethod
+    def from_cache(cls, cache, stock_codes, ktype, start_date, end_date, **kwargs):
+        # Replay what a KlineCache holds for these stocks; stocks without cached bars are left out
+        frames = {stock_code: cache.load(stock_code, ktype, start_date, end_date) for stock_code in stock_codes}
+        return cls.from_frames({stock_code: frame for stock_code, frame in frames.items() if frame is not None}, **kwargs)
+
+    async def run(self, symbols, push):
+        panel = self.panel
+        columns = [panel.symbol_index[symbol] for symbol in symbols if symbol in panel.symbol_index]
+        codes = [panel.symbols[j] for j in columns]
+        time_keys = np.char.replace(np.datetime_as_string(panel.timestamps.view('datetime64[ns]'), unit='s'), 'T', ' ').tolist()
+        interval = self.bar_seconds / self.speed if self.speed else None
+
+        bars = 0
+        n_lags = 0
+        start = time.perf_counter()
+        for i, time_key in enumerate(time_keys):
+            if self.stopped:
+                break
+            if interval is not None:
+                scheduled = start + i * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # Fan the timestamp out to every stock that has a bar
+            open_prices, highs = panel.open[i, columns].tolist(), panel.high[i, columns].tolist()
+            lows, closes = panel.low[i, columns].tolist(), panel.close[i, columns].tolist()
+            for code, open_price, high, low, close in zip(codes, open_prices, highs, lows, closes):
+                if close != close:  # NaN: no bar
+                    continue
+                await push({'code': code, 'time_key': time_key, 'open': open_price, 'high': high, 'low': low, 'close': close})
+                bars += 1
+
+            # Lag: how long after its slot the timestamp was fully pushed (the engine's backpressure
+            # holds push up when it falls behind)
+            if interval is not None:
+                self.lags[n_lags % len(self.lags)] = max(time.perf_counter() - scheduled - interval, 0.0)
+            n_lags += 1
+
+        elapsed = time.perf_counter() - start
+        lags = self.lags[:min(n_lags, len(self.lags))] * 1000 if interval is not None else np.array([])
+        self.stats = {
+            "symbols": len(columns),
+            "timestamps": n_lags,
+            "bars": bars,
+            "seconds": elapsed,
+            "bars_per_sec": bars / elapsed if elapsed > 0 else None,
+            "late_timestamps": int(np.count_nonzero(lags)),
+            "lag_p50_ms": float(np.percentile(lags, 50)) if len(lags) else None,
+            "lag_p99_ms": float(np.percentile(lags, 99)) if len(lags) else None,
+            "lag_max_ms": float(lags.max()) if len(lags) else None,
+        }
+
+    def stop(self):
+        self.stopped = True
+
+
+def load_test(symbol_counts, n_bars=390, bar_seconds=60, speed=None, max_queue=1000, seed=0):
+    """
+    Replay synthetic K-lines through LiveEngine for growing universes.
+
+    :param symbol_counts: Universe sizes to test.
+    :param n_bars: Bars per symbol (390 = one US session of K_1M, 330 = one HKEX day).
+    :param bar_seconds: Bar cadence to keep up with (60 for K_1M).
+    :param speed: Replay speed multiplier; None replays as fast as possible and only measures throughput.
+    :return: A pandas DataFrame with one row per universe size. Paced runs keep up when no timestamp
+        was late. Unpaced runs measure seconds_per_timestamp, the time to process one bar of every
+        symbol; they keep up when that fits in one bar_seconds, and max_symbols estimates the largest
+        universe that still would.
+    """
+    from Benchmark import synthetic_frames
+    rows = []
+    for n_symbols in symbol_counts:
+        panel = PricePanel.from_frames(synthetic_frames(n_symbols, n_bars, seed=seed, freq=f'{bar_seconds}s'))
+        feed = ReplayFeed(panel, speed=speed, bar_seconds=bar_seconds)
+        engine = LiveEngine(panel.symbols, PaperBroker(), latency_budget=None, max_queue=max_queue)
+        start = time.perf_counter()
+        report = asyncio.run(engine.run(feed))
+        elapsed = time.perf_counter() - start  # Includes draining the engine's queue
+
+        seconds_per_timestamp = elapsed / max(feed.stats["timestamps"], 1)
+        if speed:
+            keeps_up, max_symbols = feed.stats["late_timestamps"] == 0, None
+        else:
+            keeps_up = seconds_per_timestamp <= bar_seconds
+            max_symbols = int(n_symbols * bar_seconds / seconds_per_timestamp)
+        rows.append({
+            **feed.stats,
+            "bars_per_sec": feed.stats["bars"] / elapsed,
+            "seconds_per_timestamp": seconds_per_timestamp,
+            "keeps_up": keeps_up,
+            "max_symbols": max_symbols,
+            "decision_p99_ms": report["decision_p99_ms"],
+            "engine_errors": report["errors"],
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the live engine with replayed synthetic K-lines.")
+    parser.add_argument('--symbols', type=int, nargs='+', default=[100, 500, 1000, 2000], help="Universe sizes")
+    parser.add_argument('--bars', type=int, default=390, help="Bars per symbol")
+    parser.add_argument('--bar-seconds', type=int, default=60, help="Bar cadence in seconds (60 = K_1M)")
+    parser.add_argument('--speed', type=float, default=0, help="Replay speed multiplier (0 = as fast as possible)")
+    parser.add_argument('--output', help="Optional CSV file for the results")
+    args = parser.parse_args(argv)
+
+    results = load_test(args.symbols, args.bars, args.bar_seconds, args.speed or None)
+    print(results.to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    return 0 if results["keeps_up"].all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
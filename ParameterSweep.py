@@ -0,0 +1,118 @@
+import io
+import os
+import itertools
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from FutuBackTest import run_backtest
+from PricePanel import PricePanel, PANEL_FIELDS
+from IndicatorCache import IndicatorCache
+from ResultStore import ResultStore, panel_fingerprint
+
+# Parameter sweeps over MACDATRStrategy's tunables. The price panel is copied once into a
+# shared memory block; worker processes map it instead of receiving a pickled copy per run.
+
+
+def grid_search_params(param_grid):
+    # Every combination of {name: [values]}
+    names = list(param_grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(param_grid[name] for name in names))]
+
+
+def random_search_params(param_space, n_samples, seed=0):
+    # n_samples random parameter sets. Each entry of param_space is a list of choices or a
+    # (low, high) range; ranges with int bounds draw ints (inclusive), otherwise floats.
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(n_samples):
+        params = {}
+        for name, space in param_space.items():
+            if isinstance(space, tuple):
+                low, high = space
+                if isinstance(low, int) and isinstance(high, int):
+                    params[name] = int(rng.integers(low, high + 1))
+                else:
+                    params[name] = float(rng.uniform(low, high))
+            else:
+                params[name] = space[rng.integers(len(space))]
+        samples.append(params)
+    return samples
+
+
+def share_panel(panel):
+    # Copy the panel's OHLC arrays into one shared memory block of shape (4, bars, symbols)
+    shape = (len(PANEL_FIELDS),) + panel.close.shape
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    for k, field in enumerate(PANEL_FIELDS):
+        block[k] = getattr(panel, field)
+    return shm, (shm.name, shape, panel.symbols, panel.timestamps)
+
+
+def attach_panel(panel_info):
+    # Build a PricePanel view over a shared memory block created by share_panel
+    name, shape, symbols, timestamps = panel_info
+    shm = shared_memory.SharedMemory(name=name)
+    block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    return shm, PricePanel(symbols, timestamps, *block)
+
+
+_worker_panel = None
+_worker_shm = None
+_indicator_cache = None
+_result_store = None
+_fingerprint = None
+
+
+def _init_worker(panel_info, cache_dir=None, store_dir=None, fingerprint=None):
+    global _worker_panel, _worker_shm, _indicator_cache, _result_store, _fingerprint
+    _worker_shm, _worker_panel = attach_panel(panel_info)
+    # Parameter sets that share indicator periods reuse the arrays within a worker, and through
+    # cache_dir across workers and later sweeps
+    _indicator_cache = IndicatorCache(cache_dir=cache_dir)
+    if store_dir is not None:
+        _result_store = ResultStore(store_dir)
+        _fingerprint = fingerprint
+
+
+def _run_one(args):
+    params, mode = args
+    # Keep the workers quiet; a sweep only needs the numbers
+    with contextlib.redirect_stdout(io.StringIO()):
+        portfolio = run_backtest(_worker_panel, mode, params, indicator_cache=_indicator_cache)
+    row = {**params, **portfolio.get_summary()}
+    if _result_store is not None:
+        row['run_id'] = _result_store.save(portfolio, params, symbols=_worker_panel.symbols, fingerprint=_fingerprint,
+                                           mode=mode, label='sweep')
+    return row
+
+
+def run_sweep(panel, param_sets, mode='precomputed', max_workers=None, chunksize=None, cache_dir=None, store_dir=None):
+    """
+    Backtest every parameter set on a process pool and collect the results.
+
+    :param panel: A PricePanel (or {stock: DataFrame}) shared with the workers.
+    :param param_sets: List of MACDATRStrategy keyword dicts, e.g. from grid_search_params.
+    :param mode: Backtest mode passed to run_backtest.
+    :param max_workers: Number of worker processes (default: os.cpu_count()).
+    :param cache_dir: Optional IndicatorCache directory shared by the workers and later sweeps.
+    :param store_dir: Optional ResultStore directory; every run is recorded there and its row gets a run_id.
+    :return: A pandas DataFrame with one row per parameter set: the parameters plus PortfolioManager.get_summary().
+    """
+    if not isinstance(panel, PricePanel):
+        panel = PricePanel.from_frames(panel)
+    max_workers = max_workers or os.cpu_count()
+    chunksize = chunksize or max(1, len(param_sets) // (max_workers * 4))
+
+    # Hashed once here rather than by every worker
+    fingerprint = panel_fingerprint(panel) if store_dir is not None else None
+    shm, panel_info = share_panel(panel)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(panel_info, cache_dir, store_dir, fingerprint)) as executor:
+            rows = list(executor.map(_run_one, [(params, mode) for params in param_sets], chunksize=chunksize))
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(rows)
@@ -0,0 +1,79 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+PANEL_FIELDS = ['open', 'high', 'low', 'close']
+
+
+def frame_timestamps(frame):
+    # int64 nanosecond timestamps of a raw Futu frame (time_key) or a processed one (Date + Time)
+    if 'time_key' in frame:
+        times = pd.to_datetime(frame['time_key'], format='%Y-%m-%d %H:%M:%S')
+    else:
+        times = pd.to_datetime(frame['Date'].astype(str) + ' ' + frame['Time'].astype(str), format='%Y-%m-%d %H:%M:%S')
+    return times.to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+
+class PricePanel:
+    # OHLC prices of many symbols aligned on one shared timestamp index.
+    # Each field is a contiguous float64 array of shape (len(timestamps), len(symbols));
+    # bars a symbol does not have (suspended, not listed yet) are NaN.
+    def __init__(self, symbols, timestamps, open, high, low, close):
+        self.symbols = list(symbols)
+        self.timestamps = timestamps
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.symbol_index = {symbol: j for j, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_frames(cls, frames, timestamps=None):
+        # Build a panel from {symbol: DataFrame}, raw (fetch_futu_data) or processed (process_futu_data).
+        # By default the index is the union of all bar times; pass `timestamps` to align onto another index.
+        symbols = list(frames.keys())
+        times = {symbol: frame_timestamps(frame) for symbol, frame in frames.items()}
+        if timestamps is None:
+            timestamps = np.unique(np.concatenate(list(times.values()))) if times else np.array([], dtype=np.int64)
+
+        fields = {field: np.full((len(timestamps), len(symbols)), np.nan) for field in PANEL_FIELDS}
+        for j, symbol in enumerate(symbols):
+            frame = frames[symbol]
+            rows = np.searchsorted(timestamps, times[symbol])
+            keep = rows < len(timestamps)
+            keep[keep] = timestamps[rows[keep]] == times[symbol][keep]
+            for field in PANEL_FIELDS:
+                column = field if field in frame else field.capitalize()
+                fields[field][rows[keep], j] = frame[column].to_numpy(dtype=float)[keep]
+        return cls(symbols, timestamps, **fields)
+
+    @property
+    def valid(self):
+        # True where the symbol has a bar at that timestamp
+        return ~np.isnan(self.close)
+
+    def forward_filled(self, field):
+        # Field values with gaps filled by the symbol's last available value (NaN before its first bar)
+        values = getattr(self, field)
+        rows = np.where(~np.isnan(values), np.arange(len(values))[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        return values[rows, np.arange(values.shape[1])]
+
+    def save(self, directory):
+        # One raw .npy file per array, so load() can memory-map them
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'symbols.json'), 'w') as f:
+            json.dump(self.symbols, f)
+        np.save(os.path.join(directory, 'timestamps.npy'), self.timestamps)
+        for field in PANEL_FIELDS:
+            np.save(os.path.join(directory, f'{field}.npy'), getattr(self, field))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        # mmap_mode='r' maps the arrays from disk instead of reading them into memory; None reads them
+        with open(os.path.join(directory, 'symbols.json')) as f:
+            symbols = json.load(f)
+        timestamps = np.load(os.path.join(directory, 'timestamps.npy'))
+        fields = {field: np.load(os.path.join(directory, f'{field}.npy'), mmap_mode=mmap_mode) for field in PANEL_FIELDS}
+        return cls(symbols, timestamps, **fields)
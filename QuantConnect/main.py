@@ -1,6 +1,7 @@
 # region imports
 from AlgorithmImports import *
 from macd_atr_strategy import MACDATRStrategy 
+from trigger_index import TriggerIndex
 # endregion
 
 class FatYellowGreenDuck(QCAlgorithm):
@@ -14,8 +15,7 @@ class FatYellowGreenDuck(QCAlgorithm):
         self.symbols = ["TSLA"]
 
         self.strategies = {}  # Dictionary to hold strategies for each symbol
-        self.stop_profit_targets = {}  # Profit target for each symbol
-        self.stop_loss_prices = {}  # Stop loss for each symbol
+        self.triggers = TriggerIndex()  # Stop loss and profit target of each open position
 
         # Requesting minute resolution data for each symbol and setting up strategies
         for symbol in self.symbols:
@@ -28,9 +28,11 @@ class FatYellowGreenDuck(QCAlgorithm):
             self.SubscriptionManager.AddConsolidator(equity, consolidator)
 
     def OnData(self, data):
-        for symbol in self.symbols:
-            if data.Bars.ContainsKey(symbol):
-                self.SellStock(symbol, data[symbol].Close)
+        # Only symbols with an open position are looked at, and the trigger index returns
+        # only the positions whose stop or target this price crossed
+        for stock in self.triggers.symbols():
+            if data.Bars.ContainsKey(stock):
+                self.SellStock(stock, data[stock].Close)
 
     def OnDataConsolidated(self, sender, bar, symbol):
         signal = self.strategies[symbol].update(bar.Close, bar.High, bar.Low)
@@ -47,26 +49,21 @@ class FatYellowGreenDuck(QCAlgorithm):
             self.SetHoldings(stock, allocation)
             
             # Store stop profit target and stop loss price
-            self.stop_profit_targets[stock] = signal['stop_profit_target']
-            self.stop_loss_prices[stock] = signal['stop_loss_price']
+            self.triggers.add(stock, stock, signal['stop_loss_price'], signal['stop_profit_target'])
             
             # Debug print statements
             self.Debug(f"Executed Buy on {stock} at {self.Portfolio[symbol].Price:.2f}, "
-                    f"with target price {self.stop_profit_targets[stock]:.2f} "
-                    f"and stop loss {self.stop_loss_prices[stock]:.2f}")
-
-    def SellStock(self, symbol, current_price):
-        stock = str(symbol)
-        if self.Portfolio[stock].Invested:
-            # Accessing stop profit target and stop loss price with the correct key
-            stop_profit_target = self.stop_profit_targets.get(stock, None)
-            stop_loss_price = self.stop_loss_prices.get(stock, None)
-
-            # Check for stop profit or stop loss conditions
-            if stop_profit_target and current_price >= stop_profit_target:
-                self.Liquidate(stock)
-                self.Debug(f"Sold {stock} at {current_price:.2f}, reached profit target of {stop_profit_target:.2f}.")
-            elif stop_loss_price and current_price <= stop_loss_price:
-                self.Liquidate(symbol)
-                self.Debug(f"Sold {stock} at {current_price:.2f}, hit stop loss of {stop_loss_price:.2f}.")
+                    f"with target price {signal['stop_profit_target']:.2f} "
+                    f"and stop loss {signal['stop_loss_price']:.2f}")
 
+    def SellStock(self, stock, current_price):
+        # check() consumes the levels it returns, so only look once there is a holding to sell
+        # (the buy order may not have filled yet)
+        if not self.Portfolio[stock].Invested:
+            return
+        for _, trigger, level in self.triggers.check(stock, current_price):
+            self.Liquidate(stock)
+            if trigger == 'Target':
+                self.Debug(f"Sold {stock} at {current_price:.2f}, reached profit target of {level:.2f}.")
+            else:
+                self.Debug(f"Sold {stock} at {current_price:.2f}, hit stop loss of {level:.2f}.")
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from KlineCache import KlineCache, merge_ranges, to_ordinal, from_ordinal
+from FutuFetchingData import fetch_futu_data, fetch_futu_data_cached, fetch_futu_data_bulk
+
+# Derive coarser K-lines locally from one fine-grained download. Bars are bucketed per trading
+# session, so no bar spans the lunch break, and every bar is labelled with its end time like
+# Futu's own K-lines (HK K_60M: 10:30, 11:30, 12:00, 14:00, 15:00, 16:00). The derived frames
+# are cached under their own ktype key, so several timeframes cost one download of the base bars.
+
+# Trading sessions per market as (open, close) in minutes after midnight, exchange time
+SESSIONS = {
+    'HK': [(9 * 60 + 30, 12 * 60), (13 * 60, 16 * 60)],
+    'SH': [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)],
+    'SZ': [(9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)],
+    'US': [(9 * 60 + 30, 16 * 60)],
+}
+
+# Bar length in minutes of each ktype that can be derived; K_DAY buckets by date
+RESAMPLE_MINUTES = {'K_1M': 1, 'K_3M': 3, 'K_5M': 5, 'K_15M': 15, 'K_30M': 30, 'K_60M': 60, 'K_DAY': None}
+
+NANOS_PER_MINUTE = 60 * 10**9
+NANOS_PER_DAY = 24 * 60 * NANOS_PER_MINUTE
+
+
+def market_sessions(stock_code):
+    # Sessions of the market a Futu code belongs to ('HK.00700' -> HK)
+    return SESSIONS.get(stock_code.split('.')[0], SESSIONS['HK'])
+
+
+def bucket_ends(times, minutes, sessions):
+    # End time (int64 ns) of the `minutes` bucket each end-labelled bar falls in. Buckets restart at
+    # every session open and the last one is cut at the session close; bars at or before the open
+    # (the opening auction) join the first bucket and bars after the close join the last one.
+    days = times // NANOS_PER_DAY * NANOS_PER_DAY
+    minute_of_day = (times - days) // NANOS_PER_MINUTE
+    opens = np.array([session[0] for session in sessions])
+    closes = np.array([session[1] for session in sessions])
+    session = np.clip(np.searchsorted(opens, minute_of_day, side='right') - 1, 0, len(sessions) - 1)
+    offset = minute_of_day - opens[session]
+    steps = np.maximum(-(-offset // minutes), 1)  # ceil, at least one bucket
+    end_minute = np.minimum(opens[session] + steps * minutes, closes[session])
+    return days + end_minute * NANOS_PER_MINUTE
+
+
+def resample_bars(data, ktype, sessions=None):
+    """
+    Aggregate end-labelled K-lines into a coarser ktype.
+
+    :param data: DataFrame in fetch_futu_data's layout (code, time_key, open, high, low, close, ...), e.g. K_1M bars.
+    :param ktype: Target ktype, a key of RESAMPLE_MINUTES ('K_5M' ... 'K_60M', 'K_DAY').
+    :param sessions: Trading sessions as (open, close) minutes (default: from the code's market).
+    :return: A DataFrame in the same layout with one row per bar of the target ktype.
+    """
+    if data is None or data.empty:
+        return data
+    code = data['code'].iloc[0]
+    times = pd.to_datetime(data['time_key'], format='%Y-%m-%d %H:%M:%S').to_numpy().astype('datetime64[ns]').astype(np.int64)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+
+    minutes = RESAMPLE_MINUTES[ktype]
+    if minutes is None:
+        keys = times // NANOS_PER_DAY * NANOS_PER_DAY  # Futu labels daily bars with the date at 00:00:00
+    else:
+        keys = bucket_ends(times, minutes, sessions or market_sessions(code))
+
+    # Input is sorted, so each bucket is one contiguous run
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    last = np.append(starts[1:], len(keys)) - 1
+    columns = {name: data[name].to_numpy(dtype=float)[order] for name in ['open', 'high', 'low', 'close']}
+    time_key = np.char.replace(np.datetime_as_string(keys[starts].view('datetime64[ns]'), unit='s'), 'T', ' ')
+    resampled = pd.DataFrame({
+        'code': code,
+        'time_key': time_key,
+        'open': columns['open'][starts],
+        'close': columns['close'][last],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+    })
+    for name in ['volume', 'turnover']:
+        if name in data:
+            resampled[name] = np.add.reduceat(data[name].to_numpy(dtype=float)[order], starts)
+    return resampled
+
+
+def derived_ktype(ktype, base_ktype):
+    # Cache key for bars derived locally, kept apart from bars downloaded in that ktype
+    return f'{ktype}_from_{base_ktype}'
+
+
+def cached_ranges(cache, stock_code, ktype, start_date, end_date):
+    # Parts of [start_date, end_date] the cache covers, as 'YYYY-MM-DD' pairs
+    ranges = []
+    cursor = to_ordinal(start_date)
+    for gap_start, gap_end in cache.missing(stock_code, ktype, start_date, end_date):
+        if to_ordinal(gap_start) > cursor:
+            ranges.append((from_ordinal(cursor), from_ordinal(to_ordinal(gap_start) - 1)))
+        cursor = to_ordinal(gap_end) + 1
+    if cursor <= to_ordinal(end_date):
+        ranges.append((from_ordinal(cursor), end_date))
+    return ranges
+
+
+def fetch_futu_data_resampled(stock_code, start_date, end_date, ktypes, base_ktype='K_1M', max_count=500, cache=None,
+                              offline=False, fetch=fetch_futu_data):
+    """
+    Fetch K-lines in several timeframes from one download of the base ktype.
+
+    Derived bars are cached per ktype. Only date ranges not derived yet are resampled, and only
+    those base bars that are not cached yet are requested from OpenD. Like the cache, derived bars
+    cover complete days only, so today's forming bars are not included.
+
+    :param ktypes: Target ktypes, e.g. ['K_5M', 'K_30M', 'K_60M', 'K_DAY'].
+    :param base_ktype: The fine-grained ktype to download (default: 'K_1M').
+    :param cache: A KlineCache instance (default: KlineCache() in ./kline_cache).
+    :param offline: If True, never connect to OpenD and resample only cached base bars.
+    :return: A dict mapping each ktype to its DataFrame (None if no data is available).
+    """
+    cache = cache or KlineCache()
+    gaps = {ktype: cache.missing(stock_code, derived_ktype(ktype, base_ktype), start_date, end_date) for ktype in ktypes}
+    if not offline:
+        # Download the base bars once for all timeframes
+        needed = merge_ranges([(to_ordinal(a), to_ordinal(b)) for ranges in gaps.values() for a, b in ranges])
+        for a, b in needed:
+            fetch_futu_data_cached(stock_code, from_ordinal(a), from_ordinal(b), base_ktype, max_count, cache=cache, fetch=fetch)
+
+    for ktype, ranges in gaps.items():
+        for gap_start, gap_end in ranges:
+            # Only derive what the base bars cover, so a gap in them stays a gap in the derived bars
+            for a, b in cached_ranges(cache, stock_code, base_ktype, gap_start, gap_end):
+                base = cache.load(stock_code, base_ktype, a, b)
+                cache.store(stock_code, derived_ktype(ktype, base_ktype), resample_bars(base, ktype), a, b)
+
+    frames = {}
+    for ktype in ktypes:
+        data = cache.load(stock_code, derived_ktype(ktype, base_ktype), start_date, end_date)
+        frames[ktype] = None if data is None or data.empty else data
+    return frames
+
+
+def fetch_futu_data_resampled_bulk(stock_codes, start_date, end_date, ktypes, base_ktype='K_1M', max_count=500,
+                                   num_contexts=2, cache=None, offline=False):
+    """
+    fetch_futu_data_resampled for many symbols. Base bars that are still missing are downloaded first
+    in one pooled, rate-limited batch (see fetch_futu_data_bulk).
+
+    :return: A dict mapping each ktype to {symbol: DataFrame or None}.
+    """
+    cache = cache or KlineCache()
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if not offline:
+        stale = [stock_code for stock_code in stock_codes
+                 if any(cache.missing(stock_code, derived_ktype(ktype, base_ktype), start_date, end_date) for ktype in ktypes)]
+        if stale:
+            fetch_futu_data_bulk(stale, start_date, end_date, base_ktype, max_count, num_contexts, cache=cache)
+
+    frames = {ktype: {} for ktype in ktypes}
+    for stock_code in stock_codes:
+        # The base bars are cached now, so this only resamples
+        for ktype, data in fetch_futu_data_resampled(stock_code, start_date, end_date, ktypes, base_ktype, max_count,
+                                                     cache=cache, offline=True).items():
+            frames[ktype][stock_code] = data
+    return frames
@@ -0,0 +1,160 @@
+import os
+import hashlib
+import sqlite3
+import datetime
+from dataclasses import fields, asdict
+import numpy as np
+import pandas as pd
+from TradingStrategy import MACDATRStrategy, STRATEGY_PARAMS
+from FutuBackTest import PerformanceStats, TRADE_DTYPE
+
+# Local store of backtest results. Every run gets one row in an SQLite index (parameters,
+# universe, data fingerprint and every PerformanceStats field, with the common sort keys
+# indexed), so questions like "top 20 runs by Sharpe where slow_length=34" are one indexed
+# query over tens of thousands of runs. The equity curve and trade ledger go to one .npz per
+# run, one array per column, read only when a run's details are needed.
+#
+# store_dir/index.sqlite    the index
+# store_dir/runs/<id>.npz   equity, trade columns (bar, symbol_id, side, ...) and symbols
+
+STAT_COLUMNS = [field.name for field in fields(PerformanceStats)]
+INDEXED_COLUMNS = ['sharpe', 'final_return', 'max_drawdown', 'data_fingerprint']
+
+
+def panel_fingerprint(panel):
+    # Hash of a PricePanel's symbols, timestamps and prices: runs on the same data share it
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('\0'.join(panel.symbols).encode())
+    digest.update(np.ascontiguousarray(panel.timestamps, dtype=np.int64).data)
+    for field in ['open', 'high', 'low', 'close']:
+        digest.update(np.ascontiguousarray(getattr(panel, field), dtype=np.float64).data)
+    return digest.hexdigest()
+
+
+def universe_key(symbols):
+    # Order-independent hash of a symbol universe
+    return hashlib.blake2b('\0'.join(sorted(symbols)).encode(), digest_size=8).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, store_dir='backtest_results'):
+        self.store_dir = store_dir
+        os.makedirs(os.path.join(store_dir, 'runs'), exist_ok=True)
+        # Sweep workers write concurrently; SQLite serializes them, so wait for the lock
+        self.connection = sqlite3.connect(os.path.join(store_dir, 'index.sqlite'), timeout=60)
+        self.columns = (['run_id', 'created', 'label', 'mode', 'universe', 'n_symbols', 'data_fingerprint', 'n_bars']
+                        + list(STRATEGY_PARAMS) + STAT_COLUMNS)
+        column_types = {'run_id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'created': 'TEXT', 'label': 'TEXT', 'mode': 'TEXT',
+                        'universe': 'TEXT', 'n_symbols': 'INTEGER', 'data_fingerprint': 'TEXT', 'n_bars': 'INTEGER'}
+        # Periods and counts are integers, everything else is REAL
+        defaults = MACDATRStrategy()
+        column_types.update({name: 'INTEGER' for name in STRATEGY_PARAMS if isinstance(getattr(defaults, name), int)})
+        column_types.update({field.name: 'INTEGER' for field in fields(PerformanceStats) if field.type is int})
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs ('
+                                    + ', '.join(f'{name} {column_types.get(name, "REAL")}' for name in self.columns) + ')')
+            for name in INDEXED_COLUMNS:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS runs_{name} ON runs ({name})')
+
+    def close(self):
+        self.connection.close()
+
+    def run_path(self, run_id):
+        return os.path.join(self.store_dir, 'runs', f'{run_id}.npz')
+
+    def save(self, portfolio, params=None, panel=None, symbols=None, fingerprint=None, mode=None, label=None):
+        """
+        Record a finished run.
+
+        :param portfolio: The run's PortfolioManager.
+        :param params: MACDATRStrategy keyword arguments of the run; defaults are filled in, so queries on a
+            parameter also match runs that left it at its default.
+        :param panel: The PricePanel backtested; gives the universe and data fingerprint unless passed directly.
+        :param symbols: Symbol universe (default: panel.symbols, else the symbols the portfolio traded).
+        :param fingerprint: Data fingerprint (default: panel_fingerprint(panel)).
+        :param mode: Backtest mode, for reference.
+        :param label: Free-form note, e.g. the experiment name.
+        :return: The new run's id.
+        """
+        strategy = MACDATRStrategy(**(params or {}))
+        if symbols is None:
+            symbols = panel.symbols if panel is not None else portfolio.symbols
+        if fingerprint is None and panel is not None:
+            fingerprint = panel_fingerprint(panel)
+        stats = asdict(portfolio.get_performance())
+        equity = np.asarray(portfolio.balance_history, dtype=float)
+        trades = portfolio.trades[:portfolio.n_trades]
+
+        row = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'label': label, 'mode': mode,
+               'universe': universe_key(symbols), 'n_symbols': len(symbols), 'data_fingerprint': fingerprint,
+               'n_bars': len(equity), **{name: getattr(strategy, name) for name in STRATEGY_PARAMS}, **stats}
+        names = list(row)
+        # The index row and the run file are written together: a failed write leaves neither behind
+        with self.connection:
+            cursor = self.connection.execute(f'INSERT INTO runs ({", ".join(names)}) VALUES ({", ".join("?" * len(names))})',
+                                             [row[name] for name in names])
+            run_id = cursor.lastrowid
+            path = self.run_path(run_id)
+            temp_path = f'{path}.tmp'
+            with open(temp_path, 'wb') as f:
+                np.savez(f, equity=equity, symbols=np.array(portfolio.symbols, dtype=str),
+                         **{name: trades[name] for name in TRADE_DTYPE.names})
+            os.replace(temp_path, path)
+        return run_id
+
+    def query(self, order_by='sharpe', descending=True, limit=None, where=None, args=(), **equals):
+        """
+        Look up runs in the index.
+
+        :param order_by: Column to sort by, e.g. 'sharpe', 'final_return', 'max_drawdown' or 'run_id'.
+        :param limit: Maximum number of rows.
+        :param where: Optional extra SQL condition with ? placeholders, e.g. 'max_drawdown > ?'.
+        :param args: Values for the placeholders in where.
+        :param equals: Column=value conditions, e.g. slow_length=34, data_fingerprint='...'.
+        :return: A pandas DataFrame with one row per run.
+        """
+        for name in list(equals) + [order_by]:
+            if name not in self.columns:
+                raise ValueError(f"Unknown result column: {name}")
+        conditions = [f'{name} = ?' for name in equals]
+        values = list(equals.values())
+        if where:
+            conditions.append(f'({where})')
+            values.extend(args)
+        sql = 'SELECT * FROM runs'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order_by} {"DESC" if descending else "ASC"}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            values.append(int(limit))
+        return pd.read_sql_query(sql, self.connection, params=values)
+
+    def top(self, n=20, by='sharpe', **equals):
+        # The n best runs by a statistic, e.g. store.top(20, 'sharpe', slow_length=34)
+        return self.query(order_by=by, descending=True, limit=n, **equals)
+
+    def load_run(self, run_id):
+        # {column: array} of one run's equity curve, trade columns and traded symbols
+        with np.load(self.run_path(run_id)) as data:
+            return {name: data[name] for name in data.files}
+
+    def equity_curves(self, run_ids):
+        # Equity curves as DataFrame columns named by run id (shorter runs are padded with NaN)
+        return pd.DataFrame({run_id: pd.Series(self.load_run(run_id)['equity']) for run_id in run_ids})
+
+    def trades(self, run_id):
+        # A run's trade ledger as a DataFrame with the symbol names resolved
+        data = self.load_run(run_id)
+        ledger = pd.DataFrame({name: data[name] for name in TRADE_DTYPE.names})
+        ledger.insert(1, 'symbol', data['symbols'][ledger.pop('symbol_id').to_numpy()])
+        return ledger
+
+    def delete(self, run_id):
+        with self.connection:
+            self.connection.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+        if os.path.exists(self.run_path(run_id)):
+            os.remove(self.run_path(run_id))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
@@ -0,0 +1,221 @@
+import math
+from dataclasses import dataclass
+
+# Online risk metrics for live and paper trading: every equity mark and every closed trade
+# updates running totals in constant time and memory, so nothing grows with the length of
+# the run. PortfolioManager feeds one of these from record_balance and sell_stock.
+
+
+@dataclass(frozen=True)
+class RiskSnapshot:
+    bars: int
+    equity: float
+    high_water_mark: float
+    drawdown: float  # % below the high-water mark now (negative or 0)
+    max_drawdown: float  # %
+    drawdown_bars: int  # bars since the high-water mark was last set
+    max_drawdown_bars: int
+    mean_return: float  # per bar
+    volatility: float  # annualized, over the whole run
+    rolling_volatility: float  # annualized, over the last `window` bars
+    sharpe: float
+    sortino: float
+    strategy_return: float  # % compounded from the closed trades
+    winning_trades: int
+    losing_trades: int
+    avg_winning_return: float
+    avg_losing_return: float
+    largest_winning_trade: float
+    largest_losing_trade: float
+    consecutive_wins: int
+    consecutive_losses: int
+    max_consecutive_wins: int
+    max_consecutive_losses: int
+    max_consecutive_win_return: float  # %
+    max_consecutive_loss_return: float  # %
+
+
+class RiskMetrics:
+    def __init__(self, window=20, periods_per_year=252):
+        # window: bars in the rolling volatility; periods_per_year annualizes volatility, Sharpe and Sortino
+        self.window = window
+        self.periods_per_year = periods_per_year
+
+        # Equity marks
+        self.bars = 0
+        self.last_equity = None
+        self.high_water_mark = None
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.drawdown_bars = 0
+        self.max_drawdown_bars = 0
+
+        # Bar return moments (Welford), plus the downside sum of squares for Sortino
+        self.n_returns = 0
+        self.mean_return = 0.0
+        self.m2 = 0.0
+        self.downside_sq = 0.0
+
+        # Ring buffer of the last `window` bar returns with its running sums
+        self.ring = [0.0] * window
+        self.ring_pos = 0
+        self.ring_count = 0
+        self.ring_sum = 0.0
+        self.ring_sq = 0.0
+
+        # Closed trades, in % of the portfolio value
+        self.winning_trades = 0
+        self.losing_trades = 0
+        self.winning_trades_return = 0
+        self.losing_trades_return = 0
+
+        self.consecutive_wins = 0
+        self.consecutive_win_return = 1
+        self.max_consecutive_win_return = 1
+        self.max_consecutive_wins = 0
+
+        self.consecutive_losses = 0
+        self.max_consecutive_losses = 0
+        self.consecutive_loss_return = 1
+        self.max_consecutive_loss_return = 1
+
+        self.largest_winning_trade = 0
+        self.largest_losing_trade = 0
+
+        self.portfolio_return = 1
+
+    def update_equity(self, equity):
+        # Mark the end of a bar with the portfolio value
+        self.bars += 1
+        if self.last_equity is not None and self.last_equity:
+            self.add_return(equity / self.last_equity - 1)
+        self.last_equity = equity
+
+        if self.high_water_mark is None or equity >= self.high_water_mark:
+            self.high_water_mark = equity
+            self.drawdown = 0.0
+            self.drawdown_bars = 0
+        else:
+            self.drawdown = (equity / self.high_water_mark - 1) * 100
+            self.drawdown_bars += 1
+            if self.drawdown < self.max_drawdown:
+                self.max_drawdown = self.drawdown
+            if self.drawdown_bars > self.max_drawdown_bars:
+                self.max_drawdown_bars = self.drawdown_bars
+
+    def add_return(self, bar_return):
+        self.n_returns += 1
+        delta = bar_return - self.mean_return
+        self.mean_return += delta / self.n_returns
+        self.m2 += delta * (bar_return - self.mean_return)
+        if bar_return < 0:
+            self.downside_sq += bar_return * bar_return
+
+        # Replace the oldest return in the ring buffer
+        old = self.ring[self.ring_pos]
+        self.ring[self.ring_pos] = bar_return
+        self.ring_pos += 1
+        if self.ring_count < self.window:
+            self.ring_count += 1
+            self.ring_sum += bar_return
+            self.ring_sq += bar_return * bar_return
+        else:
+            self.ring_sum += bar_return - old
+            self.ring_sq += bar_return * bar_return - old * old
+        if self.ring_pos == self.window:
+            # Once per lap, resum the buffer so rounding errors in the running sums cannot build up
+            self.ring_pos = 0
+            self.ring_sum = math.fsum(self.ring)
+            self.ring_sq = math.fsum(r * r for r in self.ring)
+
+    def record_trade(self, percentage_profit):
+        # Update the win/loss counters and streaks with a closed trade's profit (% of the portfolio value)
+        self.portfolio_return *= (1 + percentage_profit/100)
+        # Track wins/losses
+        if percentage_profit > 0:
+            if self.consecutive_wins == 0: self.consecutive_win_return = 1
+            self.winning_trades += 1
+            self.winning_trades_return += percentage_profit
+
+            self.consecutive_wins += 1
+            self.consecutive_losses = 0
+            self.consecutive_win_return *= (1 + percentage_profit / 100)
+
+            # Update largest winning trade
+            if percentage_profit > self.largest_winning_trade:
+                self.largest_winning_trade = percentage_profit
+
+            if self.consecutive_win_return > self.max_consecutive_win_return:
+                self.max_consecutive_win_return = self.consecutive_win_return
+
+            # Update max consecutive wins
+            if self.consecutive_wins > self.max_consecutive_wins:
+                self.max_consecutive_wins = self.consecutive_wins
+
+        else:
+            if self.consecutive_losses == 0: self.consecutive_loss_return = 1
+            self.losing_trades += 1
+            self.losing_trades_return += percentage_profit
+
+            self.consecutive_losses += 1
+            self.consecutive_wins = 0
+            self.consecutive_loss_return *= (1 + percentage_profit/100)
+
+            # Update largest losing trade
+            if percentage_profit < self.largest_losing_trade:
+                self.largest_losing_trade = percentage_profit
+
+            if self.consecutive_loss_return < self.max_consecutive_loss_return:
+                self.max_consecutive_loss_return = self.consecutive_loss_return
+
+            # Update max consecutive losses
+            if self.consecutive_losses > self.max_consecutive_losses:
+                self.max_consecutive_losses = self.consecutive_losses
+
+    def get_state(self):
+        # Plain copy of the running totals (see StateSnapshot)
+        state = dict(vars(self))
+        state['ring'] = list(self.ring)
+        return state
+
+    def set_state(self, state):
+        self.__dict__.update(state)
+        self.ring = list(state['ring'])
+
+    def snapshot(self):
+        # The current figures; constant time, safe to call after every event
+        annualize = math.sqrt(self.periods_per_year)
+        std = math.sqrt(self.m2 / self.n_returns) if self.n_returns else 0.0
+        downside = math.sqrt(self.downside_sq / self.n_returns) if self.n_returns else 0.0
+        if self.ring_count:
+            rolling_mean = self.ring_sum / self.ring_count
+            rolling_std = math.sqrt(max(self.ring_sq / self.ring_count - rolling_mean * rolling_mean, 0.0))
+        else:
+            rolling_std = 0.0
+        return RiskSnapshot(
+            bars=self.bars,
+            equity=self.last_equity if self.last_equity is not None else 0.0,
+            high_water_mark=self.high_water_mark if self.high_water_mark is not None else 0.0,
+            drawdown=self.drawdown,
+            max_drawdown=self.max_drawdown,
+            drawdown_bars=self.drawdown_bars,
+            max_drawdown_bars=self.max_drawdown_bars,
+            mean_return=self.mean_return,
+            volatility=std * annualize,
+            rolling_volatility=rolling_std * annualize,
+            sharpe=self.mean_return / std * annualize if std > 0 else 0.0,
+            sortino=self.mean_return / downside * annualize if downside > 0 else 0.0,
+            strategy_return=(self.portfolio_return - 1) * 100,
+            winning_trades=self.winning_trades,
+            losing_trades=self.losing_trades,
+            avg_winning_return=self.winning_trades_return / self.winning_trades if self.winning_trades else 0.0,
+            avg_losing_return=self.losing_trades_return / self.losing_trades if self.losing_trades else 0.0,
+            largest_winning_trade=self.largest_winning_trade,
+            largest_losing_trade=self.largest_losing_trade,
+            consecutive_wins=self.consecutive_wins,
+            consecutive_losses=self.consecutive_losses,
+            max_consecutive_wins=self.max_consecutive_wins,
+            max_consecutive_losses=self.max_consecutive_losses,
+            max_consecutive_win_return=(self.max_consecutive_win_return - 1) * 100,
+            max_consecutive_loss_return=(self.max_consecutive_loss_return - 1) * 100,
+        )
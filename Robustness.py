@@ -0,0 +1,201 @@
+import io
+import os
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from FutuBackTest import run_backtest
+from PricePanel import PricePanel
+from ParameterSweep import share_panel, attach_panel
+
+# Monte Carlo robustness checks of a backtest. Trade-level simulations bootstrap or reshuffle the
+# closed trades' returns; path-level simulations rebuild the price panel from resampled blocks
+# of bars and rerun the backtest on each path. Paths are simulated in vectorized batches (one
+# row per path) spread over a process pool, and summarized as confidence intervals.
+
+METRICS = ['final_return', 'max_drawdown', 'max_consecutive_losses']
+
+
+def trade_returns(portfolio):
+    # Closed trades' returns as fractions of the portfolio value, in trade order
+    trades = portfolio.trades[:portfolio.n_trades]
+    return trades['return_pct'][trades['side'] < 0] / 100
+
+
+def path_metrics(returns):
+    # Metrics of a (paths, trades) batch of trade returns: final return and max drawdown in %
+    # (drawdown measured trade to trade, from the starting balance) and the longest losing streak
+    equity = np.cumprod(1 + returns, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    losses = returns <= 0
+    # Length of the losing streak ending at each trade: losses so far minus losses up to the last win
+    count = np.cumsum(losses, axis=1)
+    streak = count - np.maximum.accumulate(np.where(losses, 0, count), axis=1)
+    return {
+        'final_return': (equity[:, -1] - 1) * 100,
+        'max_drawdown': np.minimum((equity / peak).min(axis=1) - 1, 0) * 100,
+        'max_consecutive_losses': streak.max(axis=1),
+    }
+
+
+def simulate_trade_paths(returns, n_paths, method='bootstrap', seed=0, batch_size=10000):
+    """
+    Simulate trade sequences in vectorized batches in this process.
+
+    :param returns: Trade returns as fractions (see trade_returns).
+    :param method: 'bootstrap' draws trades with replacement; 'shuffle' reorders the same trades, which
+        keeps the final return and shows how much drawdown and losing streaks depend on trade order.
+    :return: {metric: array of n_paths values}
+    """
+    returns = np.asarray(returns, dtype=float)
+    rng = np.random.default_rng(seed)
+    # Keep a batch around 2M trade returns so memory stays bounded for long trade lists
+    batch_size = max(1, min(batch_size, 2_000_000 // max(len(returns), 1)))
+    results = {name: [] for name in METRICS}
+    for start in range(0, n_paths, batch_size):
+        size = min(batch_size, n_paths - start)
+        if method == 'bootstrap':
+            batch = returns[rng.integers(0, len(returns), (size, len(returns)))]
+        elif method == 'shuffle':
+            batch = rng.permuted(np.broadcast_to(returns, (size, len(returns))), axis=1)
+        else:
+            raise ValueError(f"Unknown simulation method: {method}")
+        for name, values in path_metrics(batch).items():
+            results[name].append(values)
+    return {name: np.concatenate(values) for name, values in results.items()}
+
+
+def _simulate_trade_batch(args):
+    returns, n_paths, method, seed = args
+    return simulate_trade_paths(returns, n_paths, method, seed)
+
+
+def split_work(n_paths, n_chunks, seed):
+    # (paths, independent seed) per chunk
+    n_chunks = max(1, min(n_chunks, n_paths))
+    sizes = [n_paths // n_chunks + (k < n_paths % n_chunks) for k in range(n_chunks)]
+    seeds = np.random.SeedSequence(seed).generate_state(n_chunks).tolist()
+    return list(zip(sizes, seeds))
+
+
+def confidence_intervals(samples, observed=None, confidence=0.9):
+    # One row per metric: mean, median and the central `confidence` interval, plus the observed value
+    low, high = (1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100
+    rows = []
+    for name, values in samples.items():
+        row = {'metric': name, 'mean': float(np.mean(values)), 'median': float(np.median(values)),
+               f'p{low:g}': float(np.percentile(values, low)), f'p{high:g}': float(np.percentile(values, high))}
+        if observed is not None:
+            row['observed'] = observed.get(name)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('metric')
+
+
+def monte_carlo_trades(portfolio, n_paths=100000, method='bootstrap', confidence=0.9, max_workers=None, seed=0):
+    """
+    Bootstrap or reshuffle a backtest's closed trades.
+
+    :param portfolio: The PortfolioManager of a finished backtest (or an array of trade returns as fractions).
+    :param n_paths: Number of simulated trade sequences.
+    :param method: 'bootstrap' or 'shuffle', see simulate_trade_paths.
+    :param confidence: Width of the reported interval (0.9 gives the 5th and 95th percentiles).
+    :param max_workers: Number of worker processes (default: os.cpu_count()).
+    :return: (confidence interval DataFrame, {metric: simulated values})
+    """
+    returns = trade_returns(portfolio) if hasattr(portfolio, 'trades') else np.asarray(portfolio, dtype=float)
+    if len(returns) == 0:
+        raise ValueError("No closed trades to resample")
+    max_workers = max_workers or os.cpu_count()
+    chunks = split_work(n_paths, max_workers, seed)
+    if max_workers == 1:
+        parts = [_simulate_trade_batch((returns, size, method, chunk_seed)) for size, chunk_seed in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(_simulate_trade_batch, [(returns, size, method, chunk_seed) for size, chunk_seed in chunks]))
+    samples = {name: np.concatenate([part[name] for part in parts]) for name in METRICS}
+    observed = {name: float(values[0]) for name, values in path_metrics(returns[None, :]).items()}
+    return confidence_intervals(samples, observed, confidence), samples
+
+
+def block_bootstrap_panel(panel, block_length, rng):
+    # A new price panel of the same shape built from randomly chosen blocks of consecutive bars
+    # (moving block bootstrap). Whole bars are resampled for all stocks at once, which keeps the
+    # cross-sectional correlation; closes are chained from each block's bar-to-bar growth, and
+    # open/high/low keep their ratio to the close. A stock has a bar where the source bar had one.
+    n_bars = len(panel.timestamps)
+    close = panel.forward_filled('close')
+    first = close[np.argmax(~np.isnan(close), axis=0), np.arange(close.shape[1])]  # First close per stock
+    close = np.where(np.isnan(close), first, close)
+    growth = np.ones_like(close)
+    growth[1:] = close[1:] / close[:-1]
+
+    n_blocks = -(-n_bars // block_length)
+    starts = rng.integers(1, max(n_bars - block_length, 1) + 1, n_blocks)
+    rows = np.minimum((starts[:, None] + np.arange(block_length)).ravel()[:n_bars], n_bars - 1)
+    rows[0] = 0
+
+    new_close = first * np.cumprod(growth[rows], axis=0)
+    valid = panel.valid[rows]
+    fields = {'close': np.where(valid, new_close, np.nan)}
+    for field in ['open', 'high', 'low']:
+        ratio = getattr(panel, field)[rows] / panel.close[rows]
+        fields[field] = np.where(valid, new_close * ratio, np.nan)
+    return PricePanel(panel.symbols, panel.timestamps, **fields)
+
+
+_worker_panel = None
+_worker_shm = None
+
+
+def _init_worker(panel_info):
+    global _worker_panel, _worker_shm
+    _worker_shm, _worker_panel = attach_panel(panel_info)
+
+
+def _run_paths(args):
+    n_paths, block_length, strategy_params, mode, seed = args
+    rng = np.random.default_rng(seed)
+    results = {name: [] for name in METRICS}
+    for _ in range(n_paths):
+        path = block_bootstrap_panel(_worker_panel, block_length, rng)
+        with contextlib.redirect_stdout(io.StringIO()):
+            performance = run_backtest(path, mode, strategy_params).get_performance()
+        results['final_return'].append(performance.final_return)
+        results['max_drawdown'].append(performance.max_drawdown)
+        results['max_consecutive_losses'].append(performance.max_consecutive_losses)
+    return results
+
+
+def monte_carlo_paths(panel, n_paths=1000, block_length=100, strategy_params=None, mode='precomputed', confidence=0.9,
+                      max_workers=None, seed=0):
+    """
+    Rerun the backtest on block-bootstrapped price paths.
+
+    Each path needs a full backtest, so this is far slower per path than monte_carlo_trades.
+    The panel is shared with the workers through shared memory, as in run_sweep.
+
+    :param panel: A PricePanel (or {stock: DataFrame}).
+    :param block_length: Bars per resampled block; longer blocks keep more of the trend and volatility structure.
+    :param strategy_params: Keyword arguments for MACDATRStrategy.
+    :param max_workers: Number of worker processes (default: os.cpu_count()).
+    :return: (confidence interval DataFrame, {metric: simulated values})
+    """
+    if not isinstance(panel, PricePanel):
+        panel = PricePanel.from_frames(panel)
+    max_workers = max_workers or os.cpu_count()
+    with contextlib.redirect_stdout(io.StringIO()):
+        performance = run_backtest(panel, mode, strategy_params).get_performance()
+    observed = {name: getattr(performance, name) for name in METRICS}
+
+    # A few chunks per worker balance the load without much scheduling overhead
+    chunks = split_work(n_paths, max_workers * 4, seed)
+    shm, panel_info = share_panel(panel)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(panel_info,)) as executor:
+            parts = list(executor.map(_run_paths, [(size, block_length, strategy_params, mode, chunk_seed)
+                                                   for size, chunk_seed in chunks]))
+    finally:
+        shm.close()
+        shm.unlink()
+    samples = {name: np.concatenate([np.asarray(part[name], dtype=float) for part in parts]) for name in METRICS}
+    return confidence_intervals(samples, observed, confidence), samples
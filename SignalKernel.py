@@ -0,0 +1,232 @@
+import io
+import contextlib
+import numpy as np
+
+# The path-dependent part of MACDATRStrategy (MACD histogram peak detection, the
+# decrease_percentage peak comparison, stop-loss/stop-profit exits and re-entry once flat)
+# as a loop over precomputed indicator arrays. With Numba installed the loop is compiled to
+# native code; without it the same function runs as plain Python over lists, which is how
+# generate_signals always ran. check_parity compares both backends' trades with the bar-by-bar
+# MACDATRStrategy.update path.
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # No compiler: leave the function as it is
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda function: function
+
+BACKENDS = ('numba', 'python')
+backend = 'numba' if NUMBA_AVAILABLE else 'python'  # Default for run_signal_kernel
+
+
+def _signal_kernel(close, high, low, macd_hist, rsi, sd, atr, begin, end,
+                   decrease_percentage, sd_multiplier, rsi_buy_threshold,
+                   atr_multiplier, atr_min_multiplier, atr_max_multiplier,
+                   buy, sell, buy_price, sell_price, stop_loss_price, stop_profit_target, score):
+    # Runs the state machine over bars [begin, end), starting flat with no peaks, and writes the
+    # events into the output arrays. Inputs may be NumPy arrays or lists.
+    peaks = 0
+    peak_current = 0.0
+    peak_previous = 0.0
+    in_position = False
+    stop = 0.0
+    target = 0.0
+    for i in range(begin, end):
+        current_macd_hist = macd_hist[i]
+        previous_macd_hist = macd_hist[i - 1]
+        two_bars_ago_macd_hist = macd_hist[i - 2]
+
+        # Check for peak conditions
+        if (previous_macd_hist <= two_bars_ago_macd_hist and
+                current_macd_hist > previous_macd_hist and
+                two_bars_ago_macd_hist < 0 and
+                previous_macd_hist < 0 and
+                current_macd_hist < 0):
+            peak_previous = peak_current
+            peak_current = previous_macd_hist
+            peaks += 1
+
+        # Sell on stop loss / stop profit
+        if in_position:
+            if low[i] <= stop:
+                in_position = False
+                sell[i] = True
+                sell_price[i] = stop
+            elif high[i] >= target:
+                in_position = False
+                sell[i] = True
+                sell_price[i] = target
+            continue
+
+        if peaks < 2 or not rsi[i] <= rsi_buy_threshold:
+            continue
+
+        if (peak_previous * (1 - decrease_percentage) < peak_current and
+                close[i - 1] - sd[i] * sd_multiplier > close[i]):
+            price = close[i]
+            dynamic_multiplier = atr_multiplier * (1 + sd[i])
+            dynamic_multiplier = max(atr_min_multiplier, min(atr_max_multiplier, dynamic_multiplier))
+            stop = low[i] - atr[i] * dynamic_multiplier
+            target = price + 1.5 * (price - stop)
+            in_position = True
+            buy[i] = True
+            buy_price[i] = price
+            stop_loss_price[i] = stop
+            stop_profit_target[i] = target
+            # Same as TradingStrategy.buy_score
+            score[i] = (close[i - 1] - price) / sd[i] if sd[i] > 0 else np.inf
+
+
+def _signal_kernel_many(close, high, low, macd_hist, rsi, sd, atr, offsets, begins, ends,
+                        decrease_percentage, sd_multiplier, rsi_buy_threshold,
+                        atr_multiplier, atr_min_multiplier, atr_max_multiplier,
+                        buy, sell, buy_price, sell_price, stop_loss_price, stop_profit_target, score):
+    # Many symbols concatenated into one set of arrays: symbol k owns [offsets[k], offsets[k + 1])
+    # and trades its bars [begins[k], ends[k]) (absolute positions)
+    for k in range(len(offsets) - 1):
+        _signal_kernel(close, high, low, macd_hist, rsi, sd, atr, begins[k], ends[k],
+                       decrease_percentage, sd_multiplier, rsi_buy_threshold,
+                       atr_multiplier, atr_min_multiplier, atr_max_multiplier,
+                       buy, sell, buy_price, sell_price, stop_loss_price, stop_profit_target, score)
+
+
+if NUMBA_AVAILABLE:
+    _compiled_kernel = njit(cache=True)(_signal_kernel)
+
+    # Calls the compiled single-symbol kernel, so it is compiled itself rather than wrapped
+    @njit(cache=True)
+    def _compiled_kernel_many(close, high, low, macd_hist, rsi, sd, atr, offsets, begins, ends,
+                              decrease_percentage, sd_multiplier, rsi_buy_threshold,
+                              atr_multiplier, atr_min_multiplier, atr_max_multiplier,
+                              buy, sell, buy_price, sell_price, stop_loss_price, stop_profit_target, score):
+        for k in range(len(offsets) - 1):
+            _compiled_kernel(close, high, low, macd_hist, rsi, sd, atr, begins[k], ends[k],
+                             decrease_percentage, sd_multiplier, rsi_buy_threshold,
+                             atr_multiplier, atr_min_multiplier, atr_max_multiplier,
+                             buy, sell, buy_price, sell_price, stop_loss_price, stop_profit_target, score)
+
+
+def empty_signals(n):
+    return {
+        "buy": np.zeros(n, dtype=bool),
+        "sell": np.zeros(n, dtype=bool),
+        "buy_price": np.full(n, np.nan),
+        "sell_price": np.full(n, np.nan),
+        "stop_loss_price": np.full(n, np.nan),
+        "stop_profit_target": np.full(n, np.nan),
+        "score": np.full(n, np.nan),
+    }
+
+
+def _strategy_params(strategy):
+    return (float(strategy.decrease_percentage), float(strategy.sd_multiplier), float(strategy.rsi_buy_threshold),
+            float(strategy.atr_multiplier), float(strategy.atr_min_multiplier), float(strategy.atr_max_multiplier))
+
+
+def _outputs(signals):
+    return (signals["buy"], signals["sell"], signals["buy_price"], signals["sell_price"],
+            signals["stop_loss_price"], signals["stop_profit_target"], signals["score"])
+
+
+def _select(name):
+    name = name or backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown signal kernel backend: {name}")
+    if name == 'numba' and not NUMBA_AVAILABLE:
+        raise ValueError("The numba backend needs the numba package")
+    return name
+
+
+def run_signal_kernel(strategy, close, high, low, indicators, begin, end, backend=None):
+    # Events of one symbol's bars [begin, end) as generate_signals returns them
+    signals = empty_signals(len(close))
+    series = [np.ascontiguousarray(values, dtype=float) for values in
+              (close, high, low, indicators["macd_hist"], indicators["rsi"], indicators["sd"], indicators["atr"])]
+    if _select(backend) == 'numba':
+        _compiled_kernel(*series, begin, end, *_strategy_params(strategy), *_outputs(signals))
+    else:
+        # Plain lists are much faster than NumPy scalars in a Python loop
+        _signal_kernel(*[values.tolist() for values in series], begin, end,
+                       *_strategy_params(strategy), *_outputs(signals))
+    return signals
+
+
+def run_signal_kernel_many(strategy, columns, start=0, end=None, backend=None):
+    """
+    Run the state machine for many symbols in one call.
+
+    :param strategy: MACDATRStrategy whose parameters to use.
+    :param columns: List of (close, high, low, indicators) per symbol, indicators as from calculate_indicators.
+    :param start: First bar to trade in every symbol (earlier bars are indicator warm-up).
+    :param end: End of the trading bars (default: each symbol's last bar).
+    :return: One generate_signals-style dict per symbol, views into shared arrays.
+    """
+    lengths = np.array([len(column[0]) for column in columns], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    first = max(strategy.slow_length + strategy.signal_length, start)
+    begins = offsets[:-1] + np.minimum(first, lengths)
+    ends = offsets[:-1] + (lengths if end is None else np.minimum(end, lengths))
+    ends = np.maximum(ends, begins)
+
+    def concat(k):
+        return np.concatenate([np.asarray(column[k], dtype=float) for column in columns]) if columns else np.empty(0)
+
+    def concat_indicator(name):
+        return np.concatenate([np.asarray(column[3][name], dtype=float) for column in columns]) if columns else np.empty(0)
+
+    series = (concat(0), concat(1), concat(2), concat_indicator("macd_hist"), concat_indicator("rsi"),
+              concat_indicator("sd"), concat_indicator("atr"))
+    signals = empty_signals(int(offsets[-1]))
+    if _select(backend) == 'numba':
+        _compiled_kernel_many(*series, offsets, begins, ends, *_strategy_params(strategy), *_outputs(signals))
+    else:
+        _signal_kernel_many(*[values.tolist() for values in series], offsets.tolist(), begins.tolist(), ends.tolist(),
+                            *_strategy_params(strategy), *_outputs(signals))
+    return [{name: values[offsets[k]:offsets[k + 1]] for name, values in signals.items()} for k in range(len(columns))]
+
+
+def check_parity(stocks_data, strategy_params=None, rtol=1e-9):
+    # Backtest with every available kernel backend and with the reference path, MACDATRStrategy.update
+    # bar by bar ('update' mode), and compare the trade ledgers. Bars, symbols, sides and shares must
+    # match exactly; prices and returns to within rtol, since the reference's streaming indicators
+    # agree with talib to about 1e-10 relative. Returns {name: number of trades}; raises
+    # AssertionError if a backend trades differently from the reference.
+    from FutuBackTest import run_backtest
+    from PricePanel import PricePanel
+    global backend
+    panel = stocks_data if isinstance(stocks_data, PricePanel) else PricePanel.from_frames(stocks_data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        reference = run_backtest(panel, 'update', strategy_params)
+    ledgers = {'update': reference.trades[:reference.n_trades].copy()}
+    default = backend
+    try:
+        for name in BACKENDS:
+            if name == 'numba' and not NUMBA_AVAILABLE:
+                continue
+            backend = name
+            with contextlib.redirect_stdout(io.StringIO()):
+                portfolio = run_backtest(panel, 'precomputed', strategy_params)
+            assert portfolio.symbols == reference.symbols, f"The {name} backend trades other symbols"
+            ledgers[name] = portfolio.trades[:portfolio.n_trades].copy()
+    finally:
+        backend = default
+    expected = ledgers['update']
+    for name, trades in ledgers.items():
+        assert len(trades) == len(expected), f"The {name} backend made {len(trades)} trades, the reference {len(expected)}"
+        for field in ('bar', 'symbol_id', 'side', 'shares'):
+            assert np.array_equal(trades[field], expected[field]), f"The {name} backend trades differently ({field})"
+        for field in ('price', 'return_pct'):
+            assert np.allclose(trades[field], expected[field], rtol=rtol, atol=1e-12), \
+                f"The {name} backend trades at other prices ({field})"
+    return {name: len(trades) for name, trades in ledgers.items()}
+
+if __name__ == "__main__":
+    from Benchmark import synthetic_frames
+    print(f"Numba available: {NUMBA_AVAILABLE}")
+    print(check_parity(synthetic_frames(50, 2000)))
@@ -0,0 +1,99 @@
+import io
+import os
+import struct
+import pickle
+from TradingStrategy import MACDATRStrategy
+from FutuBackTest import PortfolioManager
+
+# Versioned binary snapshots of the live state: every stock's MACDATRStrategy, the
+# PortfolioManager and the last bar (time and close) each stock has seen. Restoring one gives fully
+# warmed-up strategies at once, so a restarted engine only replays the bars after that time.
+#
+# File layout: 8-byte magic, uint16 format version, then a pickle of plain Python values and
+# NumPy arrays (the get_state() dicts). Loading only accepts those types, so a snapshot file
+# cannot run code. Bump SNAPSHOT_VERSION when a get_state() layout changes and add a function
+# to MIGRATIONS that upgrades the previous version's state.
+
+SNAPSHOT_MAGIC = b'MACDSNAP'
+SNAPSHOT_VERSION = 2
+
+
+def _upgrade_stddev_state(state):
+    # Version 2: StdDev keeps sums of x - shift plus an update counter instead of running sums of
+    # the raw prices. The window is all that is needed to rebuild them exactly.
+    for strategy_state in state['strategies'].values():
+        indicators = strategy_state.get('indicators')
+        if indicators is None:
+            continue
+        window = list(indicators['sd']['window'])
+        shift = window[0] if window else 0.0
+        total = total_sq = 0.0
+        for value in window:
+            total += value - shift
+            total_sq += (value - shift) * (value - shift)
+        indicators['sd'] = {'value': indicators['sd']['value'], 'window': window, 'shift': shift, 'total': total,
+                            'total_sq': total_sq, 'updates': 0}
+    return state
+
+
+MIGRATIONS = {1: _upgrade_stddev_state}  # version -> function(state) returning the state in the layout of version + 1
+
+# The only globals a snapshot pickle may reference: what NumPy needs to rebuild arrays and scalars
+_ALLOWED_GLOBALS = {
+    ('numpy', 'ndarray'), ('numpy', 'dtype'),
+    ('numpy.core.multiarray', '_reconstruct'), ('numpy.core.multiarray', 'scalar'),
+    ('numpy._core.multiarray', '_reconstruct'), ('numpy._core.multiarray', 'scalar'),
+    ('numpy.core.numeric', '_frombuffer'), ('numpy._core.numeric', '_frombuffer'),
+}
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in _ALLOWED_GLOBALS:
+            raise pickle.UnpicklingError(f"Snapshot references a disallowed type: {module}.{name}")
+        return super().find_class(module, name)
+
+
+def save_snapshot(path, strategies, portfolio=None, last_bars=None):
+    """
+    Write a snapshot of the live state.
+
+    :param path: File to write; it is replaced atomically, so a crash never leaves a partial snapshot.
+    :param strategies: {stock: MACDATRStrategy}.
+    :param portfolio: Optional PortfolioManager.
+    :param last_bars: {stock: (time_key, close) of the last bar the strategy processed}.
+    """
+    state = {
+        'strategies': {stock: strategy.get_state() for stock, strategy in strategies.items()},
+        'portfolio': portfolio.get_state() if portfolio is not None else None,
+        'last_bars': dict(last_bars or {}),
+    }
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<H', SNAPSHOT_VERSION))
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def load_snapshot(path):
+    """
+    Read a snapshot written by save_snapshot, upgrading older format versions.
+
+    :return: (strategies {stock: MACDATRStrategy}, PortfolioManager or None, last_bars {stock: (time_key, close)})
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a strategy snapshot")
+    (version,) = struct.unpack_from('<H', data, len(SNAPSHOT_MAGIC))
+    if version > SNAPSHOT_VERSION:
+        raise ValueError(f"{path} has snapshot version {version}, newer than the supported {SNAPSHOT_VERSION}")
+    state = _SnapshotUnpickler(io.BytesIO(data[len(SNAPSHOT_MAGIC) + 2:])).load()
+    while version < SNAPSHOT_VERSION:
+        state = MIGRATIONS[version](state)
+        version += 1
+
+    strategies = {stock: MACDATRStrategy.from_state(strategy_state) for stock, strategy_state in state['strategies'].items()}
+    portfolio = PortfolioManager.from_state(state['portfolio']) if state['portfolio'] is not None else None
+    return strategies, portfolio, state['last_bars']
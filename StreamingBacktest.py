@@ -0,0 +1,96 @@
+import os
+import glob
+import heapq
+import numpy as np
+from TradingStrategy import MACDATRStrategy
+from FutuBackTest import PortfolioManager
+from PricePanel import frame_timestamps
+
+# Per-symbol bar files: one structured .npy per symbol, sorted by time, read through a memory map
+BAR_DTYPE = np.dtype([('time', np.int64), ('open', np.float64), ('high', np.float64),
+                      ('low', np.float64), ('close', np.float64)])
+
+
+def write_bar_file(path, frame):
+    # Save a Futu frame (raw or processed) as a bar file
+    bars = np.empty(len(frame), dtype=BAR_DTYPE)
+    bars['time'] = frame_timestamps(frame)
+    for field in ['open', 'high', 'low', 'close']:
+        column = field if field in frame else field.capitalize()
+        bars[field] = frame[column].to_numpy(dtype=float)
+    np.save(path, np.sort(bars, order='time'))
+
+
+def write_bar_files(directory, frames):
+    os.makedirs(directory, exist_ok=True)
+    for stock, frame in frames.items():
+        write_bar_file(os.path.join(directory, f'{stock}.npy'), frame)
+
+
+def iter_bar_file(path, chunk_size=4096):
+    # Yield (time, open, high, low, close) tuples, reading chunk_size bars from disk at a time
+    bars = np.load(path, mmap_mode='r')
+    for start in range(0, len(bars), chunk_size):
+        chunk = np.array(bars[start:start + chunk_size])
+        yield from zip(chunk['time'].tolist(), chunk['open'].tolist(), chunk['high'].tolist(),
+                       chunk['low'].tolist(), chunk['close'].tolist())
+
+
+def iter_bar_files(directory, chunk_size=4096):
+    # {stock: bar generator} for every bar file in a directory, in sorted symbol order
+    paths = sorted(glob.glob(os.path.join(directory, '*.npy')))
+    return {os.path.basename(path)[:-4]: iter_bar_file(path, chunk_size) for path in paths}
+
+
+def merge_bar_streams(bar_streams):
+    # k-way merge of per-stock bar streams by timestamp; stocks with the same timestamp come out
+    # in bar_streams order. Yields (time, stock index, open, high, low, close).
+    def tag(j, stream):
+        for bar_time, open_price, high, low, close in stream:
+            yield bar_time, j, open_price, high, low, close
+    return heapq.merge(*(tag(j, stream) for j, stream in enumerate(bar_streams.values())))
+
+
+def stream_backtest(bar_streams, keep_balance_history=True):
+    # Event-driven version of backtest_strategy for data that does not fit in memory.
+    # bar_streams: {stock: iterable of (time, open, high, low, close) sorted by time},
+    # e.g. iter_bar_files(directory). Bars are merged by time and fed one at a time to
+    # that stock's MACDATRStrategy and the PortfolioManager, so memory depends on the
+    # number of stocks, not the length of the history. With keep_balance_history=False
+    # only the latest portfolio value is kept in balance_history; portfolio.metrics
+    # (RiskMetrics) still tracks drawdown, volatility and streaks over the whole run.
+    portfolio = PortfolioManager(initial_balance=100000, keep_history=keep_balance_history)
+    symbols = list(bar_streams.keys())
+    strategies = {stock: MACDATRStrategy(incremental=True) for stock in symbols}  # One strategy per stock
+    last_close = {}
+
+    def record_balance():
+        # Open positions are valued at the stock's last close
+        portfolio_value = portfolio.account_balance
+        for stock_symbol, details in portfolio.positions.items():
+            portfolio_value += details['num_shares'] * last_close[stock_symbol]
+        portfolio.record_balance(portfolio_value)
+
+    current_time = None
+    bar_signals = []
+    for bar_time, j, _, high, low, close in merge_bar_streams(bar_streams):
+        # All bars of the previous timestamp are in: act on their signals together, like
+        # run_backtest, then mark the portfolio to market
+        if current_time is not None and bar_time != current_time:
+            portfolio.execute_signals(bar_signals)
+            bar_signals = []
+            record_balance()
+        current_time = bar_time
+
+        stock = symbols[j]
+        last_close[stock] = close
+        signal = strategies[stock].update(close, high, low)
+        if signal is not None:
+            bar_signals.append((stock, signal))
+
+    if current_time is not None:
+        portfolio.execute_signals(bar_signals)
+        record_balance()
+    # Final return report
+    portfolio.get_statistics()
+    return portfolio.get_final_return(), portfolio.trade_history, portfolio.balance_history
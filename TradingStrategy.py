@@ -1,11 +1,28 @@
 import numpy as np
 import talib
+from collections import deque
+from Indicators import MACD, RSI, ATR, StdDev
+from Instrumentation import profiler
+from SignalKernel import run_signal_kernel
+
+# Constructor arguments that define a strategy (everything except `incremental`)
+STRATEGY_PARAMS = ('fast_length', 'slow_length', 'signal_length', 'decrease_percentage', 'atr_length', 'atr_multiplier',
+                   'sd_length', 'sd_multiplier', 'atr_min_multiplier', 'atr_max_multiplier', 'rsi_length',
+                   'rsi_buy_threshold', 'rsi_sell_threshold')
+
+
+def buy_score(previous_close, close, sd):
+    # How strong a buy is, for ranking buys that fire on the same bar: the price drop that
+    # triggered it in standard deviations (the sd_multiplier condition); higher is stronger
+    drop = previous_close - close
+    return drop / sd if sd > 0 else float('inf')
 
 
 class MACDATRStrategy:
     def __init__(self, fast_length=13, slow_length=34, signal_length=9,
                  decrease_percentage=0.2, atr_length=13, atr_multiplier=1.5,
-                 sd_length=13, sd_multiplier=2, atr_min_multiplier=0.8, atr_max_multiplier=3, rsi_length=14, rsi_buy_threshold=30, rsi_sell_threshold=70):
+                 sd_length=13, sd_multiplier=2, atr_min_multiplier=0.8, atr_max_multiplier=3, rsi_length=14, rsi_buy_threshold=30, rsi_sell_threshold=70,
+                 incremental=False):
         # Initialize parameters
         self.fast_length = fast_length
         self.slow_length = slow_length
@@ -33,8 +50,46 @@ class MACDATRStrategy:
         self.atr = None
         self.stop_loss_price = None
         self.stop_profit_target = None
+        self.bar_count = 0
+
+        # Incremental mode keeps running indicator state instead of re-running talib
+        # over the whole history on every bar (O(1) per bar instead of O(n)).
+        # Indicator values match talib to within 1e-10 relative, so signals only
+        # differ if a threshold comparison falls inside that tolerance.
+        # Only the history the rules look back on is kept, so memory stays constant too.
+        self.incremental = incremental
+        if incremental:
+            self.peak_values = deque(maxlen=2)
+            self.close_prices = deque(maxlen=2)
+            self.high = deque(maxlen=1)
+            self.low = deque(maxlen=1)
+            self.macd_state = MACD(fast_length, slow_length, signal_length)
+            self.rsi_state = RSI(rsi_length)
+            self.atr_state = ATR(atr_length)
+            self.sd_state = StdDev(sd_length)
+            self.recent_macd_hist = deque(maxlen=3)
+
+    def update_indicators(self, close, high, low):
+        # Advance the running indicators by one bar
+        _, _, hist = self.macd_state.update(close)
+        self.recent_macd_hist.append(hist)
+        self.atr_state.update(high, low, close)
+        self.sd_state.update(close)
+        return self.recent_macd_hist, [self.rsi_state.update(close)]
+
+    def current_sd(self):
+        if self.incremental:
+            return self.sd_state.value
+        return self.calculate_sd()[-1]
+
+    def current_atr(self, dynamic_multiplier):
+        if self.incremental:
+            return self.atr_state.value * dynamic_multiplier
+        return self.calculate_atr(dynamic_multiplier)[-1]
 
     def calculate_macd(self):
+        if profiler.enabled:
+            profiler.count('talib_calls')
         macd, macd_signal, macd_hist = talib.MACD(np.array(self.close_prices),
                                                   fastperiod=self.fast_length,
                                                   slowperiod=self.slow_length,
@@ -43,6 +98,8 @@ class MACDATRStrategy:
 
     def calculate_atr(self, dynamic_multiplier):
         # Apply dynamic ATR multiplier to adjust stop-loss and profit levels
+        if profiler.enabled:
+            profiler.count('talib_calls')
         return talib.ATR(np.array(self.high),
                          np.array(self.low),
                          np.array(self.close_prices),
@@ -50,14 +107,18 @@ class MACDATRStrategy:
 
     def calculate_rsi(self):
         # Calculate RSI using close prices
+        if profiler.enabled:
+            profiler.count('talib_calls')
         return talib.RSI(np.array(self.close_prices), timeperiod=self.rsi_length)
 
     def calculate_sd(self):
+        if profiler.enabled:
+            profiler.count('talib_calls')
         return talib.STDDEV(np.array(self.close_prices), timeperiod=self.sd_length)
 
     def calculate_dynamic_atr_multiplier(self):
         # Calculate volatility using standard deviation of recent close prices
-        volatility = self.calculate_sd()[-1]
+        volatility = self.current_sd()
         # Adjust the ATR multiplier dynamically based on volatility
         dynamic_multiplier = self.atr_multiplier * (1 + volatility)
         # Clamp the multiplier between the min and max limits
@@ -68,27 +129,44 @@ class MACDATRStrategy:
         self.close_prices.append(close)
         self.high.append(high)
         self.low.append(low)
+        self.bar_count += 1
+        profiling = profiler.enabled
+        if profiling:
+            profiler.count('bars_processed')
 
         # Calculate MACD
-        macd, macd_signal, macd_hist = self.calculate_macd()
-        rsi = self.calculate_rsi()
+        with profiler.phase('indicators'):
+            if self.incremental:
+                macd_hist, rsi = self.update_indicators(close, high, low)
+            else:
+                macd, macd_signal, macd_hist = self.calculate_macd()
+                rsi = self.calculate_rsi()
 
-        if len(macd_hist) < self.slow_length + self.signal_length + 1:
+        if self.bar_count < self.slow_length + self.signal_length + 1:
             return None  # Not enough data to make a decision
 
-        current_macd_hist = macd_hist[-1]
-        previous_macd_hist = macd_hist[-2]
-        two_bars_ago_macd_hist = macd_hist[-3]
-        current_rsi = rsi[-1]
+        with profiler.phase('peak_detection'):
+            current_macd_hist = macd_hist[-1]
+            previous_macd_hist = macd_hist[-2]
+            two_bars_ago_macd_hist = macd_hist[-3]
+            current_rsi = rsi[-1]
+
+            # Check for peak conditions
+            if (previous_macd_hist <= two_bars_ago_macd_hist and
+                    current_macd_hist > previous_macd_hist and
+                    two_bars_ago_macd_hist < 0 and
+                    previous_macd_hist < 0 and
+                    current_macd_hist < 0):
+                self.peak_values.append(previous_macd_hist)
 
-        # Check for peak conditions
-        if (previous_macd_hist <= two_bars_ago_macd_hist and
-                current_macd_hist > previous_macd_hist and
-                two_bars_ago_macd_hist < 0 and
-                previous_macd_hist < 0 and
-                current_macd_hist < 0):
-            self.peak_values.append(previous_macd_hist)
+        with profiler.phase('signal_generation'):
+            signal = self.check_signal(close, high, low, current_rsi)
+        if profiling and signal is not None:
+            profiler.count('buy_signals' if signal['signal'] == "Buy" else 'sell_signals')
+        return signal
 
+    def check_signal(self, close, high, low, current_rsi):
+        # Stop-loss/stop-profit exits while in a position, otherwise the buy rules
         # Generate sell signal
         if self.is_in_position:
             if low <= self.stop_loss_price:
@@ -115,10 +193,12 @@ class MACDATRStrategy:
             else:
                 return None
 
-        if len(self.peak_values) >= 2:
+        # Cheap checks first: most bars fail the RSI or peak conditions, and then the standard
+        # deviation (a talib call over the whole history when not incremental) is never needed
+        if len(self.peak_values) >= 2 and current_rsi <= self.rsi_buy_threshold:
             peak_current = self.peak_values[-1]
             peak_previous = self.peak_values[-2]
-            sd_current = self.calculate_sd()[-1]
+            sd_current = self.current_sd()
 
             condition_decrease = (peak_previous * (1 - self.decrease_percentage) < peak_current)
 
@@ -126,12 +206,10 @@ class MACDATRStrategy:
             if (condition_decrease and
                     (self.close_prices[-2] - sd_current * self.sd_multiplier > self.close_prices[-1])
                     and not self.is_in_position
-                    and current_rsi <= self.rsi_buy_threshold
                     ):
                 self.buy_price = close
                 dynamic_atr_multiplier = self.calculate_dynamic_atr_multiplier()  # Adjusted multiplier
-                atr = self.calculate_atr(dynamic_atr_multiplier)
-                self.atr = atr[-1]
+                self.atr = self.current_atr(dynamic_atr_multiplier)
                 self.stop_profit_target = self.buy_price + 1.5 * (self.buy_price - (low - self.atr))
                 self.stop_loss_price = low - self.atr
                 self.is_in_position = True
@@ -139,7 +217,116 @@ class MACDATRStrategy:
                     "signal": "Buy",
                     "buy_price": self.buy_price,
                     "stop_profit_target": self.stop_profit_target,
-                    "stop_loss_price": self.stop_loss_price
+                    "stop_loss_price": self.stop_loss_price,
+                    "score": buy_score(self.close_prices[-2], close, sd_current)
                 }
 
-        return None
\ No newline at end of file
+        return None
+
+    def get_state(self):
+        # Everything update() depends on, as plain Python values (see StateSnapshot)
+        state = {
+            'params': {name: getattr(self, name) for name in STRATEGY_PARAMS},
+            'incremental': self.incremental,
+            'bar_count': self.bar_count,
+            'peak_values': list(self.peak_values),
+            'close_prices': list(self.close_prices),
+            'high': list(self.high),
+            'low': list(self.low),
+            'is_in_position': self.is_in_position,
+            'buy_price': self.buy_price,
+            'atr': self.atr,
+            'stop_loss_price': self.stop_loss_price,
+            'stop_profit_target': self.stop_profit_target,
+        }
+        if self.incremental:
+            state['indicators'] = {'macd': self.macd_state.get_state(), 'rsi': self.rsi_state.get_state(),
+                                   'atr': self.atr_state.get_state(), 'sd': self.sd_state.get_state()}
+            state['recent_macd_hist'] = list(self.recent_macd_hist)
+        return state
+
+    def set_state(self, state):
+        # Restore a get_state() copy; the strategy must have been built with the same parameters and mode
+        if state['incremental'] != self.incremental or state['params'] != {name: getattr(self, name) for name in STRATEGY_PARAMS}:
+            raise ValueError("Strategy state was saved with different parameters")
+        self.bar_count = state['bar_count']
+        for name in ['peak_values', 'close_prices', 'high', 'low']:
+            history = getattr(self, name)
+            history.clear()
+            history.extend(state[name])
+        self.is_in_position = state['is_in_position']
+        self.buy_price = state['buy_price']
+        self.atr = state['atr']
+        self.stop_loss_price = state['stop_loss_price']
+        self.stop_profit_target = state['stop_profit_target']
+        if self.incremental:
+            indicators = state['indicators']
+            self.macd_state.set_state(indicators['macd'])
+            self.rsi_state.set_state(indicators['rsi'])
+            self.atr_state.set_state(indicators['atr'])
+            self.sd_state.set_state(indicators['sd'])
+            self.recent_macd_hist.clear()
+            self.recent_macd_hist.extend(state['recent_macd_hist'])
+
+    @classmethod
+    def from_state(cls, state):
+        strategy = cls(incremental=state['incremental'], **state['params'])
+        strategy.set_state(state)
+        return strategy
+
+    def indicator_params(self):
+        # {indicator: the parameters its array depends on}; strategies with equal entries can share that array
+        return {
+            "macd_hist": (self.fast_length, self.slow_length, self.signal_length),
+            "rsi": (self.rsi_length,),
+            "sd": (self.sd_length,),
+            "atr": (self.atr_length,),
+        }
+
+    def calculate_indicator(self, name, close, high, low):
+        # One full-series indicator array (a key of indicator_params)
+        if profiler.enabled:
+            profiler.count('talib_calls')
+        close = np.asarray(close, dtype=float)
+        if name == "macd_hist":
+            _, _, macd_hist = talib.MACD(close, fastperiod=self.fast_length, slowperiod=self.slow_length,
+                                         signalperiod=self.signal_length)
+            return macd_hist
+        if name == "rsi":
+            return talib.RSI(close, timeperiod=self.rsi_length)
+        if name == "sd":
+            return talib.STDDEV(close, timeperiod=self.sd_length)
+        if name == "atr":
+            return talib.ATR(np.asarray(high, dtype=float), np.asarray(low, dtype=float), close, timeperiod=self.atr_length)
+        raise ValueError(f"Unknown indicator: {name}")
+
+    def calculate_indicators(self, close, high, low):
+        # Full-series indicator arrays used by generate_signals
+        return {name: self.calculate_indicator(name, close, high, low) for name in self.indicator_params()}
+
+    def generate_signals(self, close, high, low, indicators=None, start=0, end=None):
+        # Batch version of `update` for offline backtests: compute every indicator once
+        # over the full arrays, then run the peak/stop state machine in one pass.
+        # Returns arrays aligned with the input bars; the prices are NaN where no event fired.
+        # The strategy's own bar-by-bar state is left untouched.
+        # `indicators` may be a calculate_indicators() result computed earlier for the same bars.
+        # start/end restrict trading to bars [start, end): the state machine starts flat at
+        # `start` while the indicators keep their warm-up from the bars before it.
+        close = np.asarray(close, dtype=float)
+        high = np.asarray(high, dtype=float)
+        low = np.asarray(low, dtype=float)
+        end = len(close) if end is None else end
+
+        if indicators is None:
+            with profiler.phase('indicators'):
+                indicators = self.calculate_indicators(close, high, low)
+        # Peak detection and signal generation share one loop, so they are timed together.
+        # The peak/stop state machine is compiled when Numba is installed (see SignalKernel)
+        with profiler.phase('signal_generation'):
+            signals = run_signal_kernel(self, close, high, low, indicators, max(self.slow_length + self.signal_length, start), end)
+
+        if profiler.enabled:
+            profiler.count('bars_processed', max(end - start, 0))
+            profiler.count('buy_signals', int(signals["buy"].sum()))
+            profiler.count('sell_signals', int(signals["sell"].sum()))
+        return signals
\ No newline at end of file
@@ -0,0 +1,85 @@
+import heapq
+
+
+class TriggerIndex:
+    # Stop-loss and profit-target levels of the open positions, kept sorted per symbol: a max-heap
+    # of stops and a min-heap of targets. check() compares the price with the heap tops and only
+    # pops the levels it actually crossed, so a price update costs O(1) when nothing triggers and
+    # O(log n) per exit, however many positions are open.
+    # Positions closed through remove() are dropped from the heaps lazily.
+    def __init__(self):
+        self.stops = {}  # symbol -> heap of (-stop_loss_price, seq, position_id)
+        self.targets = {}  # symbol -> heap of (stop_profit_target, seq, position_id)
+        self.positions = {}  # position_id -> (symbol, seq) of its live heap entries
+        self.live = {}  # symbol -> number of open positions
+        self.seq = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, position_id):
+        return position_id in self.positions
+
+    def symbols(self):
+        # Symbols with at least one open position
+        return list(self.live)
+
+    def add(self, symbol, position_id, stop_loss_price, stop_profit_target):
+        # Register (or replace) a position's exit levels
+        self.remove(position_id)
+        self.seq += 1
+        self.positions[position_id] = (symbol, self.seq)
+        self.live[symbol] = self.live.get(symbol, 0) + 1
+        heapq.heappush(self.stops.setdefault(symbol, []), (-stop_loss_price, self.seq, position_id))
+        heapq.heappush(self.targets.setdefault(symbol, []), (stop_profit_target, self.seq, position_id))
+
+    def remove(self, position_id):
+        # Forget a position closed for any other reason than a trigger
+        entry = self.positions.pop(position_id, None)
+        if entry is None:
+            return
+        symbol = entry[0]
+        self.release(symbol)
+        # Rebuild the heaps once most of their entries belong to closed positions
+        if len(self.stops.get(symbol, ())) > 2 * self.live.get(symbol, 0) + 8:
+            self.compact(symbol)
+
+    def release(self, symbol):
+        self.live[symbol] -= 1
+        if self.live[symbol] == 0:
+            del self.live[symbol]
+            self.stops.pop(symbol, None)
+            self.targets.pop(symbol, None)
+
+    def compact(self, symbol):
+        seqs = {seq for stock, seq in self.positions.values() if stock == symbol}
+        for heaps in (self.stops, self.targets):
+            heap = [entry for entry in heaps.get(symbol, ()) if entry[1] in seqs]
+            heapq.heapify(heap)
+            heaps[symbol] = heap
+
+    def check(self, symbol, low, high=None):
+        # Positions of `symbol` whose stop is at or above `low` or whose target is at or below `high`
+        # (default: high = low, for a single trade price). Returns [(position_id, 'Stop'/'Target', level)]
+        # and removes them. When one bar crosses both levels, the stop wins, like MACDATRStrategy.
+        if symbol not in self.live:
+            return []
+        if high is None:
+            high = low
+        triggered = []
+        stops = self.stops[symbol]
+        while stops and -stops[0][0] >= low:
+            level, seq, position_id = heapq.heappop(stops)
+            if self.positions.get(position_id, (None, None))[1] == seq:
+                triggered.append((position_id, 'Stop', -level))
+                # Its target entry is now stale
+                self.positions[position_id] = (symbol, None)
+        targets = self.targets[symbol]
+        while targets and targets[0][0] <= high:
+            level, seq, position_id = heapq.heappop(targets)
+            if self.positions.get(position_id, (None, None))[1] == seq:
+                triggered.append((position_id, 'Target', level))
+        for position_id, _, _ in triggered:
+            del self.positions[position_id]
+            self.release(symbol)
+        return triggered
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from FutuBackTest import run_backtest
+from PricePanel import PricePanel
+from IndicatorCache import IndicatorCache
+from ParameterSweep import share_panel, attach_panel
+
+# Walk-forward optimization: pick the best parameter set on each in-sample window, trade it
+# on the following out-of-sample window, and chain the out-of-sample equity curves.
+# Windows are independent, so they run in parallel. Indicators are computed once per stock
+# and indicator parameters over the whole panel and shared by every window a worker runs, so
+# each window starts with warmed-up indicators instead of recomputing the MACD warm-up.
+
+
+def walk_forward_windows(n_bars, train_bars, test_bars, step=None):
+    # (train_start, train_end, test_end) bar indices of rolling windows; the last test window may be shorter
+    step = step or test_bars
+    windows = []
+    train_start = 0
+    while train_start + train_bars < n_bars:
+        train_end = train_start + train_bars
+        windows.append((train_start, train_end, min(train_end + test_bars, n_bars)))
+        train_start += step
+    return windows
+
+
+_worker_panel = None
+_worker_shm = None
+_indicator_cache = None
+
+
+def _init_worker(panel_info, cache_dir=None):
+    global _worker_panel, _worker_shm, _indicator_cache
+    _worker_shm, _worker_panel = attach_panel(panel_info)
+    _indicator_cache = IndicatorCache(cache_dir=cache_dir)
+
+
+def _run_window(args):
+    (train_start, train_end, test_end), param_sets, objective = args
+    best_params, best_score = None, None
+    for params in param_sets:
+        portfolio = run_backtest(_worker_panel, 'precomputed', params, (train_start, train_end), _indicator_cache)
+        score = portfolio.get_summary()[objective]
+        if best_score is None or score > best_score:
+            best_params, best_score = params, score
+
+    portfolio = run_backtest(_worker_panel, 'precomputed', best_params, (train_end, test_end), _indicator_cache)
+    return {
+        "train_start": train_start,
+        "train_end": train_end,
+        "test_end": test_end,
+        "params": best_params,
+        "in_sample_" + objective: best_score,
+        "out_of_sample": portfolio.get_summary(),
+        "balance_history": np.array(portfolio.balance_history),
+        "initial_balance": portfolio.initial_balance,
+    }
+
+
+def walk_forward(panel, param_sets, train_bars, test_bars, step=None, objective='final_return', max_workers=None,
+                 cache_dir=None):
+    """
+    Run a walk-forward optimization over MACDATRStrategy parameter sets.
+
+    :param panel: A PricePanel (or {stock: DataFrame}).
+    :param param_sets: Candidate MACDATRStrategy keyword dicts, e.g. from grid_search_params.
+    :param train_bars: Length of each in-sample window in bars.
+    :param test_bars: Length of each out-of-sample window in bars.
+    :param step: Bars between window starts (default: test_bars, i.e. back-to-back test windows).
+    :param objective: PortfolioManager.get_summary() key maximized in-sample.
+    :param max_workers: Number of worker processes (default: os.cpu_count()).
+    :param cache_dir: Optional IndicatorCache directory shared by the workers and later runs.
+    :return: (windows DataFrame, stitched out-of-sample equity curve as a NumPy array). The windows
+        table reports each whole test window; the stitched curve covers every out-of-sample bar once.
+    """
+    if not isinstance(panel, PricePanel):
+        panel = PricePanel.from_frames(panel)
+    windows = walk_forward_windows(len(panel.timestamps), train_bars, test_bars, step)
+
+    shm, panel_info = share_panel(panel)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_worker,
+                                 initargs=(panel_info, cache_dir)) as executor:
+            results = list(executor.map(_run_window, [(window, param_sets, objective) for window in windows]))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Chain the out-of-sample curves: each window continues from where the previous one ended.
+    # When test windows overlap (step < test_bars), a window only contributes the bars before the
+    # next window's test period starts, so every bar is counted once.
+    equity = []
+    level = 1.0
+    for k, result in enumerate(results):
+        curve = result.pop("balance_history") / result.pop("initial_balance")
+        if k + 1 < len(results):
+            curve = curve[:results[k + 1]["train_end"] - result["train_end"]]
+        equity.append(curve * level)
+        if len(curve):
+            level *= curve[-1]
+    equity_curve = np.concatenate(equity) if equity else np.array([])
+
+    windows_table = pd.DataFrame([{**{k: v for k, v in result.items() if k != "out_of_sample"},
+                                   **{"out_of_sample_" + k: v for k, v in result["out_of_sample"].items()}}
+                                  for result in results])
+    return windows_table, equity_curve
@@ -0,0 +1,45 @@
+import pytest
+from Benchmark import synthetic_frames
+from KlineCache import KlineCache
+from ResultStore import ResultStore
+import BacktestCLI
+
+SYMBOLS = ['SIM.00000', 'SIM.00001', 'SIM.00002']
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    # 300 hourly bars per symbol from 2015-01-01, already in the K-line cache
+    cache = KlineCache(str(tmp_path / 'kline_cache'))
+    for symbol, frame in synthetic_frames(len(SYMBOLS), 300).items():
+        cache.store(symbol, 'K_60M', frame, '2015-01-01', '2015-01-13')
+    return cache.cache_dir
+
+
+def data_args(cache_dir):
+    return ['--symbols', *SYMBOLS, '--start', '2015-01-01', '--end', '2015-01-13', '--cache-dir', cache_dir, '--offline']
+
+
+def test_offline_backtest_reads_the_cache(cache_dir, tmp_path, capsys):
+    store_dir = str(tmp_path / 'results')
+    assert BacktestCLI.main(['backtest', *data_args(cache_dir), '--param', 'rsi_buy_threshold=45', '--quiet',
+                             '--store-dir', store_dir, '--label', 'cli']) == 0
+    out = capsys.readouterr().out
+    assert out.startswith('final_return=')
+    store = ResultStore(store_dir)
+    run = store.top(1)
+    assert len(store) == 1 and run['label'][0] == 'cli' and run['n_bars'][0] == 300
+    assert run['rsi_buy_threshold'][0] == 45
+    store.close()
+
+
+def test_offline_sweep(cache_dir, capsys):
+    assert BacktestCLI.main(['sweep', *data_args(cache_dir), '--grid', 'slow_length=26,34', '--workers', '1',
+                             '--sort', 'sharpe']) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].split()[:2] == ['slow_length', 'final_return'] and len(out) == 3
+
+
+def test_unknown_sort_column_exits_before_the_sweep(cache_dir):
+    with pytest.raises(SystemExit, match="Invalid --sort column 'sharp'.*slow_length, final_return"):
+        BacktestCLI.main(['sweep', *data_args(cache_dir), '--grid', 'slow_length=26,34', '--sort', 'sharp'])
@@ -0,0 +1,128 @@
+import time
+import threading
+import pandas as pd
+from futu import RET_OK, RET_ERROR
+from FutuFetchingData import RateLimiter, fetch_futu_data_bulk
+from KlineCache import KlineCache
+
+
+class FakeQuoteContext:
+    # Stand-in for OpenQuoteContext: serves a synthetic hourly history page by page after `latency` seconds.
+    # With failing_page, the request for that page (0 = the first) returns an error.
+    def __init__(self, log, latency=0.01, failing_page=None):
+        self.log = log
+        self.latency = latency
+        self.failing_page = failing_page
+        self.closed = False
+        self.busy = False
+
+    def request_history_kline(self, code, start=None, end=None, ktype=None, max_count=500, page_req_key=None):
+        assert not self.busy, "a quote context was shared by two threads"
+        self.busy = True
+        try:
+            started = time.monotonic()
+            time.sleep(self.latency)
+            with self.log['lock']:
+                self.log['requests'].append((code, started, time.monotonic()))
+            times = pd.date_range(f'{start} 09:30', f'{end} 16:00', freq='h')
+            times = times[(times.hour >= 9) & (times.hour <= 15)]
+            offset = page_req_key or 0
+            if self.failing_page is not None and offset == self.failing_page * max_count:
+                return RET_ERROR, 'request failed', None
+            page = times[offset:offset + max_count]
+            data = pd.DataFrame({'code': code, 'time_key': page.strftime('%Y-%m-%d %H:%M:%S'),
+                                 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 100})
+            next_key = offset + max_count if offset + max_count < len(times) else None
+            return RET_OK, data, next_key
+        finally:
+            self.busy = False
+
+    def close(self):
+        self.closed = True
+
+
+def fake_factory(latency=0.01, failing_page=None):
+    log = {'lock': threading.Lock(), 'requests': [], 'contexts': []}
+
+    def factory():
+        quote_ctx = FakeQuoteContext(log, latency, failing_page)
+        log['contexts'].append(quote_ctx)
+        return quote_ctx
+    return factory, log
+
+
+def test_bulk_fetch_pages_and_deduplicates():
+    factory, log = fake_factory()
+    frames = fetch_futu_data_bulk(['HK.00700', 'HK.00388', 'HK.00700'], '2024-01-01', '2024-01-31', 'K_60M',
+                                  max_count=50, num_contexts=2, context_factory=factory)
+
+    assert list(frames) == ['HK.00700', 'HK.00388']
+    for code, frame in frames.items():
+        assert len(frame) == 31 * 7  # Every page was concatenated
+        assert frame['time_key'].is_unique and frame['time_key'].is_monotonic_increasing
+        assert (frame['code'] == code).all()
+    assert len(log['requests']) == 2 * 5  # 217 bars in pages of 50
+    assert len(log['contexts']) == 2 and all(quote_ctx.closed for quote_ctx in log['contexts'])
+
+
+def test_bulk_fetch_runs_concurrently():
+    factory, log = fake_factory(latency=0.05)
+    codes = [f'HK.{i:05d}' for i in range(8)]
+    fetch_futu_data_bulk(codes, '2024-01-01', '2024-01-02', 'K_60M', num_contexts=4, context_factory=factory)
+    requests = sorted((started, finished) for _, started, finished in log['requests'])
+    assert len(requests) == 8
+    # Some request started before the previous one had finished
+    assert any(later[0] < earlier[1] for earlier, later in zip(requests, requests[1:]))
+
+
+def test_bulk_fetch_respects_rate_limit():
+    factory, log = fake_factory(latency=0.0)
+    codes = [f'HK.{i:05d}' for i in range(6)]
+    fetch_futu_data_bulk(codes, '2024-01-01', '2024-01-02', 'K_60M', num_contexts=3, max_requests=2,
+                         per_seconds=0.2, context_factory=factory)
+    times = sorted(started for _, started, _ in log['requests'])
+    assert len(times) == 6
+    for i in range(2, len(times)):
+        # No more than two requests in any 0.2 s window
+        assert times[i] - times[i - 2] >= 0.2 - 1e-3
+
+
+def test_rate_limiter_window():
+    limiter = RateLimiter(max_requests=3, per_seconds=0.1)
+    started = time.monotonic()
+    for _ in range(7):
+        limiter.wait()
+    assert time.monotonic() - started >= 0.2
+
+
+def test_bulk_fetch_through_cache(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    factory, log = fake_factory()
+    first = fetch_futu_data_bulk(['HK.00700'], '2024-01-01', '2024-01-10', 'K_60M', context_factory=factory, cache=cache)
+    assert len(log['contexts']) == 2
+
+    # Fully cached: no quote context is opened
+    factory, log = fake_factory()
+    again = fetch_futu_data_bulk(['HK.00700'], '2024-01-01', '2024-01-10', 'K_60M', context_factory=factory, cache=cache)
+    assert log['contexts'] == []
+    pd.testing.assert_frame_equal(again['HK.00700'].reset_index(drop=True), first['HK.00700'].reset_index(drop=True))
+
+    # Only the new days are requested
+    fetch_futu_data_bulk(['HK.00700'], '2024-01-01', '2024-01-15', 'K_60M', context_factory=factory, cache=cache)
+    assert len(log['requests']) == 1
+
+
+def test_page_error_caches_nothing_for_the_gap(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    factory, _ = fake_factory(failing_page=2)
+    frames = fetch_futu_data_bulk(['HK.00700'], '2024-01-01', '2024-01-31', 'K_60M', max_count=50,
+                                  context_factory=factory, cache=cache)
+
+    # The first two pages arrived, but the range is not marked as covered
+    assert frames['HK.00700'] is None
+    assert cache.missing('HK.00700', 'K_60M', '2024-01-01', '2024-01-31') == [('2024-01-01', '2024-01-31')]
+
+    factory, log = fake_factory()
+    frames = fetch_futu_data_bulk(['HK.00700'], '2024-01-01', '2024-01-31', 'K_60M', max_count=50,
+                                  context_factory=factory, cache=cache)
+    assert len(frames['HK.00700']) == 31 * 7
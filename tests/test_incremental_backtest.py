@@ -0,0 +1,24 @@
+from Benchmark import synthetic_frames
+from PricePanel import PricePanel
+from IncrementalBacktest import continue_backtest, verify_continuation, time_keys
+
+
+def test_continuation_matches_full_rerun(tmp_path):
+    frames = synthetic_frames(8, 1500, seed=7)
+    frames['SIM.00003'] = frames['SIM.00003'].iloc[::2]  # A stock with gaps
+    full = PricePanel.from_frames(frames)
+    keys = time_keys(full.timestamps)
+    snapshot = str(tmp_path / 'snapshot.bin')
+
+    cuts = [0, 600, 601, 1500]
+    for begin, end in zip(cuts, cuts[1:]):
+        # Each night's panel overlaps the bars already processed
+        first = keys[max(begin - 20, 0)]
+        part = {stock: frame[(frame['time_key'] >= first) & (frame['time_key'] <= keys[end - 1])]
+                for stock, frame in frames.items()}
+        portfolio, new_bars = continue_backtest(PricePanel.from_frames(part), snapshot)
+        assert new_bars == end - begin
+
+    report = verify_continuation(full, portfolio)
+    assert report['matches'], report
+    assert report['trades'] > 0
@@ -0,0 +1,63 @@
+import numpy as np
+from Benchmark import synthetic_ohlc
+from IndicatorCache import IndicatorCache
+from TradingStrategy import MACDATRStrategy
+
+
+def bars(seed=0):
+    _, high, low, close = synthetic_ohlc(500, seed=seed)
+    return close, high, low
+
+
+def assert_same(cached, fresh):
+    assert cached.keys() == fresh.keys()
+    for name in fresh:
+        np.testing.assert_array_equal(cached[name], fresh[name])
+
+
+def test_second_lookup_is_a_hit_and_matches_a_fresh_compute():
+    close, high, low = bars()
+    strategy = MACDATRStrategy()
+    cache = IndicatorCache()
+    first = cache.indicators('SIM', strategy, close, high, low)
+    assert cache.stats()['misses'] == 4 and cache.stats()['hits'] == 0
+
+    second = cache.indicators('SIM', strategy, close, high, low)
+    assert cache.stats()['hits'] == 4 and cache.stats()['misses'] == 4
+    assert all(second[name] is first[name] for name in first)
+    assert_same(second, MACDATRStrategy().calculate_indicators(close, high, low))
+
+    # Only the RSI depends on rsi_length
+    cache.indicators('SIM', MACDATRStrategy(rsi_length=7), close, high, low)
+    assert cache.stats()['misses'] == 5
+
+
+def test_least_recently_used_arrays_are_evicted():
+    cache = IndicatorCache(max_bytes=3 * 800)  # Room for three 100-float arrays
+    for key in 'abc':
+        cache.put(key, np.zeros(100))
+    assert cache.get('a') is not None  # 'b' is now the least recently used
+    cache.put('d', np.zeros(100))
+    assert cache.stats()['evictions'] == 1
+    assert cache.get('b') is None
+    assert all(cache.get(key) is not None for key in 'acd')
+    assert cache.nbytes == 3 * 800
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    close, high, low = bars(seed=3)
+    strategy = MACDATRStrategy()
+    first = IndicatorCache(cache_dir=str(tmp_path)).indicators('SIM', strategy, close, high, low)
+
+    cache = IndicatorCache(cache_dir=str(tmp_path))
+    second = cache.indicators('SIM', strategy, close, high, low)
+    assert cache.stats()['disk_hits'] == 4 and cache.stats()['misses'] == 0
+    assert_same(second, first)
+
+    # Different bars give a new fingerprint, so nothing stale is read
+    close[-1] += 1.0
+    cache.indicators('SIM', strategy, close, high, low)
+    assert cache.stats()['misses'] == 4
+
+    cache.clear(disk=True)
+    assert len(cache) == 0 and not list(tmp_path.rglob('*.npy'))
@@ -0,0 +1,44 @@
+import numpy as np
+import talib
+from Indicators import MACD, RSI, ATR, StdDev
+
+
+def random_walk(n=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 + np.cumsum(rng.normal(0, 0.05, n)), 2)
+    close[1000:3000] = close[999]  # Long flat run
+    high = close + np.abs(rng.normal(0, 0.03, n))
+    low = close - np.abs(rng.normal(0, 0.03, n))
+    return close, high, low
+
+
+def assert_close(values, expected, rtol=1e-10):
+    values = np.array(values)
+    ready = ~np.isnan(expected)
+    assert np.array_equal(np.isnan(values), ~ready)
+    np.testing.assert_allclose(values[ready], expected[ready], rtol=rtol, atol=1e-12)
+
+
+def test_streaming_indicators_match_talib():
+    close, high, low = random_walk()
+    macd = MACD(13, 34, 9)
+    assert_close([macd.update(x)[2] for x in close], talib.MACD(close, 13, 34, 9)[2])
+    rsi = RSI(14)
+    assert_close([rsi.update(x) for x in close], talib.RSI(close, 14))
+    atr = ATR(13)
+    assert_close([atr.update(h, l, c) for h, l, c in zip(high, low, close)], talib.ATR(high, low, close, 13))
+    for period in (2, 13):
+        sd = StdDev(period)
+        assert_close([sd.update(x) for x in close], talib.STDDEV(close, period))
+
+
+def test_flat_prices():
+    close, _, _ = random_walk()
+    sd = StdDev(13)
+    values = [sd.update(x) for x in close]
+    assert values[2000] == 0.0
+    rsi = RSI(14)
+    values = [rsi.update(x) for x in close]
+    # The averages decay towards zero during the flat run but RSI keeps its last ratio, like talib
+    assert values[2999] > 0.0
+    assert abs(values[2999] - talib.RSI(close, 14)[2999]) < 1e-9
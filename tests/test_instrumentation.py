@@ -0,0 +1,73 @@
+import pytest
+import Instrumentation
+from Instrumentation import Profiler, profiler
+from Benchmark import synthetic_frames
+from FutuBackTest import run_backtest
+
+
+class FakeClock:
+    # Stands in for time.perf_counter_ns: each reading advances the clock by `step` nanoseconds
+    def __init__(self, step=1000):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def test_nested_phase_totals_and_collapsed_stacks(monkeypatch):
+    monkeypatch.setattr(Instrumentation.time, 'perf_counter_ns', FakeClock())
+    run = Profiler(enabled=True)
+    with run.phase('backtest'):          # reads 1 and 8
+        with run.phase('portfolio'):     # reads 2 and 3
+            pass
+        for _ in range(2):
+            with run.phase('mark_to_market'):  # reads 4/5 and 6/7
+                pass
+
+    report = run.report()['phases']
+    assert report['backtest']['seconds'] == pytest.approx(7e-6)
+    assert report['backtest']['self_seconds'] == pytest.approx(4e-6)
+    assert report['backtest;portfolio']['calls'] == 1
+    assert report['backtest;mark_to_market'] == {"seconds": pytest.approx(2e-6), "self_seconds": pytest.approx(2e-6), "calls": 2}
+    assert run.to_collapsed() == "backtest 4\nbacktest;mark_to_market 2\nbacktest;portfolio 1\n"
+
+
+def test_phase_is_popped_when_the_block_raises():
+    run = Profiler(enabled=True)
+    with pytest.raises(ValueError):
+        with run.phase('backtest'):
+            with run.phase('portfolio'):
+                raise ValueError("order rejected")
+    assert run.stack == []
+    with run.phase('mark_to_market'):
+        pass
+    assert sorted(run.timers) == ['backtest', 'backtest;portfolio', 'mark_to_market']
+
+
+def test_disabled_profiler_records_nothing():
+    run = Profiler()
+    with run.phase('backtest'):
+        pass
+    assert run.timers == {} and run.stack == []
+
+
+def test_backtest_phases_nest_under_backtest():
+    profiler.reset()
+    profiler.enable()
+    try:
+        run_backtest(synthetic_frames(2, 300, seed=1), mode='update')
+    finally:
+        profiler.disable()
+    report = profiler.report()
+    phases = report['phases']
+    assert profiler.stack == []
+    assert {'backtest', 'backtest;portfolio', 'backtest;mark_to_market', 'backtest;indicators'} <= set(phases)
+    assert phases['backtest;portfolio']['calls'] == 300
+    assert report['counters']['bars_processed'] == 600
+    children = sum(phase['seconds'] for path, phase in phases.items() if path.count(';') == 1)
+    assert children <= phases['backtest']['seconds']
+    stacks = [line.rpartition(' ')[0] for line in profiler.to_collapsed().splitlines()]
+    assert stacks == sorted(phases)
+    profiler.reset()
@@ -0,0 +1,33 @@
+import os
+import pandas as pd
+from KlineCache import KlineCache
+
+
+def bars(start, periods):
+    time_key = pd.date_range(f'{start} 09:30', periods=periods, freq='h').strftime('%Y-%m-%d %H:%M:%S')
+    return pd.DataFrame({'code': 'HK.00700', 'time_key': time_key, 'open': 1.0, 'high': 1.0, 'low': 1.0,
+                         'close': 1.0, 'volume': 100.0})
+
+
+def test_missing_ranges(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    assert cache.missing('HK.00700', 'K_60M', '2024-01-01', '2024-01-31') == [('2024-01-01', '2024-01-31')]
+    cache.store('HK.00700', 'K_60M', bars('2024-01-01', 12), '2024-01-01', '2024-01-01')
+    cache.store('HK.00700', 'K_60M', bars('2024-01-10', 12), '2024-01-10', '2024-01-12')
+    assert cache.missing('HK.00700', 'K_60M', '2024-01-01', '2024-01-31') == [('2024-01-02', '2024-01-09'),
+                                                                             ('2024-01-13', '2024-01-31')]
+
+
+def test_interrupted_writes_are_ignored(tmp_path):
+    cache = KlineCache(str(tmp_path))
+    cache.store('HK.00700', 'K_60M', bars('2024-01-01', 12), '2024-01-01', '2024-01-01')
+    entry_dir = cache.entry_dir('HK.00700', 'K_60M')
+    # Half-written files from a crash, under the current and an older temporary name
+    for name in ['.tmp_seg_000001.npz', 'seg_000000.npz.tmp.npz']:
+        with open(os.path.join(entry_dir, name), 'wb') as f:
+            f.write(b'partial')
+
+    assert len(cache.load('HK.00700', 'K_60M', '2024-01-01', '2024-01-02')) == 12
+    cache.store('HK.00700', 'K_60M', bars('2024-01-02', 12), '2024-01-02', '2024-01-02')
+    assert len(cache.load('HK.00700', 'K_60M', '2024-01-01', '2024-01-02')) == 24
+    assert cache.missing('HK.00700', 'K_60M', '2024-01-01', '2024-01-02') == []
@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+import pytest
+from LiveTrading import Broker, LiveEngine, PaperBroker
+from FutuBackTest import PortfolioManager
+
+
+def late_bar(engine, symbol, signal, close=10.0):
+    # Process one bar whose signal is decided long after the bar finished
+    engine.strategies[symbol].update = lambda close, high, low: signal
+    bar = {'code': symbol, 'time_key': '2024-01-02 10:00:00', 'open': close, 'high': close, 'low': close, 'close': close}
+    asyncio.run(engine.process(bar, time.perf_counter() - 1.0))
+
+
+def test_late_sell_still_closes_position():
+    broker = PaperBroker()
+    engine = LiveEngine(['SIM.00001'], broker, latency_budget=0.001)
+    engine.portfolio.buy_stock('SIM.00001', 9.0, 8.0, 12.0, 100)
+
+    late_bar(engine, 'SIM.00001', {'signal': 'Sell', 'sell_price': 10.0})
+
+    assert 'SIM.00001' not in engine.portfolio.positions
+    assert broker.orders == [('SIM.00001', 'Sell', 10.0, 100)]
+    assert engine.counters['budget_overruns'] == 1
+    assert engine.counters['stale_signals'] == 0
+
+
+def test_late_buy_is_skipped():
+    broker = PaperBroker()
+    engine = LiveEngine(['SIM.00001'], broker, latency_budget=0.001)
+
+    late_bar(engine, 'SIM.00001', {'signal': 'Buy', 'buy_price': 10.0, 'stop_loss_price': 9.0,
+                                   'stop_profit_target': 11.5, 'score': 1.0})
+
+    assert engine.portfolio.positions == {}
+    assert broker.orders == []
+    assert engine.counters['stale_signals'] == 1
+
+
+class ListSource:
+    # Pushes a fixed list of updates
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def run(self, symbols, push):
+        for row in self.rows:
+            await push(row)
+
+    def stop(self):
+        pass
+
+
+def bar(symbol, time_key, close, low=None):
+    return {'code': symbol, 'time_key': time_key, 'open': close, 'high': close, 'low': close if low is None else low,
+            'close': close}
+
+
+def test_intrabar_exit_comes_after_the_finished_bars():
+    broker = PaperBroker()
+    engine = LiveEngine(['SIM.00001', 'SIM.00002'], broker, PortfolioManager(initial_balance=100000),
+                        latency_budget=None, intrabar_exits=True)
+    for strategy in engine.strategies.values():
+        strategy.update = lambda close, high, low: None
+    engine.portfolio.buy_stock('SIM.00001', 10.0, 9.0, 12.0, 100)
+    engine.triggers.add('SIM.00001', 'SIM.00001', 9.0, 12.0)
+    cash = engine.portfolio.account_balance
+
+    # The first update of SIM.00001's next bar crosses the stop while SIM.00002's bar is still open
+    asyncio.run(engine.run(ListSource([bar('SIM.00001', '2024-01-02 10:00:00', 11.0),
+                                       bar('SIM.00002', '2024-01-02 10:00:00', 5.0),
+                                       bar('SIM.00001', '2024-01-02 11:00:00', 9.5, low=8.5),
+                                       bar('SIM.00002', '2024-01-02 11:00:00', 5.0)])))
+
+    assert broker.orders == [('SIM.00001', 'Sell', 9.0, 100)]
+    assert engine.counters['intrabar_exits'] == 1
+    # The 10:00 bar is marked to market with the position still open at its close
+    assert list(engine.portfolio.balance_history) == [cash + 100 * 11.0, cash + 100 * 9.0]
+
+
+def test_paper_trading_does_not_import_futu():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "import sys, LiveTrading, MarketReplay; print('futu' in sys.modules)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_broker_is_abstract():
+    with pytest.raises(TypeError):
+        Broker()
@@ -0,0 +1,23 @@
+from FutuBackTest import PortfolioManager
+
+
+def run_trades(prices):
+    portfolio = PortfolioManager(initial_balance=100000)
+    for buy_price, sell_price in prices:
+        portfolio.buy_stock('HK.00700', buy_price, buy_price * 0.9, buy_price * 1.2)
+        portfolio.record_balance(portfolio.account_balance + portfolio.positions['HK.00700']['num_shares'] * buy_price)
+        portfolio.sell_stock('HK.00700', sell_price)
+        portfolio.record_balance(portfolio.account_balance)
+    return portfolio
+
+
+def test_statistics_without_losses_or_wins(capsys):
+    for prices in ([], [(10.0, 12.0)], [(10.0, 8.0)]):
+        performance = run_trades(prices).get_statistics()
+        assert performance.total_trades == len(prices)
+        assert "Risk Reward Ratio: n/a" in capsys.readouterr().out
+
+
+def test_statistics_risk_reward(capsys):
+    run_trades([(10.0, 12.0), (10.0, 8.0)]).get_statistics()
+    assert "Risk Reward Ratio: 1:1.00" in capsys.readouterr().out
@@ -0,0 +1,41 @@
+import numpy as np
+from Benchmark import synthetic_frames
+from PricePanel import PricePanel
+from FutuBackTest import run_backtest
+from TradingStrategy import MACDATRStrategy
+from ResultStore import ResultStore, panel_fingerprint
+
+LOOSE = {'rsi_buy_threshold': 45, 'sd_multiplier': 1}
+
+
+def test_save_query_and_read_back_runs(tmp_path):
+    panel = PricePanel.from_frames(synthetic_frames(3, 800, seed=5))
+    store = ResultStore(str(tmp_path / 'results'))
+    run_ids = {}
+    for slow_length in (26, 34):
+        params = dict(LOOSE, slow_length=slow_length)
+        portfolio = run_backtest(panel, strategy_params=params)
+        run_ids[slow_length] = store.save(portfolio, params, panel, mode='precomputed', label='round trip')
+    assert len(store) == 2
+
+    top = store.top(5, 'sharpe', slow_length=34)
+    assert top['run_id'].tolist() == [run_ids[34]]
+    row = top.iloc[0]
+    assert row['label'] == 'round trip' and row['n_symbols'] == 3
+    assert row['rsi_buy_threshold'] == 45 and row['fast_length'] == MACDATRStrategy().fast_length  # Defaults are filled in
+    assert row['data_fingerprint'] == panel_fingerprint(panel)
+
+    # Reopening the directory sees the same runs
+    store.close()
+    store = ResultStore(str(tmp_path / 'results'))
+    portfolio = run_backtest(panel, strategy_params=dict(LOOSE, slow_length=34))
+    ledger = store.trades(run_ids[34])
+    assert len(ledger) == portfolio.n_trades > 0
+    assert set(ledger['symbol']) <= set(panel.symbols)
+    np.testing.assert_array_equal(ledger['price'].to_numpy(), portfolio.trades[:portfolio.n_trades]['price'])
+    assert row['total_trades'] == portfolio.get_performance().total_trades
+
+    curves = store.equity_curves(list(run_ids.values()))
+    assert list(curves.columns) == list(run_ids.values())
+    np.testing.assert_allclose(curves[run_ids[34]].to_numpy(), portfolio.balance_history)
+    store.close()
@@ -0,0 +1,24 @@
+import pytest
+import SignalKernel
+from Benchmark import synthetic_frames
+from PricePanel import PricePanel
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return PricePanel.from_frames(synthetic_frames(20, 2000))
+
+
+def test_kernel_matches_update_path(panel):
+    counts = SignalKernel.check_parity(panel)
+    assert counts['update'] > 0
+    assert len(set(counts.values())) == 1
+
+
+def test_parity_check_catches_a_wrong_kernel(panel, monkeypatch):
+    original = SignalKernel._strategy_params
+    # A kernel that reads sd_multiplier wrongly trades differently from the reference
+    monkeypatch.setattr(SignalKernel, '_strategy_params',
+                        lambda strategy: (original(strategy)[0], original(strategy)[1] * 0.5) + original(strategy)[2:])
+    with pytest.raises(AssertionError):
+        SignalKernel.check_parity(panel)
@@ -0,0 +1,51 @@
+import struct
+import pickle
+from Benchmark import synthetic_ohlc
+from TradingStrategy import MACDATRStrategy
+from StateSnapshot import SNAPSHOT_MAGIC, save_snapshot, load_snapshot
+
+# Loose thresholds, so the synthetic series trade often after the snapshot
+PARAMS = {'rsi_buy_threshold': 45, 'sd_multiplier': 1}
+
+
+def run(strategy, close, high, low):
+    return [strategy.update(c, h, l) for c, h, l in zip(close, high, low)]
+
+
+def test_snapshot_round_trip(tmp_path):
+    _, high, low, close = synthetic_ohlc(3000, 1, volatility=0.02)
+    reference = MACDATRStrategy(incremental=True, **PARAMS)
+    expected = run(reference, close, high, low)
+
+    strategy = MACDATRStrategy(incremental=True, **PARAMS)
+    run(strategy, close[:700], high[:700], low[:700])
+    save_snapshot(str(tmp_path / 'snapshot.bin'), {'HK.00700': strategy})
+    strategies, portfolio, _ = load_snapshot(str(tmp_path / 'snapshot.bin'))
+    assert portfolio is None
+    assert any(expected[700:])
+    assert run(strategies['HK.00700'], close[700:], high[700:], low[700:]) == expected[700:]
+
+
+def test_version_1_snapshot_is_upgraded(tmp_path):
+    _, high, low, close = synthetic_ohlc(3000, 2, volatility=0.02)
+    reference = MACDATRStrategy(incremental=True, **PARAMS)
+    expected = run(reference, close, high, low)
+
+    strategy = MACDATRStrategy(incremental=True, **PARAMS)
+    run(strategy, close[:700], high[:700], low[:700])
+    state = strategy.get_state()
+    # Version 1 StdDev state: the window after dropping its oldest value, with running sums of the prices
+    window = state['indicators']['sd']['window'][1:]
+    state['indicators']['sd'] = {'value': state['indicators']['sd']['value'], 'window': window,
+                                 'total': sum(window), 'total_sq': sum(v * v for v in window)}
+    path = tmp_path / 'snapshot_v1.bin'
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + struct.pack('<H', 1))
+        pickle.dump({'strategies': {'HK.00700': state}, 'portfolio': None, 'last_bars': {}}, f)
+
+    strategies, _, _ = load_snapshot(str(path))
+    restored = run(strategies['HK.00700'], close[700:], high[700:], low[700:])
+    assert any(expected[700:])
+    assert [signal and signal['signal'] for signal in restored] == [signal and signal['signal'] for signal in expected[700:]]
+    sd = strategies['HK.00700'].sd_state.value
+    assert abs(sd - reference.sd_state.value) <= 1e-10 * sd
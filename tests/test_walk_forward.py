@@ -0,0 +1,21 @@
+import numpy as np
+from Benchmark import synthetic_frames
+from PricePanel import PricePanel
+from WalkForward import walk_forward, walk_forward_windows
+
+
+def test_windows():
+    assert walk_forward_windows(1000, 400, 200) == [(0, 400, 600), (200, 600, 800), (400, 800, 1000)]
+    assert walk_forward_windows(1000, 400, 200, step=100)[-1] == (500, 900, 1000)
+
+
+def test_overlapping_test_windows_are_chained_once():
+    panel = PricePanel.from_frames(synthetic_frames(4, 1500))
+    param_sets = [{'sd_multiplier': 1.5}, {'sd_multiplier': 2}]
+    _, back_to_back = walk_forward(panel, param_sets, 500, 250, max_workers=1)
+    table, overlapping = walk_forward(panel, param_sets, 500, 250, step=125, max_workers=1)
+
+    assert len(table) == 8
+    # Every out-of-sample bar appears once in the stitched curve
+    assert len(back_to_back) == len(overlapping) == 1500 - 500
+    assert np.all(np.isfinite(overlapping))